@@ -1,17 +1,19 @@
 import os
-import requests
 import math
 import uvicorn
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
-from supabase import create_client
-from auth_strava import atualizar_token 
-from notificador_whatsapp import enviar_whatsapp
+from modules.conexao import obter_supabase
+from modules import metricas
+from modules.logs import obter_logger
+from modules.eventos_strava import chave_evento, eventos_enfileirados, estatisticas, estatisticas_webhooks
 
 load_dotenv()
 
 app = FastAPI()
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+log = obter_logger("api")
+supabase = obter_supabase()
 
 def calcular_trimp_direto(duracao_seg, fc_media):
     """Calcula o TRIMP (Esforço) baseado na duração e FC média"""
@@ -39,62 +41,45 @@ async def validar_webhook(request: Request):
 
 @app.post("/webhook")
 async def receber_evento_strava(request: Request):
+    """
+    Só enfileira o evento em webhook_events (mesmo formato da edge function).
+    Quem busca a atividade, grava e notifica é o worker do processar_webhooks.py.
+    Se não der para gravar, responde 503 para o Strava reenviar o evento.
+    """
     dados = await request.json()
-    
-    if dados.get("object_type") == "activity":
-        id_atividade = dados.get("object_id")
-        print(f"🔱 Nova atividade detectada! ID: {id_atividade}")
+    log.info(f"🔱 Evento recebido: {dados.get('object_type')} {dados.get('aspect_type')} {dados.get('object_id')}")
 
-        token_valido = atualizar_token()
-        
-        if token_valido:
-            url_strava = f"https://www.strava.com/api/v3/activities/{id_atividade}"
-            headers = {'Authorization': f'Bearer {token_valido}'}
-            resp = requests.get(url_strava, headers=headers)
-            
-            if resp.status_code == 200:
-                info = resp.json()
-                nome_treino = info.get("name")
-                duracao_seg = info.get("moving_time")
-                fc_media = info.get("average_heartrate")
+    # Reentrega do Strava que este processo já enfileirou: responde ok sem gravar de novo
+    chave = chave_evento(dados)
+    if eventos_enfileirados.contem(chave):
+        estatisticas.somar(duplicados=1)
+        return {"status": "ok"}
 
-                # AJUSTE PARA TESTE: Se não houver FC, define 130 para não ignorar o treino
-                if not fc_media:
-                    print(f"⚠️ Treino '{nome_treino}' sem batimentos. Usando 130bpm para teste.")
-                    fc_media = 130
+    try:
+        # A chave única (chave_evento) barra reentregas que chegaram por outro processo
+        with metricas.medir_banco("escrita", "webhook_events"):
+            supabase.table("webhook_events").upsert(
+                {"event_data": dados}, on_conflict="chave_evento", ignore_duplicates=True
+            ).execute()
+    except Exception as e:
+        log.error(f"❌ Erro ao enfileirar evento: {e}")
+        return JSONResponse({"status": "erro"}, status_code=503)
 
-                # Agora o processo continua sempre
-                score = calcular_trimp_direto(duracao_seg, fc_media)
-                
-                # Arredondando para inteiros para evitar erro de sintaxe no banco
-                dados_treino = {
-                    "id_atleta": "7b606745-96e8-446f-8576-a18a3b4abf30",
-                    "duracao_min": int(duracao_seg / 60), # Convertido para INT
-                    "fc_media": int(fc_media),           # Convertido para INT
-                    "trimp_score": int(score),           # Convertido para INT
-                    "data_treino": "now()" 
-                }
-                
-                try:
-                    supabase.table("atividades_fisicas").insert(dados_treino).execute()
-                    print(f"✅ Treino '{nome_treino}' salvo no Supabase! TRIMP: {score}")
+    # Só agora: se a gravação falhou, a reentrega do Strava não pode ser barrada
+    eventos_enfileirados.registrar(chave)
+    return {"status": "ok"}
 
-                    msg = (f"🚀 *Treino Sincronizado!*\n\n"
-                           f"🏃‍♂️ Atividade: *{nome_treino}*\n"
-                           f"📊 Esforço: *{score} TRIMP*\n"
-                           f"⏱️ Duração: {round(duracao_seg/60, 1)} min\n\n"
-                           f"🔗 Veja sua evolução no Dashboard!")
-                    
-                    # Envia a notificação
-                    enviar_whatsapp(msg, "+5511969603611") 
-                    print("📲 WhatsApp enviado!")
+@app.get("/webhook/estatisticas")
+async def ver_estatisticas_webhook():
+    """Reentregas barradas e buscas ao Strava economizadas pela coalescência."""
+    return estatisticas_webhooks()
 
-                except Exception as e:
-                    print(f"❌ Erro ao salvar/notificar: {e}")
-            else:
-                print(f"❌ Erro Strava: {resp.status_code}")
-                
-    return {"status": "ok"}
+@app.get("/metrics")
+async def ver_metricas(formato: str = "prometheus"):
+    """Métricas deste processo: texto do Prometheus ou, com ?formato=json, JSON."""
+    if formato == "json":
+        return metricas.exportar_json()
+    return PlainTextResponse(metricas.exportar_prometheus(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
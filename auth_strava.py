@@ -1,81 +1,209 @@
-import requests
-import streamlit as st
-from supabase import create_client
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from modules.conexao import obter_supabase, ler_config
 from datetime import datetime
+from modules.agendador_strava import requisitar_strava, PRIORIDADE_ALTA
+from modules.logs import obter_logger
+from modules.metricas import contar, medir, medir_banco
 
-# Inicializa o cliente Supabase para uso interno nas funções de token
+log = obter_logger("tokens")
+
+# Margem de segurança: token que expira nos próximos 5 minutos já é renovado
+MARGEM_EXPIRACAO_SEG = 300
+
+# Cliente Supabase compartilhado do processo (modules/conexao)
 def get_supabase():
-    return create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+    return obter_supabase()
 
-def atualizar_token(user_id):
+class GerenciadorTokens:
     """
-    Busca o refresh_token no banco, pede um novo access_token ao Strava
-    e atualiza o banco de dados.
+    Cache em memória dos tokens do Strava por usuário (access_token, refresh_token, expires_at).
+
+    - Token válido no cache é devolvido sem tocar no banco.
+    - A renovação é "single-flight": cada usuário tem a sua trava, então se o vigilante
+      e o botão do painel pedirem o mesmo token vencido ao mesmo tempo, só um renova e
+      o outro recebe o token novo (o refresh_token antigo nunca é usado duas vezes).
     """
-    supabase = get_supabase()
-    
-    # 1. Busca os dados atuais de auth para esse usuário
-    res = supabase.table("auth_strava").select("*").eq("user_id", user_id).execute()
-    
-    if not res.data:
-        print(f"❌ Usuário {user_id} não possui vínculo com Strava no banco.")
-        return None
-    
-    dados_atuais = res.data[0]
-    refresh_token_atual = dados_atuais['refresh_token']
 
-    # 2. Faz a requisição de renovação para o Strava
-    url = "https://www.strava.com/oauth/token"
+    def __init__(self):
+        self._cache = {}
+        self._travas = {}
+        self._trava_travas = threading.Lock()
+
+    def _trava_usuario(self, user_id):
+        with self._trava_travas:
+            return self._travas.setdefault(user_id, threading.RLock())
+
+    @staticmethod
+    def _valido(dados, margem_seg=MARGEM_EXPIRACAO_SEG):
+        return bool(dados and dados.get('access_token') and dados.get('expires_at')
+                    and datetime.now().timestamp() < dados['expires_at'] - margem_seg)
+
+    def semear(self, dados_auth):
+        """
+        Guarda os tokens de uma linha já lida (auth_strava/roster), se forem mais novos que
+        os do cache. Retorna True se o cache foi trocado.
+        """
+        if not dados_auth or not dados_auth.get('user_id') or not dados_auth.get('access_token'):
+            return False
+        atual = self._cache.get(dados_auth['user_id'])
+        if atual and (dados_auth.get('expires_at') or 0) <= (atual.get('expires_at') or 0):
+            return False
+        self._cache[dados_auth['user_id']] = {
+            "access_token": dados_auth['access_token'],
+            "refresh_token": dados_auth.get('refresh_token'),
+            "expires_at": dados_auth.get('expires_at') or 0,
+        }
+        return True
+
+    def invalidar(self, user_id):
+        self._cache.pop(user_id, None)
+
+    def _carregar(self, user_id):
+        with medir_banco("leitura", "auth_strava"):
+            res = get_supabase().table("auth_strava").select("user_id, access_token, refresh_token, expires_at").eq("user_id", user_id).execute()
+        if res.data:
+            self.semear(res.data[0])
+        return self._cache.get(user_id)
+
+    def obter(self, user_id, dados_auth=None):
+        # Linha mais nova que o cache (p.ex. reconexão feita por outro processo) vale antes dele
+        trocado = self.semear(dados_auth) if dados_auth else False
+        dados = self._cache.get(user_id)
+        if self._valido(dados):
+            contar("tokens", origem="roster" if trocado else "cache")
+            return dados['access_token']
+
+        with self._trava_usuario(user_id):
+            # Outra thread pode ter renovado enquanto esperávamos a trava
+            dados = self._cache.get(user_id) or self._carregar(user_id)
+            if not dados:
+                return None
+            if self._valido(dados):
+                contar("tokens", origem="banco")
+                return dados['access_token']
+
+            log.debug(f"⏳ Token de {user_id} expirado ou perto de expirar. Renovando...")
+            return self.renovar(user_id)
+
+    def renovar(self, user_id, margem_seg=MARGEM_EXPIRACAO_SEG):
+        """
+        Renova o token do usuário no Strava (sob a trava dele) e atualiza banco e cache.
+        Se, ao pegar a trava, o token já estiver válido por mais de `margem_seg` (outra
+        thread renovou enquanto esperávamos), devolve ele sem ir ao Strava.
+        """
+        with self._trava_usuario(user_id):
+            dados = self._cache.get(user_id) or self._carregar(user_id)
+            if self._valido(dados, margem_seg):
+                return dados['access_token']
+            if not dados or not dados.get('refresh_token'):
+                log.warning(f"❌ Usuário {user_id} não possui vínculo com Strava no banco.")
+                return None
+
+            novos_dados = _renovar_no_strava(user_id, dados['refresh_token'])
+            if not novos_dados:
+                # Outro processo pode ter renovado (e trocado o refresh_token) antes: relê o banco
+                self.invalidar(user_id)
+                recarregado = self._carregar(user_id)
+                if self._valido(recarregado):
+                    return recarregado['access_token']
+                if not recarregado or recarregado.get('refresh_token') == dados['refresh_token']:
+                    return None
+                contar("retentativas", destino="strava_oauth")
+                novos_dados = _renovar_no_strava(user_id, recarregado['refresh_token'])
+                if not novos_dados:
+                    return None
+
+            self._cache[user_id] = dict(novos_dados)
+            return novos_dados['access_token']
+
+    def pre_renovar(self, linhas, margem_seg=1800, max_workers=4):
+        """
+        Renova de antemão (em paralelo) os tokens das linhas que vencem nos próximos
+        `margem_seg` segundos, para o ciclo de sync não parar em renovação.
+        Retorna quantos tokens foram renovados.
+        """
+        vencendo = []
+        for linha in linhas:
+            self.semear(linha)
+            dados = self._cache.get(linha.get('user_id'))
+            if dados and not self._valido(dados, margem_seg):
+                vencendo.append(linha['user_id'])
+
+        if not vencendo:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pre-renovacao") as pool:
+            renovados = sum(1 for token in pool.map(partial(self.renovar, margem_seg=margem_seg), vencendo) if token)
+        log.info(f"🔑 Pré-renovação: {renovados}/{len(vencendo)} token(s) renovados antes do ciclo.")
+        return renovados
+
+# Instância única do processo
+gerenciador_tokens = GerenciadorTokens()
+
+def _renovar_no_strava(user_id, refresh_token_atual):
+    """Troca o refresh_token por um novo access_token no Strava e grava no banco."""
+    url = "/oauth/token"
     payload = {
-        'client_id': st.secrets["STRAVA_CLIENT_ID"],
-        'client_secret': st.secrets["STRAVA_CLIENT_SECRET"],
+        'client_id': ler_config("STRAVA_CLIENT_ID"),
+        'client_secret': ler_config("STRAVA_CLIENT_SECRET"),
         'refresh_token': refresh_token_atual,
         'grant_type': 'refresh_token'
     }
-    
+
     try:
-        response = requests.post(url, data=payload)
+        # Renovar token destrava o resto do sync: entra na frente da fila do agendador
+        with medir("token_renovacao"):
+            response = requisitar_strava("POST", url, prioridade=PRIORIDADE_ALTA, data=payload)
         if response.status_code == 200:
             novo_auth = response.json()
-            
-            # 3. Prepara os novos dados para salvar
+
             # O Strava pode devolver um NOVO refresh_token também, é importante salvar!
             novos_dados = {
                 "access_token": novo_auth['access_token'],
                 "refresh_token": novo_auth.get('refresh_token', refresh_token_atual),
                 "expires_at": novo_auth['expires_at']
             }
-            
-            # 4. Atualiza o Supabase
-            supabase.table("auth_strava").update(novos_dados).eq("user_id", user_id).execute()
-            
-            print(f"✅ Token renovado com sucesso para o usuário {user_id}")
-            return novo_auth['access_token']
+
+            with medir_banco("escrita", "auth_strava"):
+                get_supabase().table("auth_strava").update(novos_dados).eq("user_id", user_id).execute()
+
+            contar("tokens", origem="renovado")
+            log.debug(f"✅ Token renovado com sucesso para o usuário {user_id}")
+            return novos_dados
         else:
-            print(f"❌ Erro ao renovar token no Strava: {response.json()}")
+            contar("tokens", origem="falha")
+            log.warning(f"❌ Erro ao renovar token no Strava: {response.json()}")
             return None
-            
+
     except Exception as e:
-        print(f"❌ Erro de conexão na renovação de token: {e}")
+        contar("tokens", origem="falha")
+        log.error(f"❌ Erro de conexão na renovação de token: {e}")
         return None
 
-def obter_token_valido(user_id):
+def atualizar_token(user_id):
+    """
+    Pede um novo access_token ao Strava com o refresh_token do usuário
+    e atualiza o banco de dados (e o cache).
+    """
+    return gerenciador_tokens.renovar(user_id)
+
+def obter_token_valido(user_id, dados_auth=None):
     """
     Função principal para ser usada nos seus outros módulos.
-    Verifica se o token atual ainda é válido; se não, renova.
+    Devolve o token do cache se ainda for válido; se não, renova (uma vez só, mesmo
+    com várias threads pedindo). `dados_auth` (linha do roster) evita ir ao banco.
     """
-    supabase = get_supabase()
-    res = supabase.table("auth_strava").select("*").eq("user_id", user_id).execute()
-    
-    if not res.data:
-        return None
-        
-    auth_data = res.data[0]
-    # Verifica se expira nos próximos 5 minutos (margem de segurança)
-    agora_timestamp = datetime.now().timestamp()
-    
-    if agora_timestamp > (auth_data['expires_at'] - 300):
-        print(f"⏳ Token de {user_id} expirado ou perto de expirar. Renovando...")
-        return atualizar_token(user_id)
-    else:
-        return auth_data['access_token']
\ No newline at end of file
+    return gerenciador_tokens.obter(user_id, dados_auth)
+
+def descartar_token(user_id):
+    """
+    Tira o token do usuário do cache: depois de uma reconexão OAuth (tokens novos no banco)
+    ou quando o Strava recusa o token (401). O próximo uso relê o banco.
+    """
+    gerenciador_tokens.invalidar(user_id)
+
+def pre_renovar_tokens(linhas, margem_seg=1800):
+    """Renova em lote os tokens que vão vencer antes/durante o próximo ciclo."""
+    return gerenciador_tokens.pre_renovar(linhas, margem_seg)
@@ -0,0 +1,78 @@
+"""Roster e atividades sintéticos para o bench (banco local + Strava local)."""
+import itertools
+import random
+from datetime import datetime, timedelta, timezone
+
+from gerar_historico import gerar_roster, linha_auth, linha_usuario, linhas_atividades
+
+ESPORTES = [("Run", "Corrida", 2.8, 4.2), ("Ride", "Pedal", 6.0, 10.0), ("Swim", "Natação", 0.6, 1.0), ("Workout", "Funcional", 0.0, 0.0)]
+
+_ids_atividade = itertools.count(10_000_000_000)
+
+def atividade_strava(aleatorio, inicio):
+    """Atividade no formato da API do Strava começando em `inicio` (UTC)."""
+    tipo, nome, vel_min, vel_max = aleatorio.choice(ESPORTES)
+    duracao_seg = aleatorio.randint(20, 120) * 60
+    return {
+        "id": next(_ids_atividade),
+        "name": f"{nome} {inicio.strftime('%d/%m')}",
+        "type": tipo,
+        "sport_type": tipo,
+        "distance": round(aleatorio.uniform(vel_min, vel_max) * duracao_seg, 1),
+        "moving_time": duracao_seg,
+        "elapsed_time": duracao_seg + aleatorio.randint(0, 600),
+        "average_heartrate": round(aleatorio.uniform(120, 170), 1) if aleatorio.random() < 0.9 else None,
+        "start_date": inicio.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "start_date_local": (inicio - timedelta(hours=3)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+
+def montar_cenario(banco, estado_strava, atletas, dias_historico=30, novas_por_atleta=2,
+                   fracao_token_vencido=0.1, semente=42):
+    """
+    Cria `atletas` atletas no banco local e no Strava local. O histórico de
+    `dias_historico` dias vem do gerar_historico (mesmos perfis e periodização do teste
+    de carga) e já está sincronizado nos dois lados; `novas_por_atleta` atividades só o
+    Strava conhece. Retorna a lista de (user_id, athlete_id).
+    """
+    aleatorio = random.Random(semente)
+    agora = datetime.now(timezone.utc).replace(microsecond=0)
+    inicio = agora - timedelta(days=dias_historico)
+    usuarios, auths, atividades_db, criados = [], [], [], []
+
+    for perfil, historico in gerar_roster(atletas, inicio, agora - timedelta(hours=6), semente):
+        novas = [atividade_strava(aleatorio, agora - timedelta(hours=5 - n % 5, minutes=n)) for n in range(novas_por_atleta)]
+        estado_strava.adicionar_atividades(perfil["athlete_id"], historico + novas)
+
+        # Sem resumo: no bench as notificações ficam prontas na hora
+        usuarios.append(dict(linha_usuario(perfil), janela_resumo_min=0))
+        vencido = aleatorio.random() < fracao_token_vencido
+        auths.append(dict(
+            linha_auth(perfil, historico, agora),
+            expires_at=int((agora + timedelta(hours=-1 if vencido else 6)).timestamp()),
+            proximo_poll_em=None,
+        ))
+        atividades_db.extend(linhas_atividades(perfil, historico))
+        criados.append((perfil["user_id"], perfil["athlete_id"]))
+
+    banco.carregar("usuarios_app", usuarios)
+    banco.carregar("auth_strava", auths)
+    banco.carregar("atividades_fisicas", atividades_db)
+    return criados
+
+def eventos_webhook(aleatorio, estado_strava, atletas, quantidade, fracao_updates=0.3):
+    """
+    Cria `quantidade` atividades novas no Strava local e devolve os eventos de webhook
+    delas (create, às vezes seguido de updates da mesma atividade, como o Strava manda).
+    """
+    agora = datetime.now(timezone.utc)
+    eventos = []
+    for _ in range(quantidade):
+        user_id, athlete_id = aleatorio.choice(atletas)
+        act = atividade_strava(aleatorio, agora - timedelta(minutes=aleatorio.randint(5, 90)))
+        estado_strava.adicionar_atividades(athlete_id, [act])
+        base = {"object_type": "activity", "object_id": act["id"], "owner_id": athlete_id, "subscription_id": 1}
+        eventos.append({**base, "aspect_type": "create", "event_time": int(agora.timestamp()), "updates": {}})
+        if aleatorio.random() < fracao_updates:
+            eventos.append({**base, "aspect_type": "update", "event_time": int(agora.timestamp()) + 1,
+                            "updates": {"title": act["name"]}})
+    return eventos
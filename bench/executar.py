@@ -0,0 +1,265 @@
+"""
+Bench offline do ciclo de sincronização, do worker de webhooks, da entrega de
+WhatsApp e das consultas do painel, contra o Strava local, o banco local e o
+transporte local do gateway de WhatsApp.
+
+    python -m bench.executar --atletas 1000 --latencia-strava-ms 80 --latencia-banco-ms 5
+
+Relata vazão, latência p50/p95 e idas e voltas (banco e Strava) de cada cenário.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import time
+from collections import Counter
+
+from bench.strava_local import EstadoStravaLocal, ServidorStravaLocal
+
+CENARIOS = ("sync", "notificacoes", "webhooks", "painel")
+
+def percentil(valores, p):
+    """Percentil por posição mais próxima (p entre 0 e 100)."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicao = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[posicao]
+
+def resumo_latencias(latencias):
+    return {
+        "p50_ms": round(percentil(latencias, 50) * 1000, 1),
+        "p95_ms": round(percentil(latencias, 95) * 1000, 1),
+        "max_ms": round(max(latencias, default=0) * 1000, 1),
+    }
+
+def _tempos_por_etapa():
+    """Média e máximo (ms) de cada etapa instrumentada (modules/metricas) no trecho medido."""
+    from modules import metricas
+    tempos = {}
+    for item in metricas.exportar_json()["tempos"]:
+        rotulos = item["rotulos"]
+        nome = rotulos.get("etapa", item["nome"])
+        if rotulos.get("tabela"):
+            nome = f"{nome}:{rotulos.get('operacao')}:{rotulos['tabela']}"
+        atual = tempos.setdefault(nome, {"n": 0, "soma_ms": 0.0, "max_ms": 0.0})
+        atual["n"] += item["contagem"]
+        atual["soma_ms"] += item["soma_s"] * 1000
+        atual["max_ms"] = max(atual["max_ms"], item["max_ms"])
+    return {nome: {"n": t["n"], "media_ms": round(t["soma_ms"] / max(t["n"], 1), 1), "max_ms": t["max_ms"]}
+            for nome, t in sorted(tempos.items())}
+
+class Medicao:
+    """Captura vazão e idas e voltas de um trecho do bench."""
+
+    def __init__(self, nome, banco, estado_strava):
+        self.nome = nome
+        self.banco = banco
+        self.estado_strava = estado_strava
+        self.resultado = {"cenario": nome}
+
+    def __enter__(self):
+        from modules import metricas
+        metricas.registro.zerar()
+        self.banco.zerar_contadores()
+        self._strava_antes = Counter(self.estado_strava.chamadas)
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duracao = time.perf_counter() - self._inicio
+        strava = Counter(self.estado_strava.chamadas)
+        strava.subtract(self._strava_antes)
+        self.resultado.update({
+            "duracao_s": round(duracao, 3),
+            "idas_e_voltas_banco": sum(self.banco.idas_e_voltas.values()),
+            "banco_por_operacao": {f"{t}.{op}": n for (t, op), n in self.banco.idas_e_voltas.most_common()},
+            "chamadas_strava": {rota: n for rota, n in strava.items() if n},
+            "etapas_ms": _tempos_por_etapa(),
+        })
+        return False
+
+    def vazao(self, unidades, rotulo):
+        self.resultado[f"{rotulo}_por_s"] = round(unidades / max(self.resultado["duracao_s"], 1e-9), 1)
+        self.resultado[rotulo] = unidades
+
+def bench_sync(processar_fila, banco, estado_strava, workers):
+    latencias = []
+    original = processar_fila.processar_atleta
+
+    def cronometrado(u, origem_botao):
+        inicio = time.perf_counter()
+        try:
+            return original(u, origem_botao)
+        finally:
+            latencias.append(time.perf_counter() - inicio)
+
+    processar_fila.processar_atleta = cronometrado
+    antes = banco.contar("atividades_fisicas")
+    try:
+        with Medicao("sync", banco, estado_strava) as m:
+            processar_fila.processar_novos_treinos(max_workers=workers, pre_renovar=True)
+    finally:
+        processar_fila.processar_atleta = original
+
+    m.vazao(len(latencias), "atletas")
+    m.resultado["atividades_gravadas"] = banco.contar("atividades_fisicas") - antes
+    m.resultado["latencia_por_atleta"] = resumo_latencias(latencias)
+    return m.resultado
+
+def bench_notificacoes(processar_notificacoes, transporte, banco, estado_strava, workers):
+    latencias = []
+    enviadas_antes = len(transporte.enviadas)
+    with Medicao("notificacoes", banco, estado_strava) as m:
+        while True:
+            inicio = time.perf_counter()
+            if not processar_notificacoes.processar_lote_notificacoes(max_workers=workers):
+                break
+            latencias.append(time.perf_counter() - inicio)
+    m.vazao(len(transporte.enviadas) - enviadas_antes, "mensagens")
+    m.resultado["latencia_por_lote"] = resumo_latencias(latencias)
+    return m.resultado
+
+def bench_webhooks(processar_webhooks, banco, estado_strava, atletas, quantidade, semente):
+    from bench.cenario import eventos_webhook
+    eventos = eventos_webhook(random.Random(semente), estado_strava, atletas, quantidade)
+    banco.carregar("webhook_events", [{"event_data": e} for e in eventos])
+
+    latencias = []
+    with Medicao("webhooks", banco, estado_strava) as m:
+        inicio = time.perf_counter()
+        while True:
+            processados = processar_webhooks.processar_lote_webhooks()
+            if not processados:
+                break
+            # Todos os eventos chegaram juntos no início: latência = tempo até o lote deles terminar
+            latencias.extend([time.perf_counter() - inicio] * processados)
+    m.vazao(len(latencias), "eventos")
+    m.resultado["latencia_por_evento"] = resumo_latencias(latencias)
+    return m.resultado
+
+def bench_painel(painel, banco, estado_strava, atletas, amostra, semente):
+    """
+    Três passadas pelos mesmos atletas abrindo o painel como a tela do aluno (retrato,
+    primeira página do histórico e série dos gráficos): cache vazio, rerun (tudo no
+    cache) e depois de um sync (invalidado: relê a linha do retrato).
+    """
+    escolhidos = random.Random(semente).sample(atletas, min(amostra, len(atletas)))
+    painel.cache_painel.limpar()
+
+    def abrir_painel(user_id):
+        painel.snapshot_painel(banco, user_id)
+        painel.pagina_treinos(banco, user_id)
+        painel.quadro_treinos_atleta(banco, user_id)
+
+    passadas = (("frio", None), ("rerun", None), ("apos_sync", painel.invalidar_atleta))
+    with Medicao("painel", banco, estado_strava) as m:
+        for rotulo, preparar in passadas:
+            latencias = []
+            idas_antes = sum(banco.idas_e_voltas.values())
+            for user_id, _ in escolhidos:
+                if preparar:
+                    preparar(user_id)
+                inicio = time.perf_counter()
+                abrir_painel(user_id)
+                latencias.append(time.perf_counter() - inicio)
+            m.resultado[f"latencia_{rotulo}"] = dict(resumo_latencias(latencias), idas_e_voltas_banco=sum(banco.idas_e_voltas.values()) - idas_antes)
+    m.vazao(len(escolhidos) * len(passadas), "consultas")
+    return m.resultado
+
+def imprimir(resultado):
+    print(f"\n=== {resultado['cenario']} ===")
+    for chave, valor in resultado.items():
+        if chave != "cenario":
+            print(f"  {chave}: {valor}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bench offline do Zaptreino (Strava, banco e WhatsApp locais).")
+    parser.add_argument("--atletas", type=int, default=100, help="tamanho do roster sintético (10 a 10000)")
+    parser.add_argument("--dias-historico", type=int, default=30)
+    parser.add_argument("--novas-por-atleta", type=int, default=2)
+    parser.add_argument("--eventos-webhook", type=int, default=500)
+    parser.add_argument("--amostra-painel", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latencia-strava-ms", type=float, default=50)
+    parser.add_argument("--variacao-strava-ms", type=float, default=20)
+    parser.add_argument("--prob-429", type=float, default=0.0)
+    parser.add_argument("--limite-15min", type=int, default=10**6, help="cota curta anunciada pelo Strava local")
+    parser.add_argument("--limite-diario", type=int, default=10**8, help="cota diária anunciada pelo Strava local")
+    parser.add_argument("--latencia-banco-ms", type=float, default=5)
+    parser.add_argument("--latencia-twilio-ms", type=float, default=150)
+    parser.add_argument("--cenarios", default=",".join(CENARIOS), help=f"lista separada por vírgula: {', '.join(CENARIOS)}")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    parser.add_argument("--verboso", action="store_true", help="mostra os logs dos workers")
+    args = parser.parse_args(argv)
+
+    # O BancoLocal já importa o logging do app: o nível precisa estar definido antes
+    os.environ.setdefault("LOG_NIVEL", "DEBUG" if args.verboso else "WARNING")
+    from bench.supabase_local import BancoLocal
+
+    estado_strava = EstadoStravaLocal(
+        latencia_ms=args.latencia_strava_ms, variacao_ms=args.variacao_strava_ms,
+        prob_429=args.prob_429, limite_15min=args.limite_15min, limite_diario=args.limite_diario,
+        semente=args.semente,
+    )
+    servidor = ServidorStravaLocal(estado_strava).iniciar()
+    banco = BancoLocal(latencia_seg=args.latencia_banco_ms / 1000)
+
+    # Os módulos do app leem isto na importação: precisa vir antes dos imports abaixo
+    os.environ.update({
+        "STRAVA_API_BASE": servidor.url_base,
+        "STRAVA_LIMITE_15MIN": str(estado_strava.limite_15min),
+        "STRAVA_LIMITE_DIARIO": str(estado_strava.limite_diario),
+        "STRAVA_CLIENT_ID": "bench",
+        "STRAVA_CLIENT_SECRET": "bench",
+        "WHATSAPP_TRANSPORTE": "local",
+        "WHATSAPP_INTERVALO_DESTINO_SEG": "0",
+        "MEU_CELULAR": "5511999999999",
+    })
+    from modules.conexao import definir_supabase
+    definir_supabase(banco)
+
+    from bench.cenario import montar_cenario
+    from modules import painel, whatsapp
+    import processar_fila
+    import processar_notificacoes
+    import processar_webhooks
+
+    transporte = whatsapp.definir_transporte(whatsapp.TransporteLocal(latencia_seg=args.latencia_twilio_ms / 1000))
+
+    inicio = time.perf_counter()
+    atletas = montar_cenario(banco, estado_strava, args.atletas, args.dias_historico, args.novas_por_atleta, semente=args.semente)
+    print(f"🧪 Cenário: {len(atletas)} atletas, {banco.contar('atividades_fisicas')} atividades no banco "
+          f"({time.perf_counter() - inicio:.1f}s). Strava local em {servidor.url_base}")
+
+    escolhidos = [c.strip() for c in args.cenarios.split(",") if c.strip()]
+    resultados = []
+    silencio = contextlib.nullcontext if args.verboso else (lambda: contextlib.redirect_stdout(io.StringIO()))
+    try:
+        for cenario in escolhidos:
+            with silencio():
+                if cenario == "sync":
+                    resultado = bench_sync(processar_fila, banco, estado_strava, args.workers)
+                elif cenario == "notificacoes":
+                    resultado = bench_notificacoes(processar_notificacoes, transporte, banco, estado_strava, args.workers)
+                elif cenario == "webhooks":
+                    resultado = bench_webhooks(processar_webhooks, banco, estado_strava, atletas, args.eventos_webhook, args.semente)
+                elif cenario == "painel":
+                    resultado = bench_painel(painel, banco, estado_strava, atletas, args.amostra_painel, args.semente)
+                else:
+                    raise SystemExit(f"cenário desconhecido: {cenario}")
+            imprimir(resultado)
+            resultados.append(resultado)
+    finally:
+        servidor.parar()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump(resultados, arquivo, ensure_ascii=False, indent=2)
+    return resultados
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Servidor HTTP local que imita as rotas do Strava usadas pelo projeto:
+/api/v3/athlete/activities, /api/v3/activities/{id} e /oauth/token.
+Latência, tamanho de página e 429 são configuráveis. Os tokens são
+'local-<athlete_id>-<n>' (acesso) e 'ref-<athlete_id>' (refresh).
+
+Sozinho, serve as fixtures do gerar_historico.py para o app rodar contra ele
+(STRAVA_API_BASE=http://127.0.0.1:8765):
+
+    python -m bench.strava_local --fixtures dados_carga/strava.jsonl --porta 8765
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+def _epoch(valor):
+    return datetime.fromisoformat(valor.replace("Z", "+00:00")).timestamp()
+
+class EstadoStravaLocal:
+    def __init__(self, latencia_ms=0, variacao_ms=0, prob_429=0.0, retry_after_seg=1,
+                 limite_15min=100000, limite_diario=1000000, validade_token_seg=21600, semente=42):
+        self.latencia_ms = latencia_ms
+        self.variacao_ms = variacao_ms
+        self.prob_429 = prob_429
+        self.retry_after_seg = retry_after_seg
+        self.limite_15min = limite_15min
+        self.limite_diario = limite_diario
+        self.validade_token_seg = validade_token_seg
+        self.atividades = {}
+        self.por_id = {}
+        self.chamadas = Counter()
+        self.uso = 0
+        self.revogados = set()
+        self._aleatorio = random.Random(semente)
+        self._sequencia_token = 0
+        self._trava = threading.Lock()
+
+    def adicionar_atividades(self, athlete_id, atividades):
+        """Registra atividades do atleta (mantém em ordem de start_date)."""
+        with self._trava:
+            lista = self.atividades.setdefault(int(athlete_id), [])
+            for act in atividades:
+                act = dict(act, athlete={"id": int(athlete_id)})
+                act["_epoch"] = _epoch(act["start_date"])
+                lista.append(act)
+                self.por_id[int(act["id"])] = act
+            lista.sort(key=lambda a: a["_epoch"])
+
+    def carregar_fixtures(self, caminho):
+        """Carrega atividades em JSON Lines no formato do Strava (com athlete.id). Retorna quantas."""
+        por_atleta = {}
+        with open(caminho, encoding="utf-8") as arquivo:
+            for linha in arquivo:
+                if linha.strip():
+                    act = json.loads(linha)
+                    por_atleta.setdefault(act["athlete"]["id"], []).append(act)
+        for athlete_id, atividades in por_atleta.items():
+            self.adicionar_atividades(athlete_id, atividades)
+        return sum(len(atividades) for atividades in por_atleta.values())
+
+    def novo_token(self, athlete_id):
+        with self._trava:
+            self._sequencia_token += 1
+            return f"local-{athlete_id}-{self._sequencia_token}"
+
+    def revogar(self, token):
+        """A partir de agora o Strava responde 401 para este access_token (p.ex. após reconectar)."""
+        with self._trava:
+            self.revogados.add(token)
+
+    def sortear_429(self):
+        with self._trava:
+            self.uso += 1
+            return self.prob_429 and self._aleatorio.random() < self.prob_429
+
+    def atraso(self):
+        if not self.latencia_ms and not self.variacao_ms:
+            return 0.0
+        with self._trava:
+            return max(0.0, self.latencia_ms + self._aleatorio.uniform(-self.variacao_ms, self.variacao_ms)) / 1000
+
+class _Tratador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def estado(self):
+        return self.server.estado
+
+    def _responder(self, status, corpo, cabecalhos=None):
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.send_header("X-RateLimit-Limit", f"{self.estado.limite_15min},{self.estado.limite_diario}")
+        self.send_header("X-RateLimit-Usage", f"{self.estado.uso % self.estado.limite_15min},{self.estado.uso}")
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _atleta_do_token(self):
+        token = self.headers.get("Authorization", "").replace("Bearer ", "")
+        if token in self.estado.revogados:
+            return None
+        partes = token.split("-")
+        if len(partes) == 3 and partes[0] == "local" and partes[1].isdigit():
+            return int(partes[1])
+        return None
+
+    def _antes(self, rota):
+        self.estado.chamadas[rota] += 1
+        time.sleep(self.estado.atraso())
+        if self.estado.sortear_429():
+            self.estado.chamadas["429"] += 1
+            self._responder(429, {"message": "Rate Limit Exceeded"}, {"Retry-After": str(self.estado.retry_after_seg)})
+            return False
+        return True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if url.path == "/api/v3/athlete/activities":
+            if not self._antes("athlete/activities"):
+                return
+            athlete_id = self._atleta_do_token()
+            if athlete_id is None:
+                return self._responder(401, {"message": "Authorization Error"})
+            after = float(params.get("after", 0))
+            before = float(params.get("before", 1e12))
+            pagina = max(int(params.get("page", 1)), 1)
+            por_pagina = min(max(int(params.get("per_page", 30)), 1), 200)
+            lista = [a for a in self.estado.atividades.get(athlete_id, []) if after < a["_epoch"] < before]
+            trecho = lista[(pagina - 1) * por_pagina: pagina * por_pagina]
+            return self._responder(200, [{k: v for k, v in a.items() if k != "_epoch"} for a in trecho])
+
+        if url.path.startswith("/api/v3/activities/"):
+            if not self._antes("activities/{id}"):
+                return
+            athlete_id = self._atleta_do_token()
+            id_texto = url.path.rsplit("/", 1)[-1]
+            act = self.estado.por_id.get(int(id_texto)) if id_texto.isdigit() else None
+            if athlete_id is None:
+                return self._responder(401, {"message": "Authorization Error"})
+            if not act or act["athlete"]["id"] != athlete_id:
+                return self._responder(404, {"message": "Record Not Found"})
+            return self._responder(200, {k: v for k, v in act.items() if k != "_epoch"})
+
+        self._responder(404, {"message": "Record Not Found"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        corpo = {k: v[0] for k, v in parse_qs(self.rfile.read(tamanho).decode()).items()}
+
+        if url.path != "/oauth/token":
+            return self._responder(404, {"message": "Record Not Found"})
+        if not self._antes("oauth/token"):
+            return
+
+        credencial = corpo.get("refresh_token") or corpo.get("code") or ""
+        partes = credencial.split("-")
+        if len(partes) != 2 or not partes[1].isdigit():
+            return self._responder(400, {"message": "Bad Request", "errors": [{"field": "refresh_token", "code": "invalid"}]})
+        athlete_id = int(partes[1])
+        self._responder(200, {
+            "token_type": "Bearer",
+            "access_token": self.estado.novo_token(athlete_id),
+            "refresh_token": f"ref-{athlete_id}",
+            "expires_at": int(time.time()) + self.estado.validade_token_seg,
+            "athlete": {"id": athlete_id},
+        })
+
+class ServidorStravaLocal:
+    """Sobe o servidor numa porta livre em segundo plano. `url_base` vai no STRAVA_API_BASE."""
+
+    def __init__(self, estado=None, porta=0):
+        self.estado = estado or EstadoStravaLocal()
+        self._servidor = ThreadingHTTPServer(("127.0.0.1", porta), _Tratador)
+        self._servidor.daemon_threads = True
+        self._servidor.estado = self.estado
+        self._thread = None
+
+    @property
+    def url_base(self):
+        host, porta = self._servidor.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def servir(self):
+        """Atende em primeiro plano até parar()."""
+        self._servidor.serve_forever()
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._servidor.serve_forever, daemon=True, name="strava-local")
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Strava local para desenvolvimento e teste de carga.")
+    parser.add_argument("--fixtures", help="atividades em JSON Lines (gerar_historico.py --fixtures-strava)")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia-ms", type=float, default=0)
+    parser.add_argument("--prob-429", type=float, default=0.0)
+    args = parser.parse_args()
+
+    estado = EstadoStravaLocal(latencia_ms=args.latencia_ms, prob_429=args.prob_429)
+    if args.fixtures:
+        print(f"🗂️ {estado.carregar_fixtures(args.fixtures)} atividades carregadas de {args.fixtures}")
+    servidor = ServidorStravaLocal(estado, porta=args.porta)
+    print(f"🚴 Strava local em {servidor.url_base} (Ctrl+C para sair)")
+    try:
+        servidor.servir()
+    except KeyboardInterrupt:
+        servidor.parar()
@@ -0,0 +1,478 @@
+"""
+Banco em memória com a mesma interface de consulta do cliente supabase-py
+(table().select().eq()...execute() e rpc()), para rodar sync, webhooks e painel
+sem Supabase. Cada execute() conta como uma ida e volta ao PostgREST e pode
+esperar `latencia_seg` para simular a rede.
+"""
+import itertools
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+from modules.eventos_strava import chave_evento
+
+# Chave primária de cada tabela (upsert sem on_conflict usa ela)
+CHAVES_PRIMARIAS = {
+    "auth_strava": "user_id",
+    "usuarios_app": "id",
+    "lease_servicos": "nome",
+    "painel_atleta": "id_atleta",
+}
+
+# Colunas com índice de igualdade (eq / in_ não varrem a tabela inteira)
+INDICES = {
+    "atividades_fisicas": ("strava_id", "id_atleta"),
+    "auth_strava": ("user_id", "athlete_id"),
+    "usuarios_app": ("id",),
+    "webhook_events": ("id", "chave_evento"),
+    "notificacoes_whatsapp": ("id", "chave_idempotencia", "user_id"),
+    "lease_servicos": ("nome",),
+    "painel_atleta": ("id_atleta",),
+}
+
+# Valores padrão das colunas que o banco preenche sozinho
+PADROES = {
+    "webhook_events": lambda: {"processado": False, "tentativas": 0},
+    "notificacoes_whatsapp": lambda: {
+        "status": "pendente", "tentativas": 0, "janela_resumo_min": 0,
+        "proxima_tentativa_em": _agora().isoformat(), "criado_em": _agora().isoformat(),
+    },
+}
+
+_PADRAO_DATA = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+def _agora():
+    return datetime.now(timezone.utc)
+
+def _comparavel(valor):
+    """Datas/instantes ISO viram datetime com fuso, para comparar como o Postgres."""
+    if isinstance(valor, datetime):
+        return valor if valor.tzinfo else valor.replace(tzinfo=timezone.utc)
+    if isinstance(valor, date):
+        return datetime(valor.year, valor.month, valor.day, tzinfo=timezone.utc)
+    if isinstance(valor, str) and _PADRAO_DATA.match(valor):
+        try:
+            instante = datetime.fromisoformat(valor.replace("Z", "+00:00"))
+            return instante if instante.tzinfo else instante.replace(tzinfo=timezone.utc)
+        except ValueError:
+            return valor
+    return valor
+
+def _comparar(a, b):
+    a, b = _comparavel(a), _comparavel(b)
+    try:
+        return (a > b) - (a < b)
+    except TypeError:
+        return (str(a) > str(b)) - (str(a) < str(b))
+
+def _texto_filtro(valor):
+    """Valor vindo de um filtro em texto (or_): null/true/false viram None/bool."""
+    return {"null": None, "true": True, "false": False}.get(valor, valor)
+
+def _casar_ilike(valor, padrao):
+    regex = "^" + re.escape(str(padrao)).replace("%", ".*").replace("_", ".") + "$"
+    return valor is not None and re.match(regex, str(valor), re.IGNORECASE | re.DOTALL) is not None
+
+OPERADORES = {
+    "eq": lambda v, x: v is not None and _comparar(v, x) == 0,
+    "neq": lambda v, x: v is not None and _comparar(v, x) != 0,
+    "gt": lambda v, x: v is not None and _comparar(v, x) > 0,
+    "gte": lambda v, x: v is not None and _comparar(v, x) >= 0,
+    "lt": lambda v, x: v is not None and _comparar(v, x) < 0,
+    "lte": lambda v, x: v is not None and _comparar(v, x) <= 0,
+    "in": lambda v, x: v is not None and any(_comparar(v, item) == 0 for item in x),
+    "is": lambda v, x: v is x if x is None or isinstance(x, bool) else v == x,
+    "ilike": _casar_ilike,
+}
+
+def _separar_termos(expressao):
+    """Divide 'a,b,and(c,d)' nas vírgulas de fora dos parênteses."""
+    termos, nivel, atual = [], 0, ""
+    for caractere in expressao:
+        if caractere == "," and nivel == 0:
+            termos.append(atual)
+            atual = ""
+            continue
+        nivel += caractere == "("
+        nivel -= caractere == ")"
+        atual += caractere
+    return termos + [atual] if atual else termos
+
+def _termo_or(termo):
+    """'col.op.valor' ou 'and(col.op.valor,...)' como usados no projeto (keyset do histórico)."""
+    if termo.startswith("and(") and termo.endswith(")"):
+        return ("and", None, [_termo_or(t) for t in _separar_termos(termo[4:-1])])
+    coluna, operador, valor = termo.split(".", 2)
+    return (operador, coluna, _texto_filtro(valor))
+
+def _casa(linha, operador, coluna, valor):
+    if operador == "and":
+        return all(_casa(linha, *termo) for termo in valor)
+    return OPERADORES[operador](linha.get(coluna), valor)
+
+class RespostaLocal:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+class ConsultaLocal:
+    """Construtor de consulta no estilo do postgrest-py."""
+
+    def __init__(self, banco, tabela):
+        self.banco = banco
+        self.tabela = tabela
+        self.operacao = "select"
+        self.colunas = "*"
+        self.contar = None
+        self.filtros = []
+        self.ordem = []
+        self.limite = None
+        self.inicio = 0
+        self.payload = None
+        self.on_conflict = None
+        self.ignorar_duplicados = False
+
+    # --------------------------------------------------------- operações
+    def select(self, colunas="*", count=None, **_):
+        self.operacao, self.colunas, self.contar = "select", colunas, count
+        return self
+
+    def insert(self, dados, **_):
+        self.operacao, self.payload = "insert", dados
+        return self
+
+    def upsert(self, dados, on_conflict=None, ignore_duplicates=False, **_):
+        self.operacao, self.payload = "upsert", dados
+        self.on_conflict, self.ignorar_duplicados = on_conflict, ignore_duplicates
+        return self
+
+    def update(self, dados, **_):
+        self.operacao, self.payload = "update", dados
+        return self
+
+    def delete(self, **_):
+        self.operacao = "delete"
+        return self
+
+    # ----------------------------------------------------------- filtros
+    def _filtro(self, operador, coluna, valor):
+        self.filtros.append([(operador, coluna, valor)])
+        return self
+
+    def eq(self, coluna, valor): return self._filtro("eq", coluna, valor)
+    def neq(self, coluna, valor): return self._filtro("neq", coluna, valor)
+    def gt(self, coluna, valor): return self._filtro("gt", coluna, valor)
+    def gte(self, coluna, valor): return self._filtro("gte", coluna, valor)
+    def lt(self, coluna, valor): return self._filtro("lt", coluna, valor)
+    def lte(self, coluna, valor): return self._filtro("lte", coluna, valor)
+    def in_(self, coluna, valores): return self._filtro("in", coluna, list(valores))
+    def is_(self, coluna, valor): return self._filtro("is", coluna, _texto_filtro(valor))
+    def ilike(self, coluna, padrao): return self._filtro("ilike", coluna, padrao)
+
+    def or_(self, expressao, **_):
+        """'col.op.valor,and(col.op.valor,...)' (comparações simples e and, como as usadas no projeto)."""
+        self.filtros.append([_termo_or(termo) for termo in _separar_termos(expressao)])
+        return self
+
+    # -------------------------------------------------------- modificadores
+    def order(self, coluna, desc=False, nullsfirst=None, **_):
+        # Padrão do Postgres: nulos no fim em asc e no começo em desc
+        self.ordem.append((coluna, desc, desc if nullsfirst is None else nullsfirst))
+        return self
+
+    def limit(self, quantidade, **_):
+        self.limite = quantidade
+        return self
+
+    def range(self, inicio, fim, **_):
+        self.inicio, self.limite = inicio, fim - inicio + 1
+        return self
+
+    def execute(self):
+        return self.banco.executar(self)
+
+class RpcLocal:
+    def __init__(self, banco, nome, parametros):
+        self.banco, self.nome, self.parametros = banco, nome, parametros or {}
+
+    def execute(self):
+        return self.banco.executar_rpc(self.nome, self.parametros)
+
+class BancoLocal:
+    """
+    Substituto do cliente Supabase: tabelas em memória, a view roster_sincronizacao
+    e as funções RPC usadas pelos workers. `idas_e_voltas` conta cada chamada por
+    (tabela ou rpc, operação).
+    """
+
+    def __init__(self, latencia_seg=0.0):
+        self.latencia_seg = latencia_seg
+        self.idas_e_voltas = Counter()
+        self._linhas = defaultdict(dict)
+        self._indices = defaultdict(lambda: defaultdict(lambda: defaultdict(set)))
+        self._ids = defaultdict(lambda: itertools.count(1))
+        self._trava = threading.RLock()
+
+    # ------------------------------------------------------------ cliente
+    def table(self, nome):
+        return ConsultaLocal(self, nome)
+
+    def rpc(self, nome, parametros=None):
+        return RpcLocal(self, nome, parametros)
+
+    def zerar_contadores(self):
+        self.idas_e_voltas.clear()
+
+    def _rede(self, chave):
+        self.idas_e_voltas[chave] += 1
+        if self.latencia_seg:
+            time.sleep(self.latencia_seg)
+
+    # -------------------------------------------------------- armazenamento
+    def _indexar(self, tabela, rid, linha, remover=False):
+        for coluna in INDICES.get(tabela, ()):
+            valor = linha.get(coluna)
+            if valor is None:
+                continue
+            chave = str(valor)
+            if remover:
+                self._indices[tabela][coluna][chave].discard(rid)
+            else:
+                self._indices[tabela][coluna][chave].add(rid)
+
+    def _gravar_nova(self, tabela, linha):
+        linha = {**(PADROES[tabela]() if tabela in PADROES else {}), **linha}
+        if tabela not in CHAVES_PRIMARIAS and linha.get("id") is None:
+            linha["id"] = next(self._ids[tabela])
+        if tabela == "webhook_events":
+            linha["chave_evento"] = chave_evento(linha.get("event_data") or {})
+        rid = linha[CHAVES_PRIMARIAS.get(tabela, "id")]
+        self._linhas[tabela][rid] = linha
+        self._indexar(tabela, rid, linha)
+        return linha
+
+    def _atualizar(self, tabela, rid, valores):
+        linha = self._linhas[tabela][rid]
+        self._indexar(tabela, rid, linha, remover=True)
+        linha.update(valores)
+        self._indexar(tabela, rid, linha)
+        return linha
+
+    def _apagar(self, tabela, rid):
+        linha = self._linhas[tabela].pop(rid)
+        self._indexar(tabela, rid, linha, remover=True)
+        return linha
+
+    def carregar(self, tabela, linhas):
+        """Carga direta (sem contar idas e voltas), usada para montar o cenário."""
+        with self._trava:
+            for linha in linhas:
+                self._gravar_nova(tabela, dict(linha))
+
+    def contar(self, tabela):
+        return len(self._linhas[tabela])
+
+    # ------------------------------------------------------------- leitura
+    def _candidatos(self, tabela, filtros):
+        """Usa um índice de igualdade quando dá; senão varre a tabela."""
+        for alternativas in filtros:
+            if len(alternativas) != 1:
+                continue
+            operador, coluna, valor = alternativas[0]
+            if coluna in INDICES.get(tabela, ()) and operador in ("eq", "in"):
+                valores = valor if operador == "in" else [valor]
+                rids = set()
+                for v in valores:
+                    rids |= self._indices[tabela][coluna].get(str(v), set())
+                return [(rid, self._linhas[tabela][rid]) for rid in rids]
+        return list(self._linhas[tabela].items())
+
+    def _view_roster(self):
+        hoje = date.today()
+        usuarios = self._linhas["usuarios_app"]
+        linhas = []
+        for auth in self._linhas["auth_strava"].values():
+            u = usuarios.get(auth["user_id"])
+            if not u or u.get("bloqueado") or u.get("is_admin"):
+                continue
+            if u.get("data_vencimento") and _comparar(u["data_vencimento"], hoje) < 0:
+                continue
+            linhas.append({
+                **{k: auth.get(k) for k in ("user_id", "athlete_id", "access_token", "refresh_token", "expires_at",
+                                            "ultima_atividade_em", "histograma_horas", "ultimo_webhook_em", "proximo_poll_em")},
+                **{k: u.get(k) for k in ("nome", "telefone", "fc_maxima")},
+                "janela_resumo_min": u.get("janela_resumo_min") or 0,
+            })
+        return list(enumerate(linhas))
+
+    @staticmethod
+    def _passa(linha, filtros):
+        return all(
+            any(_casa(linha, operador, coluna, valor) for operador, coluna, valor in alternativas)
+            for alternativas in filtros
+        )
+
+    @staticmethod
+    def _projetar(linha, colunas):
+        if colunas.strip() == "*":
+            return dict(linha)
+        return {c.strip(): linha.get(c.strip()) for c in colunas.split(",") if c.strip()}
+
+    def _selecionar(self, consulta):
+        if consulta.tabela == "roster_sincronizacao":
+            candidatos = self._view_roster()
+        else:
+            candidatos = self._candidatos(consulta.tabela, consulta.filtros)
+        linhas = [(rid, linha) for rid, linha in candidatos if self._passa(linha, consulta.filtros)]
+        for coluna, desc, nulos_primeiro in reversed(consulta.ordem):
+            # reverse=desc também inverte o marcador de nulo: ele é montado já contando com isso
+            linhas.sort(key=lambda item: ((item[1].get(coluna) is None) == (desc == nulos_primeiro),
+                                          _comparavel(item[1].get(coluna))), reverse=desc)
+        return linhas
+
+    # -------------------------------------------------------------- execução
+    def executar(self, consulta):
+        self._rede((consulta.tabela, consulta.operacao))
+        with self._trava:
+            if consulta.operacao == "select":
+                linhas = self._selecionar(consulta)
+                total = len(linhas) if consulta.contar else None
+                fim = None if consulta.limite is None else consulta.inicio + consulta.limite
+                pagina = linhas[consulta.inicio:fim]
+                return RespostaLocal([self._projetar(linha, consulta.colunas) for _, linha in pagina], total)
+
+            if consulta.operacao in ("insert", "upsert"):
+                return RespostaLocal(self._inserir(consulta))
+
+            alvo = self._selecionar(consulta)
+            if consulta.operacao == "update":
+                return RespostaLocal([dict(self._atualizar(consulta.tabela, rid, consulta.payload)) for rid, _ in alvo])
+            if consulta.operacao == "delete":
+                return RespostaLocal([self._apagar(consulta.tabela, rid) for rid, _ in alvo])
+        raise ValueError(f"operação não suportada: {consulta.operacao}")
+
+    def _inserir(self, consulta):
+        tabela = consulta.tabela
+        registros = consulta.payload if isinstance(consulta.payload, list) else [consulta.payload]
+        chave = consulta.on_conflict or CHAVES_PRIMARIAS.get(tabela, "id")
+        gravadas = []
+        for registro in registros:
+            registro = dict(registro)
+            if tabela == "webhook_events":
+                registro["chave_evento"] = chave_evento(registro.get("event_data") or {})
+            existente = None
+            if consulta.operacao == "upsert" and registro.get(chave) is not None:
+                filtro = [[("eq", chave, registro[chave])]]
+                existente = next((item for item in self._candidatos(tabela, filtro) if self._passa(item[1], filtro)), None)
+            if existente:
+                if not consulta.ignorar_duplicados:
+                    gravadas.append(dict(self._atualizar(tabela, existente[0], registro)))
+                continue
+            gravadas.append(dict(self._gravar_nova(tabela, registro)))
+        return gravadas
+
+    # ------------------------------------------------------------------ rpc
+    def executar_rpc(self, nome, p):
+        self._rede(("rpc", nome))
+        with self._trava:
+            return RespostaLocal(getattr(self, f"_rpc_{nome}")(**p))
+
+    def _expirada(self, linha, expiracao_seg):
+        return (not linha.get("reivindicado_em")
+                or _comparavel(linha["reivindicado_em"]) < _agora() - timedelta(seconds=expiracao_seg))
+
+    def _reivindicar(self, tabela, rids, trabalhador):
+        agora = _agora().isoformat()
+        return [
+            dict(self._atualizar(tabela, rid, {
+                "reivindicado_em": agora,
+                "reivindicado_por": trabalhador,
+                "tentativas": (self._linhas[tabela][rid].get("tentativas") or 0) + 1,
+            }))
+            for rid in rids
+        ]
+
+    def _rpc_reivindicar_webhook_events(self, p_lote, p_trabalhador, p_expiracao_seg=300):
+        livres = sorted(
+            rid for rid, linha in self._linhas["webhook_events"].items()
+            if not linha.get("processado") and self._expirada(linha, p_expiracao_seg)
+        )[:p_lote]
+        return self._reivindicar("webhook_events", livres, p_trabalhador)
+
+    def _rpc_reivindicar_notificacoes(self, p_lote, p_trabalhador, p_expiracao_seg=300):
+        agora = _agora()
+        pendentes = [
+            (rid, linha) for rid, linha in self._linhas["notificacoes_whatsapp"].items()
+            if linha.get("status") == "pendente" and self._expirada(linha, p_expiracao_seg)
+        ]
+        prontas = sorted(
+            ((rid, linha) for rid, linha in pendentes if _comparavel(linha["proxima_tentativa_em"]) <= agora),
+            key=lambda item: (_comparavel(item[1]["proxima_tentativa_em"]), item[0]),
+        )[:p_lote]
+        resumo = {linha.get("user_id") for _, linha in prontas if (linha.get("janela_resumo_min") or 0) > 0}
+        rids = {rid for rid, _ in prontas}
+        rids |= {rid for rid, linha in pendentes
+                 if (linha.get("janela_resumo_min") or 0) > 0 and linha.get("user_id") in resumo}
+        return self._reivindicar("notificacoes_whatsapp", sorted(rids), p_trabalhador)
+
+    def _rpc_reivindicar_backfill(self, p_user_id, p_trabalhador, p_expiracao_seg=300):
+        linha = self._linhas["auth_strava"].get(p_user_id)
+        if not linha or linha.get("backfill_status") == "concluido":
+            return False
+        if (linha.get("backfill_reivindicado_por") != p_trabalhador and linha.get("backfill_reivindicado_em")
+                and _comparavel(linha["backfill_reivindicado_em"]) >= _agora() - timedelta(seconds=p_expiracao_seg)):
+            return False
+        self._atualizar("auth_strava", p_user_id, {
+            "backfill_reivindicado_em": _agora().isoformat(),
+            "backfill_reivindicado_por": p_trabalhador,
+        })
+        return True
+
+    def _rpc_liberar_backfill(self, p_user_id, p_trabalhador):
+        linha = self._linhas["auth_strava"].get(p_user_id)
+        if linha and linha.get("backfill_reivindicado_por") == p_trabalhador:
+            self._atualizar("auth_strava", p_user_id, {"backfill_reivindicado_em": None, "backfill_reivindicado_por": None})
+        return None
+
+    def _rpc_gravar_atividades_com_notificacoes(self, p_atividades, p_notificacoes=()):
+        self._inserir(ConsultaLocal(self, "atividades_fisicas").upsert(p_atividades, on_conflict="strava_id"))
+        agora = _agora()
+        notificacoes = [
+            {**n, "janela_resumo_min": n.get("janela_resumo_min") or 0,
+             "proxima_tentativa_em": (agora + timedelta(minutes=n.get("janela_resumo_min") or 0)).isoformat()}
+            for n in p_notificacoes
+        ]
+        self._inserir(ConsultaLocal(self, "notificacoes_whatsapp").upsert(
+            notificacoes, on_conflict="chave_idempotencia", ignore_duplicates=True))
+        return None
+
+    def _rpc_resumo_treinos_atleta(self, p_id_atleta, p_desde=None, p_ate=None, p_busca=None):
+        filtros = [[("eq", "id_atleta", p_id_atleta)]]
+        filtros += [[(operador, "data_treino", valor)] for operador, valor in (("gte", p_desde), ("lte", p_ate)) if valor]
+        if p_busca:
+            filtros.append([("ilike", "name", f"%{p_busca}%")])
+        linhas = [linha for _, linha in self._candidatos("atividades_fisicas", filtros) if self._passa(linha, filtros)]
+        cargas = [linha["trimp_score"] for linha in linhas if linha.get("trimp_score") is not None]
+        return [{
+            "total_treinos": len(linhas),
+            "km_total": sum(linha.get("distancia") or 0 for linha in linhas),
+            "trimp_medio": sum(cargas) / len(cargas) if cargas else 0,
+        }]
+
+    def _rpc_adquirir_lease(self, p_nome, p_dono, p_ttl_seg):
+        agora = _agora()
+        atual = self._linhas["lease_servicos"].get(p_nome)
+        if atual and atual["dono"] != p_dono and _comparavel(atual["expira_em"]) >= agora:
+            return False
+        self._linhas["lease_servicos"][p_nome] = {
+            "nome": p_nome, "dono": p_dono, "renovado_em": agora.isoformat(),
+            "expira_em": (agora + timedelta(seconds=p_ttl_seg)).isoformat(),
+        }
+        return True
+
+    def _rpc_liberar_lease(self, p_nome, p_dono):
+        if self._linhas["lease_servicos"].get(p_nome, {}).get("dono") == p_dono:
+            self._linhas["lease_servicos"].pop(p_nome)
+        return None
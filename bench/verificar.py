@@ -0,0 +1,306 @@
+"""
+Verificações de comportamento contra o Strava e o banco locais: cenários de borda que
+o bench de vazão não exercita (webhook perdido, token revogado, carga recalculada
+depois da importação de histórico...).
+
+    python -m bench.verificar
+    python -m bench.verificar --so webhook_perdido
+
+Cada verificação cria os seus próprios atletas (índices diferentes do gerar_historico,
+então não se misturam) e falha com AssertionError. Sai com código 1 se alguma falhar.
+"""
+import argparse
+import os
+import random
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+
+from bench.strava_local import EstadoStravaLocal, ServidorStravaLocal
+
+# Índices do gerar_historico reservados para os atletas das verificações
+INDICE_BASE = 900_000
+
+def _strava_data(instante):
+    return instante.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+class Contexto:
+    """Banco e Strava locais compartilhados, com atalhos para montar atletas."""
+
+    def __init__(self, banco, estado_strava):
+        self.banco = banco
+        self.estado_strava = estado_strava
+        self.agora = datetime.now(timezone.utc).replace(microsecond=0)
+        self._proximo_indice = INDICE_BASE
+
+    def novo_atleta(self, historico=(), **auth):
+        """
+        Atleta com `historico` (atividades no formato do Strava) já no Strava local e já
+        sincronizado no banco. `auth` sobrescreve colunas de auth_strava.
+        """
+        from gerar_historico import linha_auth, linha_usuario, linhas_atividades, perfil_atleta
+
+        perfil = perfil_atleta(self._proximo_indice, self.agora)
+        self._proximo_indice += 1
+        historico = list(historico)
+        self.estado_strava.adicionar_atividades(perfil["athlete_id"], historico)
+        self.banco.carregar("usuarios_app", [dict(linha_usuario(perfil), janela_resumo_min=0)])
+        self.banco.carregar("auth_strava", [dict(linha_auth(perfil, historico, self.agora), **auth)])
+        self.banco.carregar("atividades_fisicas", linhas_atividades(perfil, historico))
+        return perfil
+
+    def atividade(self, perfil, inicio, minutos=45):
+        """Atividade nova do atleta no formato do Strava (ainda fora do Strava local)."""
+        from bench.cenario import atividade_strava
+
+        act = atividade_strava(random.Random(f"{perfil['athlete_id']}:{inicio}"), inicio)
+        act.update(moving_time=minutos * 60, average_heartrate=150.0)
+        return act
+
+    def roster(self, perfil):
+        from processar_fila import COLUNAS_ROSTER
+
+        res = self.banco.table("roster_sincronizacao").select(COLUNAS_ROSTER).eq("user_id", perfil["user_id"]).execute()
+        return res.data[0]
+
+    def strava_ids(self, perfil):
+        res = self.banco.table("atividades_fisicas").select("strava_id").eq("id_atleta", perfil["user_id"]).execute()
+        return {linha["strava_id"] for linha in res.data}
+
+# ============================================================================
+# VERIFICAÇÕES
+# ============================================================================
+def verificar_webhook_perdido(ctx):
+    """
+    O webhook do treino A se perde; o do treino B, mais de 3h depois, chega. O poll
+    seguinte ainda precisa achar A: o webhook não pode avançar o cursor do polling.
+    """
+    import processar_fila
+    import processar_webhooks
+
+    perfil = ctx.novo_atleta(ultima_atividade_em=_strava_data(ctx.agora - timedelta(days=2)))
+    treino_a = ctx.atividade(perfil, ctx.agora - timedelta(hours=10))
+    treino_b = ctx.atividade(perfil, ctx.agora - timedelta(hours=1))
+    ctx.estado_strava.adicionar_atividades(perfil["athlete_id"], [treino_a, treino_b])
+
+    processar_webhooks.aplicar_evento(
+        {"object_type": "activity", "aspect_type": "create", "object_id": treino_b["id"], "owner_id": perfil["athlete_id"]},
+        ctx.roster(perfil),
+    )
+    assert str(treino_b["id"]) in ctx.strava_ids(perfil), "o webhook de B não gravou B"
+
+    processar_fila.processar_atleta(ctx.roster(perfil))
+    assert str(treino_a["id"]) in ctx.strava_ids(perfil), "o poll depois do webhook de B não achou A"
+
+def _reconectar(ctx, perfil, token_antigo):
+    """Outro processo refaz o OAuth: tokens novos no banco e o antigo revogado no Strava."""
+    novo = {
+        "access_token": f"local-{perfil['athlete_id']}-reconectado",
+        "expires_at": int((ctx.agora + timedelta(hours=6, minutes=30)).timestamp()),
+    }
+    ctx.banco.table("auth_strava").update(novo).eq("user_id", perfil["user_id"]).execute()
+    ctx.estado_strava.revogar(token_antigo)
+    return novo["access_token"]
+
+def verificar_token_reconexao(ctx):
+    """
+    Depois de reconectar, o token antigo (ainda "válido" pelo expires_at) não pode seguir
+    em uso: o sync usa a linha nova do roster, e descartar_token (chamado pelo OAuth do
+    main.py) faz o próximo obter reler o banco.
+    """
+    import processar_fila
+    from auth_strava import descartar_token, obter_token_valido
+
+    perfil = ctx.novo_atleta(ultima_atividade_em=_strava_data(ctx.agora - timedelta(days=1)))
+    _reconectar(ctx, perfil, obter_token_valido(perfil["user_id"]))
+
+    treino = ctx.atividade(perfil, ctx.agora - timedelta(hours=2))
+    ctx.estado_strava.adicionar_atividades(perfil["athlete_id"], [treino])
+    processar_fila.processar_atleta(ctx.roster(perfil))
+    assert str(treino["id"]) in ctx.strava_ids(perfil), "o sync seguiu com o token revogado do cache"
+
+    perfil_2 = ctx.novo_atleta()
+    novo = _reconectar(ctx, perfil_2, obter_token_valido(perfil_2["user_id"]))
+    descartar_token(perfil_2["user_id"])
+    assert obter_token_valido(perfil_2["user_id"]) == novo, "descartar_token não fez o obter reler o banco"
+
+def verificar_token_401(ctx):
+    """Strava recusa o token do cache (401): a próxima tentativa usa o token do banco."""
+    import processar_webhooks
+    from auth_strava import obter_token_valido
+
+    perfil = ctx.novo_atleta()
+    _reconectar(ctx, perfil, obter_token_valido(perfil["user_id"]))
+
+    treino = ctx.atividade(perfil, ctx.agora - timedelta(hours=1))
+    ctx.estado_strava.adicionar_atividades(perfil["athlete_id"], [treino])
+    evento = {"object_type": "activity", "aspect_type": "create", "object_id": treino["id"], "owner_id": perfil["athlete_id"]}
+    try:
+        processar_webhooks.aplicar_evento(evento, ctx.roster(perfil))
+        raise AssertionError("o token revogado foi aceito")
+    except RuntimeError:
+        pass
+    processar_webhooks.aplicar_evento(evento, ctx.roster(perfil))
+    assert str(treino["id"]) in ctx.strava_ids(perfil), "depois do 401 o token revogado continuou no cache"
+
+def verificar_carga_backfill(ctx):
+    """
+    Treinos recentes já sincronizados (carga 7d/30d sem o passado) e a importação de
+    histórico traz treinos mais antigos: a carga dos recentes tem de ser recalculada.
+    """
+    import importar_historico
+    from gerar_historico import linhas_atividades
+
+    perfil = ctx.novo_atleta()
+    recentes = [ctx.atividade(perfil, ctx.agora - timedelta(days=dias, hours=3)) for dias in (5, 3, 1)]
+    antigos = [ctx.atividade(perfil, ctx.agora - timedelta(days=dias, hours=3)) for dias in (40, 20, 12, 6)]
+    ctx.estado_strava.adicionar_atividades(perfil["athlete_id"], recentes + antigos)
+    ctx.banco.carregar("atividades_fisicas", linhas_atividades(perfil, recentes))
+    ctx.banco.table("auth_strava").update({"backfill_status": "pendente", "backfill_cursor": 0}).eq("user_id", perfil["user_id"]).execute()
+
+    assert importar_historico.importar_historico_atleta(perfil["user_id"]), "a importação não concluiu"
+    importar_historico.liberar_importacao(perfil["user_id"])
+
+    esperado = {linha["strava_id"]: (linha["trimp_semanal"], linha["trimp_mensal"])
+                for linha in linhas_atividades(perfil, antigos + recentes)}
+    res = (ctx.banco.table("atividades_fisicas").select("strava_id, trimp_semanal, trimp_mensal")
+           .eq("id_atleta", perfil["user_id"]).execute())
+    gravado = {linha["strava_id"]: (linha["trimp_semanal"], linha["trimp_mensal"]) for linha in res.data}
+    assert gravado == esperado, f"carga 7d/30d errada depois da importação: {gravado} != {esperado}"
+
+def verificar_lease_ciclo(ctx):
+    """
+    O vigilante perde o lease no meio do ciclo (outro processo assumiu): o ciclo para
+    no próximo lote em vez de seguir sincronizando o roster inteiro em paralelo ao novo líder.
+    """
+    import processar_fila
+    from modules.lideranca import LeaseServico
+
+    atletas = [ctx.novo_atleta(ultima_atividade_em=_strava_data(ctx.agora - timedelta(days=1))) for _ in range(5)]
+    treinos = {}
+    for perfil in atletas:
+        treinos[perfil["user_id"]] = ctx.atividade(perfil, ctx.agora - timedelta(hours=2))
+        ctx.estado_strava.adicionar_atividades(perfil["athlete_id"], [treinos[perfil["user_id"]]])
+
+    lease = LeaseServico(ctx.banco, "vigilante-verificacao", ttl_seg=1)
+    checagens = []
+
+    def continuar():
+        if checagens:
+            # Entre o 1º e o 2º lote o lease expirou e outro processo assumiu
+            time.sleep(lease.ttl_seg + 0.1)
+            assert LeaseServico(ctx.banco, lease.nome).adquirir(), "o outro processo não assumiu o lease expirado"
+        checagens.append(True)
+        return lease.adquirir()
+
+    padrao = processar_fila.ATLETAS_POR_CHECAGEM
+    processar_fila.ATLETAS_POR_CHECAGEM = 2
+    try:
+        processar_fila.sincronizar_roster([ctx.roster(p) for p in atletas], max_workers=1, continuar=continuar)
+    finally:
+        processar_fila.ATLETAS_POR_CHECAGEM = padrao
+
+    sincronizados = [p for p in atletas if str(treinos[p["user_id"]]["id"]) in ctx.strava_ids(p)]
+    assert len(checagens) == 2, f"o lease foi conferido {len(checagens)} vez(es), esperado 2"
+    assert sincronizados == atletas[:2], f"{len(sincronizados)} atleta(s) sincronizados depois de perder o lease, esperado 2"
+
+def verificar_cota_reserva(ctx):
+    """
+    Só a reserva diária do Strava sobrou: o sync do robô e o worker de webhooks desistem
+    na hora (o ciclo é pulado) em vez de esperar horas na fila do agendador.
+    """
+    import threading
+
+    import processar_fila
+    import processar_webhooks
+    from modules.agendador_strava import PRIORIDADE_ALTA, CotaDiariaEsgotada, requisitar_strava
+
+    perfil = ctx.novo_atleta(ultima_atividade_em=_strava_data(ctx.agora - timedelta(days=1)))
+    treino = ctx.atividade(perfil, ctx.agora - timedelta(hours=2))
+    ctx.estado_strava.adicionar_atividades(perfil["athlete_id"], [treino])
+    cursor_antes = ctx.roster(perfil)["ultima_atividade_em"]
+
+    def consultar_cota():
+        # Uma ação do usuário (sem reserva) traz os cabeçalhos de cota para o agendador
+        requisitar_strava("GET", "/api/v3/athlete/activities?per_page=1", prioridade=PRIORIDADE_ALTA,
+                          headers={"Authorization": f"Bearer local-{perfil['athlete_id']}-0"})
+
+    limite_original = ctx.estado_strava.limite_diario
+    ctx.estado_strava.uso = max(ctx.estado_strava.uso, 1000)
+    ctx.estado_strava.limite_diario = ctx.estado_strava.uso + 50
+    try:
+        consultar_cota()
+        resultado = {}
+
+        def ciclo_sem_cota():
+            resultado["sync"] = processar_fila.sincronizar_roster([ctx.roster(perfil)])
+            resultado["webhooks"] = processar_webhooks.processar_lote_webhooks()
+            try:
+                processar_fila.processar_atleta(ctx.roster(perfil))
+            except CotaDiariaEsgotada:
+                resultado["atleta"] = "sem cota"
+
+        ciclo = threading.Thread(target=ciclo_sem_cota, daemon=True)
+        ciclo.start()
+        ciclo.join(timeout=5)
+        assert not ciclo.is_alive(), "o ciclo ficou esperando a cota do dia virar"
+    finally:
+        ctx.estado_strava.limite_diario = limite_original
+        consultar_cota()
+
+    assert resultado["sync"] == (0, 0), f"o sync andou sem cota: {resultado['sync']}"
+    assert resultado["webhooks"] == 0, "o worker reivindicou eventos sem cota"
+    assert resultado.get("atleta") == "sem cota", "a chamada do robô não recebeu CotaDiariaEsgotada"
+    assert ctx.roster(perfil)["ultima_atividade_em"] == cursor_antes, "o cursor andou sem sincronizar"
+    processar_fila.processar_atleta(ctx.roster(perfil))
+    assert str(treino["id"]) in ctx.strava_ids(perfil), "com a cota de volta o treino não foi sincronizado"
+
+VERIFICACOES = {
+    "webhook_perdido": verificar_webhook_perdido,
+    "token_reconexao": verificar_token_reconexao,
+    "token_401": verificar_token_401,
+    "carga_backfill": verificar_carga_backfill,
+    "lease_ciclo": verificar_lease_ciclo,
+    "cota_reserva": verificar_cota_reserva,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verificações de borda contra o Strava e o banco locais.")
+    parser.add_argument("--so", help=f"lista separada por vírgula: {', '.join(VERIFICACOES)}")
+    args = parser.parse_args(argv)
+
+    # Os módulos do app leem isto na importação: precisa vir antes do BancoLocal e dos imports das verificações
+    os.environ.setdefault("LOG_NIVEL", "WARNING")
+    from bench.supabase_local import BancoLocal
+
+    estado_strava = EstadoStravaLocal()
+    servidor = ServidorStravaLocal(estado_strava).iniciar()
+    banco = BancoLocal()
+    os.environ.update({
+        "STRAVA_API_BASE": servidor.url_base,
+        "STRAVA_CLIENT_ID": "bench",
+        "STRAVA_CLIENT_SECRET": "bench",
+        "WHATSAPP_TRANSPORTE": "local",
+        "WHATSAPP_INTERVALO_DESTINO_SEG": "0",
+    })
+    from modules.conexao import definir_supabase
+    definir_supabase(banco)
+
+    escolhidas = [nome.strip() for nome in (args.so or ",".join(VERIFICACOES)).split(",") if nome.strip()]
+    ctx = Contexto(banco, estado_strava)
+    falhas = 0
+    try:
+        for nome in escolhidas:
+            try:
+                VERIFICACOES[nome](ctx)
+                print(f"✅ {nome}")
+            except Exception:
+                falhas += 1
+                print(f"❌ {nome}")
+                traceback.print_exc()
+    finally:
+        servidor.parar()
+    return falhas
+
+if __name__ == "__main__":
+    raise SystemExit(1 if main() else 0)
@@ -1,10 +1,6 @@
-import os
-from dotenv import load_dotenv
-from supabase import create_client
+from modules.conexao import obter_supabase
 
-load_dotenv()
-
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+supabase = obter_supabase()
 
 def cadastrar_atleta_teste():
     atleta = {
@@ -1,36 +1,434 @@
+"""
+Gerador de dados sintéticos para teste de carga.
+
+Cria atletas com linhas em usuarios_app e auth_strava e anos de treinos em
+atividades_fisicas. Os treinos têm mistura de esportes por perfil (corredor, ciclista,
+triatleta, academia), periodização semanal (ciclos de 3 semanas de carga + 1 de
+recuperação, férias e pausas), FC coerente com a intensidade e a FC máxima do
+atleta, e TRIMP/carga 7d/30d calculados pelas mesmas regras do sync.
+
+Tudo sai de uma semente fixa: cada atleta tem o seu próprio Random derivado de
+(semente, índice), então o atleta N é sempre igual, independente de quantos são
+gerados, do tamanho do lote ou de `--primeiro` (para dividir a geração entre processos).
+
+    python gerar_historico.py --atletas 5000 --anos 3 --destino csv --saida dados_carga
+    python gerar_historico.py --atletas 500 --anos 2 --destino supabase --lote 1000 --workers 4
+    python gerar_historico.py --atletas 200 --anos 1 --destino nenhum --fixtures-strava dados_carga/strava.jsonl
+
+- csv: um arquivo por tabela, prontos para `\\copy ... with (format csv, header true)`
+  (os comandos são impressos no fim). É o caminho para milhões de linhas.
+- supabase: upsert em lotes (idempotente; pode rodar de novo por cima).
+- --fixtures-strava: as mesmas atividades no formato da API do Strava (uma por linha),
+  que o Strava local carrega com `python -m bench.strava_local --fixtures <arquivo>`.
+  Os tokens gravados em auth_strava são os que o Strava local aceita.
+"""
+import argparse
+import csv
+import json
 import os
-from dotenv import load_dotenv
-from supabase import create_client
-from datetime import datetime, timedelta
-
-load_dotenv()
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
-
-MEU_ID = "7b606745-96e8-446f-8576-a18a3b4abf30"
-
-def gerar_treinos_ficticios():
-    # Simulando treinos dos últimos 4 dias
-    treinos = [
-        {"duracao": 30, "fc": 140, "dias_atras": 4},
-        {"duracao": 50, "fc": 150, "dias_atras": 3},
-        {"duracao": 20, "fc": 130, "dias_atras": 2},
-        {"duracao": 60, "fc": 160, "dias_atras": 1},
-    ]
-
-    for t in treinos:
-        data_fake = (datetime.now() - timedelta(days=t['dias_atras'])).isoformat()
-        
-        # Inserindo direto com um TRIMP estimado para o teste
-        payload = {
-            "id_atleta": MEU_ID,
-            "duracao_min": t['duracao'],
-            "fc_media": t['fc'],
-            "trimp_score": t['duracao'] * 1.5, # Simplificado para o seed
-            "data_treino": data_fake
-        }
-        supabase.table("atividades_fisicas").insert(payload).execute()
-    
-    print("✅ Histórico de 4 dias gerado com sucesso!")
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from modules.agenda_polling import atualizar_histograma
+from modules.carga import JanelaCarga, calcular_trimp_banister
+
+SEMENTE_PADRAO = 42
+
+# athlete_id = BASE_ATHLETE_ID + índice; ids de atividade em faixas por atleta (não colidem entre execuções)
+BASE_ATHLETE_ID = 1_000_000
+BASE_ID_ATIVIDADE = 20_000_000_000
+ATIVIDADES_POR_ATLETA_MAX = 100_000
+
+# Horário local do Brasil (start_date_local = start_date - 3h)
+FUSO_LOCAL = timedelta(hours=-3)
+
+# tipo Strava: (nome, velocidade leve em m/s, ganho de velocidade no treino forte, minutos típicos, FC relativa)
+ESPORTES = {
+    "Run": ("Corrida", (2.4, 3.2), 1.25, (25, 75), 1.00),
+    "Ride": ("Pedal", (6.0, 8.0), 1.20, (45, 150), 0.95),
+    "Swim": ("Natação", (0.55, 0.8), 1.15, (30, 70), 0.92),
+    "Walk": ("Caminhada", (1.2, 1.6), 1.10, (30, 80), 0.90),
+    "Workout": ("Funcional", None, None, (30, 70), 0.97),
+}
+
+# Perfil: (peso no roster, mistura de esportes)
+PERFIS = {
+    "corredor": (0.45, {"Run": 0.80, "Workout": 0.15, "Ride": 0.05}),
+    "ciclista": (0.20, {"Ride": 0.75, "Run": 0.10, "Workout": 0.15}),
+    "triatleta": (0.15, {"Run": 0.35, "Ride": 0.35, "Swim": 0.25, "Workout": 0.05}),
+    "academia": (0.20, {"Workout": 0.60, "Run": 0.30, "Walk": 0.10}),
+}
+
+# Faixas de FC média (fração da FC máxima) por intensidade
+INTENSIDADES = {
+    "leve": (0.62, 0.72),
+    "moderado": (0.73, 0.82),
+    "forte": (0.83, 0.91),
+}
+
+# Ciclo de 4 semanas: 3 de carga progressiva + 1 de recuperação
+CICLO_SEMANAL = (0.90, 1.00, 1.10, 0.65)
+MESES_FERIAS = {12: 0.75, 1: 0.80}
+PROB_PAUSA = 0.03
+
+TABELAS = ("usuarios_app", "auth_strava", "atividades_fisicas")
+CHAVES_UPSERT = {"usuarios_app": "id", "auth_strava": "user_id", "atividades_fisicas": "strava_id"}
+COLUNAS = {
+    "usuarios_app": ["id", "nome", "email", "telefone", "data_nascimento", "is_admin", "status_pagamento",
+                     "aceite_lgpd", "bloqueado", "data_vencimento", "fc_maxima", "fc_repouso", "janela_resumo_min"],
+    "auth_strava": ["user_id", "athlete_id", "access_token", "refresh_token", "expires_at", "ultima_atividade_em",
+                    "histograma_horas", "backfill_cursor", "backfill_status"],
+    "atividades_fisicas": ["id_atleta", "strava_id", "data_treino", "distancia", "duracao", "name",
+                           "trimp_score", "trimp_semanal", "trimp_mensal", "notificacao"],
+}
+
+def _sortear(aleatorio, pesos):
+    """Escolhe uma chave de {chave: peso}."""
+    return aleatorio.choices(list(pesos), weights=list(pesos.values()))[0]
+
+def aleatorio_atleta(indice, semente=SEMENTE_PADRAO):
+    return random.Random(f"{semente}:{indice}")
+
+def perfil_atleta(indice, referencia, semente=SEMENTE_PADRAO):
+    """
+    Características fixas do atleta N: fisiologia, volume, esportes e rotina.
+    A data de nascimento sai da idade sorteada contada a partir de `referencia` (o fim
+    do histórico), para o mesmo --ate gerar sempre o mesmo atleta.
+    """
+    aleatorio = aleatorio_atleta(indice, semente)
+    tipo = _sortear(aleatorio, {nome: peso for nome, (peso, _) in PERFIS.items()})
+    idade = aleatorio.randint(18, 65)
+    fc_maxima = max(160, min(205, int(round(208 - 0.7 * idade + aleatorio.gauss(0, 5)))))
+    return {
+        "indice": indice,
+        "user_id": str(uuid.UUID(int=aleatorio.getrandbits(128))),
+        "athlete_id": BASE_ATHLETE_ID + indice,
+        "nome": f"Atleta Carga {indice:06d}",
+        "telefone": f"119{indice:08d}",
+        "nascimento": f"{referencia.year - idade}-{aleatorio.randint(1, 12):02d}-{aleatorio.randint(1, 28):02d}",
+        "tipo": tipo,
+        "esportes": PERFIS[tipo][1],
+        "fc_maxima": fc_maxima,
+        "fc_repouso": aleatorio.randint(45, 70),
+        "nivel": aleatorio.uniform(0.85, 1.25),
+        "minutos_semana": aleatorio.choice((150, 200, 250, 300, 400, 500, 600)),
+        "dias_semana": aleatorio.choice((3, 4, 4, 5, 5, 6)),
+        "dia_longo": aleatorio.choice((5, 6, 6)),
+        "hora_preferida": aleatorio.choice((5, 6, 6, 7, 12, 18, 19, 19, 20)),
+        "usa_cinta": aleatorio.random() < 0.85,
+        "janela_resumo_min": aleatorio.choice((0, 0, 0, 10, 30, 60)),
+        "semente": semente,
+    }
+
+def _montar_atividade(perfil, aleatorio, numero, inicio_utc, esporte, intensidade, minutos, longo=False):
+    nome_esporte, velocidade, ganho, _, fc_relativa = ESPORTES[esporte]
+    moving = int(minutos * 60 + aleatorio.randint(-90, 90))
+
+    if velocidade:
+        v = aleatorio.uniform(*velocidade) * perfil["nivel"]
+        if intensidade == "moderado":
+            v *= 1 + (ganho - 1) / 2
+        elif intensidade == "forte":
+            v *= ganho
+        distancia = round(v * moving, 1)
+    else:
+        distancia = 0.0
+
+    fc_media = fc_max_treino = None
+    if perfil["usa_cinta"] and aleatorio.random() > 0.05:
+        fc_media = round(perfil["fc_maxima"] * aleatorio.uniform(*INTENSIDADES[intensidade]) * fc_relativa, 1)
+        fc_max_treino = min(perfil["fc_maxima"], int(fc_media + aleatorio.randint(8, 22)))
+
+    local = inicio_utc + FUSO_LOCAL
+    periodo = "da Manhã" if local.hour < 12 else "da Tarde" if local.hour < 18 else "da Noite"
+    nome = f"{nome_esporte} Longo" if longo else f"{nome_esporte} {periodo}"
+
+    return {
+        "id": BASE_ID_ATIVIDADE + perfil["indice"] * ATIVIDADES_POR_ATLETA_MAX + numero,
+        "name": nome,
+        "type": esporte,
+        "sport_type": esporte,
+        "distance": distancia,
+        "moving_time": moving,
+        "elapsed_time": moving + aleatorio.randint(0, 900),
+        "total_elevation_gain": round(distancia / 1000 * aleatorio.uniform(3, 15), 1) if esporte in ("Run", "Ride") else 0.0,
+        "has_heartrate": fc_media is not None,
+        "average_heartrate": fc_media,
+        "max_heartrate": fc_max_treino,
+        "start_date": inicio_utc.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "start_date_local": local.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "timezone": "(GMT-03:00) America/Sao_Paulo",
+        "athlete": {"id": perfil["athlete_id"]},
+    }
+
+def atividades_atleta(perfil, inicio, fim):
+    """
+    Treinos do atleta entre `inicio` e `fim` (UTC), em ordem cronológica, no formato da
+    API do Strava. Semana a semana: volume = base x ciclo x férias x evolução, um treino
+    longo no fim de semana e o resto espalhado nos outros dias, com 65/20/15% de
+    treinos leves/moderados/fortes (sem fortes na semana de recuperação).
+    """
+    aleatorio = random.Random(f"{perfil['semente']}:{perfil['indice']}:treinos")
+    segunda = (inicio - timedelta(days=inicio.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    numero = 0
+    pausa = 0
+    semana = 0
+
+    while segunda < fim:
+        if pausa:
+            pausa -= 1
+        elif aleatorio.random() < PROB_PAUSA:
+            pausa = aleatorio.randint(0, 2)
+        else:
+            fase = CICLO_SEMANAL[semana % len(CICLO_SEMANAL)]
+            evolucao = min(1.3, 1 + 0.1 * semana / 52)
+            volume = perfil["minutos_semana"] * fase * MESES_FERIAS.get(segunda.month, 1.0) * evolucao * aleatorio.uniform(0.85, 1.15)
+            dias = max(1, perfil["dias_semana"] - (1 if fase < 0.8 else 0))
+            outros = aleatorio.sample([d for d in range(7) if d != perfil["dia_longo"]], dias - 1)
+            minutos_longo = volume * 0.30 if dias > 1 else volume
+
+            for dia in sorted(outros + [perfil["dia_longo"]]):
+                esporte = _sortear(aleatorio, perfil["esportes"])
+                faixa = ESPORTES[esporte][3]
+                if dia == perfil["dia_longo"]:
+                    intensidade = "leve" if aleatorio.random() < 0.8 else "moderado"
+                    minutos = max(faixa[0], min(faixa[1] * 1.8, minutos_longo))
+                else:
+                    pesos = {"leve": 0.65, "moderado": 0.20, "forte": 0.15 if fase >= 0.8 else 0.0}
+                    intensidade = _sortear(aleatorio, pesos)
+                    minutos = max(faixa[0], min(faixa[1], (volume - minutos_longo) / max(dias - 1, 1) * aleatorio.uniform(0.8, 1.2)))
+
+                hora = perfil["hora_preferida"] if dia < 5 else aleatorio.choice((6, 7, 8))
+                inicio_local = segunda + timedelta(days=dia, hours=hora, minutes=aleatorio.randint(0, 59))
+                inicio_utc = inicio_local - FUSO_LOCAL
+                if inicio <= inicio_utc < fim:
+                    yield _montar_atividade(perfil, aleatorio, numero, inicio_utc, esporte, intensidade, minutos,
+                                            longo=dia == perfil["dia_longo"])
+                    numero += 1
+
+        segunda += timedelta(days=7)
+        semana += 1
+
+def linha_usuario(perfil):
+    return {
+        "id": perfil["user_id"],
+        "nome": perfil["nome"],
+        "email": f"atleta{perfil['indice']:06d}@carga.local",
+        "telefone": perfil["telefone"],
+        "data_nascimento": perfil["nascimento"],
+        "is_admin": False,
+        "status_pagamento": True,
+        "aceite_lgpd": True,
+        "bloqueado": False,
+        "data_vencimento": None,
+        "fc_maxima": perfil["fc_maxima"],
+        "fc_repouso": perfil["fc_repouso"],
+        "janela_resumo_min": perfil["janela_resumo_min"],
+    }
+
+def linha_auth(perfil, atividades, agora):
+    """Vínculo com o Strava já sincronizado até a última atividade gerada."""
+    ultima = atividades[-1] if atividades else None
+    return {
+        "user_id": perfil["user_id"],
+        "athlete_id": perfil["athlete_id"],
+        "access_token": f"local-{perfil['athlete_id']}-0",
+        "refresh_token": f"ref-{perfil['athlete_id']}",
+        "expires_at": int((agora + timedelta(hours=6)).timestamp()),
+        "ultima_atividade_em": ultima["start_date"] if ultima else None,
+        # Atividades de muito tempo atrás já não pesam no histograma (decaimento 0.95 por atividade)
+        "histograma_horas": atualizar_histograma(None, atividades[-200:]),
+        "backfill_cursor": int(datetime.fromisoformat(ultima["start_date"].replace("Z", "+00:00")).timestamp()) if ultima else 0,
+        "backfill_status": "concluido",
+    }
+
+def linhas_atividades(perfil, atividades):
+    """Linhas de atividades_fisicas como o sync gravaria (TRIMP e carga 7d/30d incluídos)."""
+    janela = JanelaCarga()
+    linhas = []
+    for act in atividades:
+        dur_min = int(act["moving_time"] / 60)
+        fc_media = act.get("average_heartrate")
+        trimp = calcular_trimp_banister(dur_min, fc_media, perfil["fc_maxima"]) if fc_media else int(dur_min * 1.5)
+        data_treino = act["start_date_local"][:10]
+        t_semanal, t_mensal = janela.adicionar(data_treino, trimp)
+        linhas.append({
+            "id_atleta": perfil["user_id"],
+            "strava_id": str(act["id"]),
+            "data_treino": data_treino,
+            "distancia": round(act["distance"] / 1000, 2),
+            "duracao": dur_min,
+            "name": act["name"],
+            "trimp_score": trimp,
+            "trimp_semanal": t_semanal,
+            "trimp_mensal": t_mensal,
+            "notificacao": True,
+        })
+    return linhas
+
+def gerar_roster(atletas, inicio, fim, semente=SEMENTE_PADRAO, primeiro=0):
+    """Gerador de (perfil, atividades) atleta a atleta: só um atleta fica em memória."""
+    for indice in range(primeiro, primeiro + atletas):
+        perfil = perfil_atleta(indice, fim, semente)
+        yield perfil, list(atividades_atleta(perfil, inicio, fim))
+
+class DestinoCsv:
+    """Um CSV por tabela, escrito em streaming, no formato do COPY do Postgres."""
+
+    def __init__(self, pasta):
+        os.makedirs(pasta, exist_ok=True)
+        self.pasta = pasta
+        self._arquivos = {}
+        self._escritores = {}
+        for tabela in TABELAS:
+            arquivo = open(os.path.join(pasta, f"{tabela}.csv"), "w", newline="", encoding="utf-8")
+            self._arquivos[tabela] = arquivo
+            self._escritores[tabela] = csv.writer(arquivo)
+            self._escritores[tabela].writerow(COLUNAS[tabela])
+
+    @staticmethod
+    def _valor(valor):
+        if valor is None:
+            return ""
+        if isinstance(valor, bool):
+            return "true" if valor else "false"
+        if isinstance(valor, (list, dict)):
+            return json.dumps(valor)
+        return valor
+
+    def gravar(self, tabela, linhas):
+        colunas = COLUNAS[tabela]
+        self._escritores[tabela].writerows([self._valor(linha.get(c)) for c in colunas] for linha in linhas)
+
+    def fechar(self):
+        for arquivo in self._arquivos.values():
+            arquivo.close()
+        print("📥 Para carregar no Postgres (psql):")
+        for tabela in TABELAS:
+            caminho = os.path.abspath(os.path.join(self.pasta, f"{tabela}.csv"))
+            print(f"   \\copy public.{tabela} ({', '.join(COLUNAS[tabela])}) from '{caminho}' with (format csv, header true)")
+
+class DestinoSupabase:
+    """
+    Upsert em lotes de `tamanho_lote` linhas por tabela. Antes de gravar um lote, as
+    tabelas anteriores em TABELAS são descarregadas (chaves estrangeiras). Os lotes de
+    atividades vão para `workers` threads, com no máximo 2 lotes por thread em espera.
+    """
+
+    def __init__(self, supabase, tamanho_lote=1000, workers=4):
+        self.supabase = supabase
+        self.tamanho_lote = tamanho_lote
+        self._buffers = {tabela: [] for tabela in TABELAS}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="carga")
+        self._pendentes = []
+        self._max_pendentes = workers * 2
+
+    def _enviar(self, tabela, linhas):
+        self.supabase.table(tabela).upsert(linhas, on_conflict=CHAVES_UPSERT[tabela]).execute()
+
+    def _descarregar(self, ate_tabela):
+        for tabela in TABELAS[:TABELAS.index(ate_tabela) + 1]:
+            linhas, self._buffers[tabela] = self._buffers[tabela], []
+            if not linhas:
+                continue
+            if tabela == "atividades_fisicas":
+                if len(self._pendentes) >= self._max_pendentes:
+                    self._pendentes.pop(0).result()
+                self._pendentes.append(self._executor.submit(self._enviar, tabela, linhas))
+            else:
+                self._enviar(tabela, linhas)
+
+    def gravar(self, tabela, linhas):
+        buffer = self._buffers[tabela]
+        buffer.extend(linhas)
+        while len(buffer) >= self.tamanho_lote:
+            excedente = buffer[self.tamanho_lote:]
+            del buffer[self.tamanho_lote:]
+            self._descarregar(tabela)
+            buffer = self._buffers[tabela]
+            buffer.extend(excedente)
+
+    def fechar(self):
+        self._descarregar(TABELAS[-1])
+        for futuro in self._pendentes:
+            futuro.result()
+        self._executor.shutdown()
+
+class FixturesStrava:
+    """Atividades no formato da API do Strava, uma por linha (JSON Lines)."""
+
+    def __init__(self, caminho):
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self.caminho = caminho
+        self._arquivo = open(caminho, "w", encoding="utf-8")
+
+    def gravar(self, atividades):
+        self._arquivo.writelines(json.dumps(act, ensure_ascii=False) + "\n" for act in atividades)
+
+    def fechar(self):
+        self._arquivo.close()
+        print(f"🗂️ Fixtures do Strava em {self.caminho}")
+
+def gerar_dados_carga(atletas, anos, destinos=(), fixtures=None, semente=SEMENTE_PADRAO, primeiro=0, agora=None):
+    """Gera o roster e grava em cada destino. Retorna (atletas, atividades) gerados."""
+    agora = agora or datetime.now(timezone.utc).replace(microsecond=0)
+    inicio = agora - timedelta(days=int(365 * anos))
+    total_atividades = 0
+    t0 = time.perf_counter()
+
+    for n, (perfil, atividades) in enumerate(gerar_roster(atletas, inicio, agora, semente, primeiro), start=1):
+        usuario = linha_usuario(perfil)
+        auth = linha_auth(perfil, atividades, agora)
+        linhas = linhas_atividades(perfil, atividades)
+        for destino in destinos:
+            destino.gravar("usuarios_app", [usuario])
+            destino.gravar("auth_strava", [auth])
+            destino.gravar("atividades_fisicas", linhas)
+        if fixtures:
+            fixtures.gravar(atividades)
+        total_atividades += len(atividades)
+
+        if n % 500 == 0 or n == atletas:
+            decorrido = time.perf_counter() - t0
+            print(f"   ⏳ {n}/{atletas} atletas, {total_atividades} atividades ({total_atividades / max(decorrido, 1e-9):.0f}/s)")
+
+    for destino in destinos:
+        destino.fechar()
+    if fixtures:
+        fixtures.fechar()
+    return atletas, total_atividades
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera atletas e anos de treinos sintéticos para teste de carga.")
+    parser.add_argument("--atletas", type=int, default=1000)
+    parser.add_argument("--anos", type=float, default=2)
+    parser.add_argument("--destino", choices=("csv", "supabase", "nenhum"), default="csv")
+    parser.add_argument("--saida", default="dados_carga", help="pasta dos CSVs")
+    parser.add_argument("--fixtures-strava", help="grava também as atividades no formato do Strava (JSON Lines)")
+    parser.add_argument("--semente", type=int, default=SEMENTE_PADRAO)
+    parser.add_argument("--ate", help="fim do histórico (AAAA-MM-DD, padrão: agora); fixa também as datas")
+    parser.add_argument("--primeiro", type=int, default=0, help="índice do primeiro atleta (para dividir entre processos)")
+    parser.add_argument("--lote", type=int, default=1000, help="linhas por upsert no destino supabase")
+    parser.add_argument("--workers", type=int, default=4, help="upserts de atividades em paralelo no destino supabase")
+    args = parser.parse_args(argv)
+
+    destinos = []
+    if args.destino == "csv":
+        destinos.append(DestinoCsv(args.saida))
+    elif args.destino == "supabase":
+        from modules.conexao import obter_supabase
+        destinos.append(DestinoSupabase(obter_supabase(), args.lote, args.workers))
+    fixtures = FixturesStrava(args.fixtures_strava) if args.fixtures_strava else None
+
+    inicio = time.perf_counter()
+    agora = datetime.fromisoformat(args.ate).replace(tzinfo=timezone.utc) if args.ate else None
+    atletas, atividades = gerar_dados_carga(args.atletas, args.anos, destinos, fixtures, args.semente, args.primeiro, agora)
+    print(f"✅ {atletas} atletas e {atividades} atividades gerados em {time.perf_counter() - inicio:.1f}s.")
 
 if __name__ == "__main__":
-    gerar_treinos_ficticios()
\ No newline at end of file
+    main()
@@ -0,0 +1,219 @@
+import os
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+
+from auth_strava import obter_token_valido
+from modules.carga import DIAS_MES, JanelaCarga, para_data
+from modules.agendador_strava import tem_cota_no_dia, CotaDiariaEsgotada, PRIORIDADE_BAIXA
+from modules.logs import obter_logger
+from processar_fila import supabase, buscar_pagina_strava, persistir_atividades, atualizar_painel, POR_PAGINA_STRAVA
+
+log = obter_logger("historico")
+
+# Status possíveis da importação de histórico (coluna auth_strava.backfill_status)
+BACKFILL_PENDENTE = "pendente"
+BACKFILL_CONCLUIDO = "concluido"
+
+# Reivindicação no banco expira (processo caiu) e outro processo retoma a importação
+EXPIRACAO_REIVINDICACAO_SEG = 300
+
+ID_TRABALHADOR = f"{socket.gethostname()}-{os.getpid()}"
+
+# Atletas com importação rodando neste processo (evita duas threads para o mesmo atleta)
+_em_andamento = set()
+_trava_em_andamento = threading.Lock()
+
+def _epoch_inicio(act):
+    """start_date (UTC) da atividade em segundos desde 1970."""
+    try:
+        return int(datetime.fromisoformat(act['start_date'].replace("Z", "+00:00")).timestamp())
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+
+def reivindicar_importacao(user_id):
+    """Reivindica (ou renova, a cada página) a importação do atleta para este processo."""
+    res = supabase.rpc("reivindicar_backfill", {
+        "p_user_id": user_id,
+        "p_trabalhador": ID_TRABALHADOR,
+        "p_expiracao_seg": EXPIRACAO_REIVINDICACAO_SEG,
+    }).execute()
+    return bool(res.data)
+
+def liberar_importacao(user_id):
+    supabase.rpc("liberar_backfill", {"p_user_id": user_id, "p_trabalhador": ID_TRABALHADOR}).execute()
+
+def corrigir_cargas_existentes(user_id, strava_ids):
+    """
+    Recalcula a carga 7d/30d de treinos que já estavam no banco antes da importação
+    (gravados pelo sync de 7 dias ou por webhook, sem o histórico que veio depois).
+    A janela de cada um só olha para trás, então basta ler os 30 dias anteriores ao
+    mais antigo deles até o mais novo (1 consulta) e regravar os que mudaram.
+    Retorna quantos foram corrigidos.
+    """
+    if not strava_ids:
+        return 0
+    res = (supabase.table("atividades_fisicas").select("strava_id, data_treino")
+           .in_("strava_id", list(strava_ids)).execute())
+    datas = sorted(para_data(linha['data_treino']) for linha in (res.data or []) if linha.get('data_treino'))
+    if not datas:
+        return 0
+
+    res = (supabase.table("atividades_fisicas").select("id, strava_id, data_treino, trimp_score, trimp_semanal, trimp_mensal")
+           .eq("id_atleta", user_id)
+           .gte("data_treino", (datas[0] - timedelta(days=DIAS_MES)).isoformat())
+           .lte("data_treino", datas[-1].isoformat())
+           .order("data_treino").order("id").execute())
+
+    janela = JanelaCarga()
+    corrigidos = 0
+    for linha in (res.data or []):
+        if not linha.get('data_treino'):
+            continue
+        carga = janela.adicionar(linha['data_treino'], linha.get('trimp_score'))
+        if str(linha['strava_id']) in strava_ids and carga != (linha.get('trimp_semanal'), linha.get('trimp_mensal')):
+            supabase.table("atividades_fisicas").update(
+                {"trimp_semanal": carga[0], "trimp_mensal": carga[1]}
+            ).eq("strava_id", linha['strava_id']).execute()
+            corrigidos += 1
+    if corrigidos:
+        atualizar_painel(user_id)
+    return corrigidos
+
+def importar_historico_atleta(user_id):
+    """
+    Importa TODO o histórico do atleta no Strava, do treino mais antigo ao mais novo.
+
+    - Páginas de 200 atividades com `after=<checkpoint>`: o Strava devolve em ordem
+      crescente, então o checkpoint é simplesmente o start_date da última atividade gravada.
+    - Depois de cada página o checkpoint é salvo em auth_strava.backfill_cursor; se o
+      processo cair, a próxima chamada continua de onde parou.
+    - Só uma página e a janela de 30 dias ficam em memória, e a mesma JanelaCarga
+      atravessa todas as páginas, então a carga 7d/30d de cada treino antigo fica correta.
+    - Nenhum WhatsApp é enviado para treinos importados.
+    - Treinos da página que já estavam no banco não são regravados, mas a carga deles é
+      recalculada com o histórico importado (corrigir_cargas_existentes).
+    - Antes de cada página a reivindicação no banco é renovada; se outro processo
+      assumiu (a nossa expirou), esta execução para sem gravar mais nada.
+    """
+    auth_db = supabase.table("auth_strava").select("user_id, backfill_cursor, backfill_status").eq("user_id", user_id).execute()
+    if not auth_db.data:
+        log.warning(f"⚠️ [HISTÓRICO] Atleta {user_id} sem vínculo com o Strava.")
+        return False
+
+    if auth_db.data[0].get('backfill_status') == BACKFILL_CONCLUIDO:
+        return True
+
+    u_info_db = supabase.table("usuarios_app").select("nome, telefone, fc_maxima").eq("id", user_id).execute()
+    if not u_info_db.data:
+        log.warning(f"⚠️ [HISTÓRICO] Aluno {user_id} não encontrado na tabela usuarios_app.")
+        return False
+    u_data = u_info_db.data[0]
+
+    after_date = int(auth_db.data[0].get('backfill_cursor') or 0)
+    log.info(f"📚 [HISTÓRICO] Importando histórico de {u_data['nome']} a partir de {after_date}...")
+
+    janela = JanelaCarga.carregar(supabase, user_id, desde=datetime.fromtimestamp(after_date, timezone.utc))
+    total = 0
+
+    while True:
+        if not reivindicar_importacao(user_id):
+            log.info(f"⏭️ [HISTÓRICO] Importação de {u_data['nome']} reivindicada por outro processo. Checkpoint mantido em {after_date}.")
+            return False
+
+        token = obter_token_valido(user_id)
+        if not token:
+            log.error(f"❌ [HISTÓRICO] Sem token válido para {u_data['nome']}. Checkpoint mantido em {after_date}.")
+            return False
+
+        # Sempre a página 1 a partir do checkpoint: retomar não depende de numeração de páginas
+        try:
+            atividades = buscar_pagina_strava(token, after_date, pagina=1, prioridade=PRIORIDADE_BAIXA, user_id=user_id)
+        except CotaDiariaEsgotada:
+            log.info(f"⏸️ [HISTÓRICO] Sem cota diária do Strava para {u_data['nome']}. Checkpoint mantido em {after_date}.")
+            return False
+        if atividades is None:
+            log.error(f"❌ [HISTÓRICO] Strava recusou a página de {u_data['nome']}. Checkpoint mantido em {after_date}.")
+            return False
+
+        if atividades:
+            pulados = persistir_atividades(atividades, user_id, u_data, janela=janela, notificar=False)
+            corrigir_cargas_existentes(user_id, pulados)
+            total += len(atividades)
+            after_date = max([after_date] + [e for e in map(_epoch_inicio, atividades) if e])
+
+        concluido = len(atividades) < POR_PAGINA_STRAVA
+        checkpoint = {"backfill_cursor": after_date}
+        if concluido:
+            checkpoint["backfill_status"] = BACKFILL_CONCLUIDO
+        supabase.table("auth_strava").update(checkpoint).eq("user_id", user_id).execute()
+
+        if concluido:
+            log.info(f"✅ [HISTÓRICO] {u_data['nome']}: {total} atividade(s) lidas nesta execução. Histórico completo.")
+            return True
+
+def _executar_importacao(user_id):
+    try:
+        importar_historico_atleta(user_id)
+    except Exception as e:
+        log.exception(f"❌ [HISTÓRICO] Erro ao importar histórico de {user_id}: {e}")
+    finally:
+        try:
+            liberar_importacao(user_id)
+        except Exception as e:
+            log.warning(f"⚠️ [HISTÓRICO] Não consegui liberar a importação de {user_id}: {e}")
+        with _trava_em_andamento:
+            _em_andamento.discard(user_id)
+
+def iniciar_importacao_historico(user_id):
+    """
+    Dispara a importação do histórico em segundo plano (thread daemon) e retorna na hora.
+    Se o atleta já estiver sendo importado neste processo, ou se outro processo tem a
+    reivindicação no banco, não abre outra thread.
+    """
+    with _trava_em_andamento:
+        if user_id in _em_andamento:
+            return False
+        _em_andamento.add(user_id)
+
+    try:
+        reivindicado = reivindicar_importacao(user_id)
+    except Exception as e:
+        log.error(f"❌ [HISTÓRICO] Erro ao reivindicar a importação de {user_id}: {e}")
+        reivindicado = False
+    if not reivindicado:
+        with _trava_em_andamento:
+            _em_andamento.discard(user_id)
+        return False
+
+    threading.Thread(target=_executar_importacao, args=(user_id,), daemon=True, name=f"historico-{user_id}").start()
+    return True
+
+def retomar_importacoes_pendentes():
+    """
+    Retoma (em segundo plano) as importações que ficaram pela metade, p.ex. após um restart.
+    Só pega as que ninguém reivindicou ou cuja reivindicação expirou (o processo dono caiu).
+    Sem cota diária do Strava para a importação, espera o próximo ciclo.
+    """
+    if not tem_cota_no_dia(PRIORIDADE_BAIXA):
+        return
+    limite = (datetime.now(timezone.utc) - timedelta(seconds=EXPIRACAO_REIVINDICACAO_SEG)).isoformat()
+    pendentes = (
+        supabase.table("auth_strava").select("user_id")
+        .eq("backfill_status", BACKFILL_PENDENTE)
+        .or_(f"backfill_reivindicado_em.is.null,backfill_reivindicado_em.lt.{limite}")
+        .execute()
+    )
+    for linha in (pendentes.data or []):
+        iniciar_importacao_historico(linha['user_id'])
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        try:
+            importar_historico_atleta(sys.argv[1])
+        finally:
+            liberar_importacao(sys.argv[1])
+    else:
+        print("Uso: python importar_historico.py <user_id>")
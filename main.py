@@ -2,8 +2,6 @@ import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import requests
-from supabase import create_client
 from datetime import datetime, timedelta, date
 import math 
 import threading
@@ -14,13 +12,21 @@ import uuid
 # Importação dos módulos customizados
 from modules.ui import aplicar_estilo_css, exibir_logo_rodape, estilizar_botoes
 from modules.views import renderizar_tela_admin, renderizar_tela_bloqueio_financeiro, enviar_notificacao_treino, renderizar_edicao_perfil
+from modules.agendador_strava import requisitar_strava, tem_cota_no_dia, PRIORIDADE_ALTA, PRIORIDADE_NORMAL
+from modules.conexao import obter_supabase
+from modules.painel import quadro_treinos_atleta, pagina_treinos, resumo_treinos, snapshot_painel, memorizar
+from modules import metricas, perfil
+from modules.logs import obter_logger
+
+# Perfil desta execução do script, se pedido (PERFIL_CAPTURAR=rerun ou painel admin)
+perfil.capturar_execucao_script("rerun")
 
 # ============================================================================
 # IMPORTAÇÕES COM TRATAMENTO DE ERRO (REALINHADO)
 # ============================================================================
 try:
-    from processar_fila import processar_novos_treinos
-    from auth_strava import obter_token_valido
+    from processar_fila import processar_novos_treinos, iniciar_sync_atleta
+    from auth_strava import obter_token_valido, descartar_token
 except ImportError:
     st.error("Arquivo processar_fila.py não encontrado ou função ausente!")
 
@@ -29,14 +35,20 @@ except ImportError:
 # ============================================================================
 st.set_page_config(page_title="Zaptreino", layout="wide", page_icon="🏃‍♂️")
 
-supabase_client = create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+# Um cliente só por processo (modules/conexao), reaproveitado entre reruns e pelas threads de fundo
+try:
+    supabase = obter_supabase()
+except Exception as e:
+    st.error(f"Erro de conexão: {e}")
+    st.stop()
+supabase_client = supabase
 
 query_params = st.query_params
 if "code" in query_params:
     strava_code = query_params["code"]
     with st.spinner("Finalizando conexão..."):
         try:
-            res = requests.post("https://www.strava.com/oauth/token", data={
+            res = requisitar_strava("POST", "/oauth/token", prioridade=PRIORIDADE_ALTA, data={
                 'client_id': st.secrets["STRAVA_CLIENT_ID"],
                 'client_secret': st.secrets["STRAVA_CLIENT_SECRET"],
                 'code': strava_code,
@@ -48,14 +60,19 @@ if "code" in query_params:
                     u_id = st.session_state.user_info['id']
                     dados_auth = {
                         "user_id": u_id,
+                        "athlete_id": res.get('athlete', {}).get('id'),
                         "access_token": res['access_token'],
                         "refresh_token": res['refresh_token'],
-                        "expires_at": res['expires_at']
+                        "expires_at": res['expires_at'],
+                        "backfill_status": "pendente"
                     }
                     supabase_client.table("auth_strava").upsert(dados_auth).execute()
+                    # O token antigo foi revogado pela reconexão: não pode seguir no cache
+                    descartar_token(u_id)
                     
-                    from processar_fila import processar_novos_treinos
-                    processar_novos_treinos(u_id, origem_botao=True)
+                    # Importa o histórico completo em segundo plano (não segura o redirect do OAuth)
+                    from importar_historico import iniciar_importacao_historico
+                    iniciar_importacao_historico(u_id)
                     
                     st.success("✅ Conectado com sucesso!")
                     st.query_params.clear() 
@@ -64,56 +81,95 @@ if "code" in query_params:
         except Exception as e:
             st.error(f"Erro ao processar retorno do Strava: {e}")
 
-try:
-    supabase = create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
-except Exception as e:
-    st.error(f"Erro de conexão: {e}")
-    st.stop()
-
 aplicar_estilo_css()
 estilizar_botoes()
 
 # ============================================================================
 # 2. SERVIÇO VIGILANTE (BACKGROUND)
 # ============================================================================
+# De quanto em quanto tempo o vigilante olha quem está com o poll vencido.
+# Cada atleta tem o seu proximo_poll_em (modules/agenda_polling), então a maioria
+# dos ciclos só toca em poucos atletas.
+INTERVALO_VIGILANTE_SEG = int(st.secrets.get("VIGILANTE_INTERVALO_SEG", 15 * 60))
+
 def servico_vigilante_30min():
+    from modules.lideranca import LeaseServico
+    log = obter_logger("vigilante")
+    
+    # Só o processo que segura o lease "vigilante" roda a varredura; as outras
+    # réplicas ficam de reserva e assumem sozinhas se o líder cair.
+    lease = LeaseServico(obter_supabase(), "vigilante")
+    lease.iniciar_heartbeat()
+    proximo_ciclo = 0
+    
     while True:
-        try:
-            print(f"🔄 Vigilante iniciando varredura de atletas às {datetime.now().strftime('%H:%M:%S')}...")
-            
-            # 1. Importações locais forçadas para garantir o escopo na Thread
-            from processar_fila import processar_novos_treinos
-            from supabase import create_client
-            import streamlit as st
-            
-            # 2. Criamos uma instância local do cliente Supabase para a Thread usar
-            sub_client = create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
-            
-            # 3. Busca todos os usuários cadastrados que não são administradores
-            resposta_usuarios = sub_client.table("usuarios_app").select("id").eq("is_admin", False).execute()
-            
-            if resposta_usuarios.data:
-                for atleta in resposta_usuarios.data:
-                    atleta_id = atleta.get("id")
-                    if atleta_id:
-                        try:
-                            # 4. Processa os treinos individualmente passando o ID correto
-                            processar_novos_treinos(atleta_id)
-                            print(f"   ✅ Atleta {atleta_id} verificado com sucesso.")
-                        except Exception as erro_atleta:
-                            print(f"   ❌ Erro ao processar atleta {atleta_id}: {erro_atleta}")
+        if not lease.lider:
+            # Outro processo assumiu: se a liderança voltar para cá, o ciclo roda logo de
+            # cara. Numa falha passageira de renovação a agenda continua a mesma.
+            if lease.outro_dono:
+                proximo_ciclo = 0
+        elif time.time() >= proximo_ciclo and not tem_cota_no_dia(PRIORIDADE_NORMAL):
+            # O que sobra da cota do dia é das ações do usuário: pula o ciclo sem bloquear
+            log.info("⏸️ Vigilante: sem cota diária do Strava, ciclo pulado.")
+            proximo_ciclo = time.time() + INTERVALO_VIGILANTE_SEG
+        elif time.time() >= proximo_ciclo:
+            try:
+                log.info("🔄 Vigilante iniciando varredura de atletas...")
+                
+                with perfil.capturar("vigilante"), metricas.medir("vigilante_ciclo"):
+                    # 1. Importação local forçada para garantir o escopo na Thread
+                    from processar_fila import processar_novos_treinos
+                    
+                    # 2. Um único ciclo sobre todo o roster (view roster_sincronizacao, já sem
+                    #    bloqueados/vencidos/admins): o motor de sincronização processa os atletas
+                    #    em paralelo (SYNC_MAX_WORKERS) e isola a falha de cada um. O lease é
+                    #    renovado entre os lotes: se outro processo assumiu, o ciclo para ali.
+                    processar_novos_treinos(pre_renovar=True, continuar=lease.adquirir)
+                    
+                    # 3. Retoma importações de histórico interrompidas (ex.: restart no meio do backfill)
+                    if lease.adquirir():
+                        from importar_historico import retomar_importacoes_pendentes
+                        retomar_importacoes_pendentes()
+                
+                if lease.lider:
+                    log.info("✅ Vigilante: Ciclo completo concluído com sucesso!")
+                else:
+                    log.warning("⏹️ Vigilante: liderança perdida no meio do ciclo; o novo líder continua.")
+            except Exception as e:
+                log.exception(f"❌ Erro Crítico Geral no Vigilante: {e}")
             
-            print(f"✅ Vigilante: Ciclo completo concluído com sucesso!")
-        except Exception as e:
-            print(f"❌ Erro Crítico Geral no Vigilante: {e}")
+            proximo_ciclo = time.time() + INTERVALO_VIGILANTE_SEG
         
-        time.sleep(1800) # Aguarda 30 minutos para o próximo ciclo
+        # Acorda a cada renovação do lease para perceber rápido uma troca de líder
+        time.sleep(lease.ttl_seg / 3)
 
 if not hasattr(st, "vigilante_ativo"):
     t = threading.Thread(target=servico_vigilante_30min, daemon=True)
     t.start()
     st.vigilante_ativo = True
 
+# /metrics dos workers deste processo (só se METRICAS_PORTA estiver configurada).
+# cache_resource: sobe uma vez por processo, não a cada rerun da página.
+@st.cache_resource
+def iniciar_metricas():
+    return metricas.iniciar_servidor_metricas()
+
+iniciar_metricas()
+
+# Worker que consome webhook_events: atividade nova chega em segundos
+if not hasattr(st, "webhook_worker_ativo"):
+    from processar_webhooks import servico_webhooks
+    t_webhooks = threading.Thread(target=servico_webhooks, daemon=True)
+    t_webhooks.start()
+    st.webhook_worker_ativo = True
+
+# Worker que entrega a outbox de WhatsApp (o sync só enfileira as notificações)
+if not hasattr(st, "notificacao_worker_ativo"):
+    from processar_notificacoes import servico_notificacoes
+    t_notificacoes = threading.Thread(target=servico_notificacoes, daemon=True)
+    t_notificacoes.start()
+    st.notificacao_worker_ativo = True
+
 # ============================================================================
 # 3. GESTÃO DE SESSÃO
 # ============================================================================
@@ -137,7 +193,7 @@ if not st.session_state.logado and target_id:
         if auth_code:
             try:
                 # URL CORRIGIDA E UNIFICADA DO STRAVA AQUI:
-                response = requests.post("https://www.strava.com/oauth/token",
+                response = requisitar_strava("POST", "/oauth/token", prioridade=PRIORIDADE_ALTA,
                     data={
                         'client_id': st.secrets["STRAVA_CLIENT_ID"],
                         'client_secret': st.secrets["STRAVA_CLIENT_SECRET"],
@@ -151,11 +207,14 @@ if not st.session_state.logado and target_id:
                         "athlete_id": response.get('athlete', {}).get('id'),
                         "access_token": response['access_token'],
                         "refresh_token": response.get('refresh_token'),
-                        "expires_at": response.get('expires_at')
+                        "expires_at": response.get('expires_at'),
+                        "backfill_status": "pendente"
                     }).execute()
-                    processar_novos_treinos(target_id)
+                    descartar_token(target_id)
+                    from importar_historico import iniciar_importacao_historico
+                    iniciar_importacao_historico(target_id)
             except Exception as e:
-                print(f"Erro no OAuth Strava: {e}")
+                obter_logger("oauth").exception(f"❌ Erro no OAuth Strava: {e}")
 
         st.query_params.clear()
         st.query_params["session_id"] = target_id
@@ -177,6 +236,105 @@ def gerar_grafico_analise(df, titulo, dias=7):
     fig.update_layout(template="plotly_white", height=350, margin=dict(l=10, r=10, t=50, b=10), showlegend=False, title=titulo)
     return fig
 
+# ============================================================================
+# 4.1 PAINEL DO ALUNO
+# ============================================================================
+# De quanto em quanto tempo o painel se atualiza enquanto o sync da sessão roda
+INTERVALO_ACOMPANHAMENTO_SEG = 1.5
+
+def renderizar_painel_aluno(user):
+    """
+    Totais, histórico e gráficos do aluno. Roda como fragmento: filtros e páginas
+    reexecutam só este trecho, e enquanto o sync da sessão está rodando ele se
+    atualiza sozinho (barra de progresso e treinos aparecendo conforme são gravados).
+    """
+    tarefa = st.session_state.get('sync_inicial')
+    if tarefa is not None and tarefa.em_andamento:
+        st.progress(tarefa.progresso, text=f"🔄 {tarefa.mensagem}")
+    elif tarefa is not None and not st.session_state.get('sync_inicial_avisado'):
+        # O sync terminou durante o acompanhamento: uma execução completa desliga a atualização automática
+        st.rerun()
+
+    # Retrato do painel (painel_atleta), gravado pelo sync depois de cada escrita: totais,
+    # últimos treinos já rotulados, série de 30 dias e status de carga numa linha só
+    snapshot = snapshot_painel(supabase_client, user['id'])
+
+    if snapshot['total_treinos']:
+        m1, m2, m3 = st.columns(3)
+        m1.metric("Total Treinos", int(snapshot['total_treinos']))
+        m2.metric("Km Acumulados", f"{float(snapshot['km_total']):.1f}")
+        m3.metric("Carga Média", f"{int(float(snapshot['trimp_medio']))}")
+        status = snapshot.get('status_carga')
+        if status:
+            st.caption(f"Carga atual: 7 dias {status['trimp_semanal']} {status['emoji_semana']} · 30 dias {status['trimp_mensal']} {status['emoji_mensal']}")
+
+        # --- HISTÓRICO (filtros e páginas por keyset, consultados no servidor) ---
+        f1, f2 = st.columns([1, 2])
+        periodo = f1.date_input("Período", value=(), format="DD/MM/YYYY", key="historico_periodo")
+        busca = f2.text_input("Buscar atividade", placeholder="Ex.: Longão, Intervalado...", key="historico_busca")
+        desde = periodo[0] if len(periodo) > 0 else None
+        ate = periodo[1] if len(periodo) > 1 else desde
+
+        # Filtro novo volta para a primeira página
+        filtro = (str(desde), str(ate), busca.strip())
+        if st.session_state.get('historico_filtro') != filtro:
+            st.session_state['historico_filtro'] = filtro
+            st.session_state['historico_cursores'] = [None]
+        cursores = st.session_state['historico_cursores']
+
+        if desde or busca.strip():
+            filtrado = resumo_treinos(supabase_client, user['id'], desde, ate, busca)
+            st.caption(f"🔎 {filtrado['total_treinos']} treino(s) · {filtrado['km_total']:.1f} km · carga média {int(filtrado['trimp_medio'])}")
+
+        # Linhas já rotuladas (tempo e semáforos): a primeira página sem filtro vem pronta no retrato
+        linhas, proximo = pagina_treinos(supabase_client, user['id'], cursores[-1], desde, ate, busca)
+        df_historico = pd.DataFrame(linhas, columns=['data_treino', 'name', 'distancia', 'duracao_formatada', 'carga_diaria', 'carga_7d', 'carga_30d'])
+
+        st.dataframe(
+            df_historico, 
+            width='stretch', 
+            hide_index=True,
+            column_config={
+                "data_treino": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+                "name": st.column_config.TextColumn("Atividade", width="large"),
+                "distancia": st.column_config.NumberColumn("Km", format="%.2f"),
+                "duracao_formatada": st.column_config.TextColumn("Tempo"),
+                "carga_diaria": st.column_config.TextColumn("TRIMP 🟢"),
+                "carga_7d": st.column_config.TextColumn("7 Dias 📊"),
+                "carga_30d": st.column_config.TextColumn("30 Dias 📈"),
+            }
+        )
+
+        p1, p2, p3 = st.columns([1, 2, 1])
+        if p1.button("⬅️ Mais recentes", disabled=len(cursores) == 1, key="historico_anterior"):
+            cursores.pop()
+            st.rerun(scope="fragment")
+        p2.caption(f"Página {len(cursores)}")
+        if p3.button("Mais antigos ➡️", disabled=proximo is None, key="historico_proximo"):
+            cursores.append(proximo)
+            st.rerun(scope="fragment")
+
+        st.markdown("---")
+        with st.expander("❓ Entenda as Cores da Carga (Semáforo)"):
+            c1, c2, c3 = st.columns(3)
+            c1.info("**Diario**\n\n🟢 < 70\n\n🟡 71-150\n\n🔴 > 150")
+            c2.warning("**Semanal**\n\n🟢 < 400\n\n🟡 401-800\n\n🔴 > 800")
+            c3.error("**Mensal**\n\n🟢 < 1500\n\n🟡 1501-3000\n\n🔴 > 3000")
+
+        # Gráficos da série de 30 dias do retrato, montados uma vez por dia até o retrato mudar
+        def montar_graficos():
+            df = quadro_treinos_atleta(supabase_client, user['id'])
+            return gerar_grafico_analise(df, "Últimos 7 dias", 7), gerar_grafico_analise(df, "Últimos 30 dias", 30)
+
+        c1, c2 = st.columns(2)
+        g1, g2 = memorizar(supabase_client, user['id'], ("graficos", date.today().isoformat()), montar_graficos)
+        if g1: c1.plotly_chart(g1, width='stretch')
+        if g2: c2.plotly_chart(g2, width='stretch')
+    elif tarefa is not None and tarefa.em_andamento:
+        st.info("Buscando seus treinos no Strava... eles aparecem aqui assim que forem gravados.")
+    else:
+        st.info("Nenhum treino encontrado. Conecte seu Strava!")
+
 # ============================================================================
 # 5. ROTEAMENTO DE TELAS E NOVO DESIGN DE LOGIN
 # ============================================================================
@@ -461,68 +619,22 @@ else:
         
     else:
         # TELA DO ALUNO (ACESSO LIBERADO)
+        # Sync inicial em segundo plano: o painel abre na hora com o que já está no cache/banco
+        # (outra aba do mesmo atleta reaproveita a tarefa que já estiver rodando)
         if 'sync_inicial' not in st.session_state:
-            with st.spinner("Sincronizando seus treinos agora..."):
-                processar_novos_treinos(user['id'], origem_botao=True)
-                st.session_state['sync_inicial'] = True
+            st.session_state['sync_inicial'] = iniciar_sync_atleta(user['id'], origem_botao=True)
 
         st.title(f"E aí, {user['nome'].split()[0]}! ⚡")
         
-        res_t = supabase_client.table("atividades_fisicas").select(
-            "data_treino, name, distancia, duracao, trimp_score, trimp_semanal, trimp_mensal"
-        ).eq("id_atleta", user['id']).order("data_treino", desc=True).execute()
-        
-        if res_t.data:
-            df = pd.DataFrame(res_t.data)
-            df['duracao_formatada'] = df['duracao'].apply(lambda x: f"{int(x)//60:02d}:{int(x)%60:02d}" if pd.notna(x) else "00:00")
-            
-            m1, m2, m3 = st.columns(3)
-            m1.metric("Total Treinos", len(df))
-            m2.metric("Km Acumulados", f"{df['distancia'].sum():.1f}")
-            m3.metric("Carga Média", f"{int(df['trimp_score'].mean())}")
-            
-            def formatar_carga(valor, tipo):
-                if pd.isna(valor) or valor == 0: return "-"
-                if tipo == 'dia':
-                    emoji = "🟢" if valor <= 70 else "🟡" if valor <= 150 else "🔴"
-                elif tipo == 'sem':
-                    emoji = "🟢" if valor <= 400 else "🟡" if valor <= 800 else "🔴"
-                else: 
-                    emoji = "🟢" if valor <= 1500 else "🟡" if valor <= 3000 else "🔴"
-                return f"{int(valor)} {emoji}"
-
-            df['Carga Diária'] = df['trimp_score'].apply(lambda x: formatar_carga(x, 'dia'))
-            df['Carga 7 Dias'] = df['trimp_semanal'].apply(lambda x: formatar_carga(x, 'sem'))
-            df['Carga 30 Dias'] = df['trimp_mensal'].apply(lambda x: formatar_carga(x, 'men'))
-
-            st.dataframe(
-                df[['data_treino', 'name', 'distancia', 'duracao_formatada', 'Carga Diária', 'Carga 7 Dias', 'Carga 30 Dias']].head(15), 
-                width='stretch', 
-                hide_index=True,
-                column_config={
-                    "data_treino": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
-                    "name": st.column_config.TextColumn("Atividade", width="large"),
-                    "distancia": st.column_config.NumberColumn("Km", format="%.2f"),
-                    "duracao_formatada": st.column_config.TextColumn("Tempo"),
-                    "Carga Diária": st.column_config.TextColumn("TRIMP 🟢"),
-                    "Carga 7 Dias": st.column_config.TextColumn("7 Dias 📊"),
-                    "Carga 30 Dias": st.column_config.TextColumn("30 Dias 📈"),
-                }
-            )
-
-            st.markdown("---")
-            with st.expander("❓ Entenda as Cores da Carga (Semáforo)"):
-                c1, c2, c3 = st.columns(3)
-                c1.info("**Diario**\n\n🟢 < 70\n\n🟡 71-150\n\n🔴 > 150")
-                c2.warning("**Semanal**\n\n🟢 < 400\n\n🟡 401-800\n\n🔴 > 800")
-                c3.error("**Mensal**\n\n🟢 < 1500\n\n🟡 1501-3000\n\n🔴 > 3000")
-
-            c1, c2 = st.columns(2)
-            g1 = gerar_grafico_analise(df, "Últimos 7 dias", 7)
-            g2 = gerar_grafico_analise(df, "Últimos 30 dias", 30)
-            if g1: c1.plotly_chart(g1, width='stretch')
-            if g2: c2.plotly_chart(g2, width='stretch')
-        else:
-            st.info("Nenhum treino encontrado. Conecte seu Strava!")
+        tarefa = st.session_state['sync_inicial']
+        if not tarefa.em_andamento and not st.session_state.get('sync_inicial_avisado'):
+            st.session_state['sync_inicial_avisado'] = True
+            if tarefa.erro:
+                st.toast(tarefa.mensagem, icon="⚠️")
+            else:
+                st.toast(tarefa.mensagem, icon="✅")
+
+        intervalo = INTERVALO_ACOMPANHAMENTO_SEG if tarefa.em_andamento else None
+        st.fragment(run_every=intervalo)(renderizar_painel_aluno)(user)
 
 exibir_logo_rodape()
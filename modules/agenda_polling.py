@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+
+# Limites do intervalo entre duas consultas ao Strava para o mesmo atleta
+INTERVALO_MINIMO = timedelta(minutes=30)
+INTERVALO_SEM_HISTORICO = timedelta(hours=12)
+
+# Teto do intervalo conforme há quanto tempo o atleta não treina
+TETOS_POR_INATIVIDADE = [
+    (timedelta(days=3), timedelta(hours=6)),     # treina com frequência
+    (timedelta(days=14), timedelta(hours=12)),   # treino esporádico
+    (timedelta(days=60), timedelta(hours=24)),   # parado
+]
+TETO_DORMENTE = timedelta(hours=48)
+
+# Webhook cobriu o atleta recentemente: o polling vira só conferência
+JANELA_WEBHOOK = timedelta(hours=48)
+FATOR_WEBHOOK = 3
+
+# Peso das atividades antigas no histograma (cada atividade nova multiplica o resto por isto)
+DECAIMENTO_HISTOGRAMA = 0.95
+
+# Fração do "volume esperado de uploads" que precisa ter passado para valer a pena consultar
+LIMIAR_PROBABILIDADE = 0.15
+
+def _instante(valor):
+    if not valor:
+        return None
+    if isinstance(valor, datetime):
+        return valor if valor.tzinfo else valor.replace(tzinfo=timezone.utc)
+    try:
+        instante = datetime.fromisoformat(str(valor).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return instante if instante.tzinfo else instante.replace(tzinfo=timezone.utc)
+
+def hora_upload(act):
+    """Hora UTC (0-23) em que a atividade terminou, que é quando o upload costuma chegar."""
+    inicio = _instante(act.get('start_date'))
+    if not inicio:
+        return None
+    fim = inicio + timedelta(seconds=act.get('elapsed_time') or act.get('moving_time') or 0)
+    return fim.hour
+
+def atualizar_histograma(histograma, atividades):
+    """Soma as atividades novas no histograma de 24 horas (com decaimento das antigas)."""
+    horas = list(histograma) if histograma and len(histograma) == 24 else [0.0] * 24
+    for act in atividades:
+        hora = hora_upload(act)
+        if hora is None:
+            continue
+        horas = [h * DECAIMENTO_HISTOGRAMA for h in horas]
+        horas[hora] += 1.0
+    return [round(h, 4) for h in horas]
+
+def _teto(ultima_atividade, agora):
+    if not ultima_atividade:
+        return INTERVALO_SEM_HISTORICO
+    parado = agora - ultima_atividade
+    for limite, teto in TETOS_POR_INATIVIDADE:
+        if parado <= limite:
+            return teto
+    return TETO_DORMENTE
+
+def calcular_proximo_poll(histograma, ultima_atividade_em=None, ultimo_webhook_em=None, agora=None):
+    """
+    Próximo horário em que vale a pena consultar o Strava para este atleta.
+
+    - O teto do intervalo cresce com os dias sem treino (6h para quem treina sempre,
+      até 48h para contas paradas) e é multiplicado se um webhook cobriu o atleta há pouco.
+    - Dentro do teto, anda hora a hora somando a probabilidade de upload de cada hora
+      (histograma); a consulta é marcada logo depois que passou uma fatia relevante
+      dela. Quem treina às 6h é consultado às 7h/8h, não de hora em hora de madrugada.
+    """
+    agora = agora or datetime.now(timezone.utc)
+    ultima_atividade = _instante(ultima_atividade_em)
+    ultimo_webhook = _instante(ultimo_webhook_em)
+
+    teto = _teto(ultima_atividade, agora)
+    if ultimo_webhook and agora - ultimo_webhook <= JANELA_WEBHOOK:
+        teto = min(teto * FATOR_WEBHOOK, TETO_DORMENTE)
+
+    total = sum(histograma or [])
+    if not total:
+        return agora + teto
+
+    # Soma a probabilidade de upload das horas que vão passando, até o teto
+    acumulado = 0.0
+    horas_teto = int(teto.total_seconds() // 3600)
+    for passo in range(1, horas_teto + 1):
+        instante = agora + timedelta(hours=passo)
+        acumulado += histograma[(instante.hour - 1) % 24] / total
+        if acumulado >= LIMIAR_PROBABILIDADE:
+            return agora + max(timedelta(hours=passo), INTERVALO_MINIMO)
+
+    return agora + teto
@@ -0,0 +1,257 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from modules import http_cliente, metricas
+from modules.logs import obter_logger
+
+log = obter_logger("strava")
+
+# Endereço da API do Strava (pode ser trocado para um servidor local de testes)
+URL_BASE_STRAVA = os.getenv("STRAVA_API_BASE", "https://www.strava.com").rstrip("/")
+
+# Prioridades (menor número sai primeiro da fila)
+PRIORIDADE_ALTA = 0      # ações do usuário: OAuth, botão de sincronizar, renovação de token
+PRIORIDADE_NORMAL = 5    # vigilante e webhooks
+PRIORIDADE_BAIXA = 9     # importação de histórico
+
+# Fração da cota diária guardada para as prioridades mais altas: abaixo dela, quem tem
+# a prioridade indicada (ou mais baixa) recebe CotaDiariaEsgotada na hora, em vez de
+# esperar o dia virar. Ações do usuário não têm reserva.
+RESERVA_DIARIA = {
+    PRIORIDADE_NORMAL: 0.1,
+    PRIORIDADE_BAIXA: 0.3,
+}
+
+JANELA_CURTA_SEG = 15 * 60
+TENTATIVAS_429 = 3
+
+class CotaDiariaEsgotada(Exception):
+    """O que sobra da cota diária do Strava é reserva de prioridades mais altas."""
+
+def _segundos_ate_virada_15min(agora):
+    """O Strava zera a cota curta nos minutos 0, 15, 30 e 45 de cada hora (UTC)."""
+    passados = (agora.minute % 15) * 60 + agora.second + agora.microsecond / 1e6
+    return JANELA_CURTA_SEG - passados
+
+def _segundos_ate_virada_dia(agora):
+    """A cota diária zera à meia-noite UTC."""
+    return 86400 - (agora.hour * 3600 + agora.minute * 60 + agora.second)
+
+def _ler_par(valor):
+    try:
+        curto, diario = (int(x) for x in str(valor).split(",")[:2])
+        return curto, diario
+    except (TypeError, ValueError):
+        return None
+
+class AgendadorStrava:
+    """
+    Agendador global (por processo) de todas as chamadas ao Strava.
+
+    - Acompanha a cota usada pelos cabeçalhos X-RateLimit-Limit/Usage (e os de leitura,
+      X-ReadRateLimit-*, quando vierem) de cada resposta.
+    - Um balde de fichas libera as chamadas num ritmo que distribui o que resta da cota
+      de 15 minutos pelo tempo que falta até ela virar, guardando uma reserva para ações
+      do usuário.
+    - A cota diária não entra no ritmo: cada prioridade tem uma reserva (RESERVA_DIARIA)
+      e só é atendida enquanto sobrar mais que ela do dia, então a importação de histórico
+      para primeiro e o vigilante depois, sem frear ninguém enquanto o dia tem folga.
+      Quem chega sem cota no dia recebe CotaDiariaEsgotada na hora (não fica horas na
+      fila): o ciclo é pulado e tenta de novo depois.
+    - Em 429 (ou cota esgotada) segura todo mundo até a janela virar e tenta de novo.
+    - Chamadas esperando são atendidas por prioridade e, dentro dela, por ordem de chegada.
+    """
+
+    def __init__(self, limite_15min=200, limite_diario=2000, reserva=0.1, rajada=10, reserva_diaria=None):
+        self.limite_15min = limite_15min
+        self.limite_diario = limite_diario
+        self.uso_15min = 0
+        self.uso_diario = 0
+        self.reserva = reserva
+        self.reserva_diaria = RESERVA_DIARIA if reserva_diaria is None else reserva_diaria
+        self.rajada = rajada
+
+        self._cond = threading.Condition()
+        self._fila = []
+        self._seq = itertools.count()
+        self._fichas = float(rajada)
+        self._ultimo_reabastecimento = time.monotonic()
+        self._bloqueado_ate = 0.0
+        self._janela_curta = None
+        self._dia = None
+        self.total_429 = 0
+
+    # ------------------------------------------------------------------ cota
+    def _virar_janelas(self, agora):
+        janela = (agora.date(), agora.hour, agora.minute // 15)
+        if janela != self._janela_curta:
+            self._janela_curta = janela
+            self.uso_15min = 0
+        if agora.date() != self._dia:
+            self._dia = agora.date()
+            self.uso_diario = 0
+
+    def _taxa_por_segundo(self, agora):
+        """Quantas chamadas por segundo ainda cabem na janela de 15 minutos (fora a reserva)."""
+        restante_curto = self.limite_15min * (1 - self.reserva) - self.uso_15min
+        if restante_curto <= 0:
+            return 0.0
+        return restante_curto / max(_segundos_ate_virada_15min(agora), 1)
+
+    def _cabe_no_dia(self, prioridade):
+        """Se ainda sobra da cota diária mais que a reserva guardada acima desta prioridade."""
+        reserva = max((fracao for nivel, fracao in self.reserva_diaria.items() if nivel <= prioridade), default=0.0)
+        return self.uso_diario < self.limite_diario * (1 - reserva)
+
+    def tem_cota_no_dia(self, prioridade):
+        """Se uma chamada com esta prioridade ainda seria atendida hoje."""
+        with self._cond:
+            self._virar_janelas(datetime.now(timezone.utc))
+            return self._cabe_no_dia(prioridade)
+
+    def _tem_cota_bruta(self):
+        return self.uso_15min < self.limite_15min and self.uso_diario < self.limite_diario
+
+    def _reabastecer(self):
+        agora_mono = time.monotonic()
+        agora = datetime.now(timezone.utc)
+        self._virar_janelas(agora)
+        taxa = self._taxa_por_segundo(agora)
+        self._fichas = min(self.rajada, self._fichas + (agora_mono - self._ultimo_reabastecimento) * taxa)
+        self._ultimo_reabastecimento = agora_mono
+        return agora_mono, taxa
+
+    def registrar_resposta(self, resposta):
+        """Atualiza a cota com os cabeçalhos que o Strava devolveu."""
+        pares = []
+        for prefixo in ("X-RateLimit", "X-ReadRateLimit"):
+            limite = _ler_par(resposta.headers.get(f"{prefixo}-Limit"))
+            uso = _ler_par(resposta.headers.get(f"{prefixo}-Usage"))
+            if limite and uso:
+                pares.append((limite, uso))
+
+        with self._cond:
+            self._virar_janelas(datetime.now(timezone.utc))
+            if pares:
+                # Fica com o par mais apertado (menor folga proporcional)
+                (lim_c, lim_d), (uso_c, uso_d) = min(
+                    pares, key=lambda p: min(1 - p[1][0] / max(p[0][0], 1), 1 - p[1][1] / max(p[0][1], 1))
+                )
+                self.limite_15min, self.limite_diario = lim_c, lim_d
+                self.uso_15min, self.uso_diario = uso_c, uso_d
+            self._cond.notify_all()
+
+    def _bloquear(self, segundos):
+        with self._cond:
+            self._bloqueado_ate = max(self._bloqueado_ate, time.monotonic() + segundos)
+            self._cond.notify_all()
+
+    # ------------------------------------------------------------------ fila
+    def _aguardar_vez(self, prioridade):
+        with self._cond:
+            ticket = (prioridade, next(self._seq))
+            heapq.heappush(self._fila, ticket)
+            while True:
+                agora_mono, taxa = self._reabastecer()
+                if not self._cabe_no_dia(prioridade):
+                    self._fila.remove(ticket)
+                    heapq.heapify(self._fila)
+                    self._cond.notify_all()
+                    raise CotaDiariaEsgotada(
+                        f"Cota diária do Strava na reserva ({self.uso_diario}/{self.limite_diario}) para a prioridade {prioridade}."
+                    )
+
+                livre = agora_mono >= self._bloqueado_ate
+                # Ações do usuário podem usar a reserva enquanto houver cota de verdade
+                pode_usar_reserva = prioridade == PRIORIDADE_ALTA and self._tem_cota_bruta()
+                if self._fila[0] == ticket and livre and (self._fichas >= 1 or pode_usar_reserva):
+                    heapq.heappop(self._fila)
+                    self._fichas = max(self._fichas - 1, 0.0)
+                    self._cond.notify_all()
+                    return
+
+                if not livre:
+                    espera = self._bloqueado_ate - agora_mono
+                elif taxa > 0:
+                    espera = (1 - self._fichas) / taxa
+                else:
+                    espera = _segundos_ate_virada_15min(datetime.now(timezone.utc))
+                self._cond.wait(timeout=min(max(espera, 0.05), 5.0))
+
+    def requisitar(self, metodo, url, prioridade=PRIORIDADE_NORMAL, **kwargs):
+        """
+        Faz a chamada ao Strava respeitando a cota. Devolve a resposta (inclusive um 429 final).
+        Levanta CotaDiariaEsgotada se o que resta do dia é reserva de prioridades mais altas.
+        """
+        for tentativa in range(TENTATIVAS_429 + 1):
+            with metricas.medir("strava_fila", prioridade=prioridade):
+                self._aguardar_vez(prioridade)
+            metricas.contar("idas_e_voltas", destino="strava")
+            with metricas.medir("strava_http"):
+                resposta = http_cliente.requisitar(metodo, url, **kwargs)
+            self.registrar_resposta(resposta)
+            metricas.contar("strava_respostas", status=resposta.status_code)
+
+            if resposta.status_code != 429:
+                return resposta
+
+            self.total_429 += 1
+            metricas.contar("retentativas", destino="strava")
+            retry_after = resposta.headers.get("Retry-After")
+            if retry_after and str(retry_after).isdigit():
+                espera = int(retry_after)
+            elif self.uso_diario >= self.limite_diario:
+                espera = _segundos_ate_virada_dia(datetime.now(timezone.utc))
+            elif self.uso_15min >= self.limite_15min:
+                espera = _segundos_ate_virada_15min(datetime.now(timezone.utc))
+            else:
+                espera = 2 ** tentativa
+            log.warning(f"⏳ 429 recebido. Segurando as chamadas por {int(espera)}s (tentativa {tentativa + 1}).")
+            self._bloquear(espera)
+
+        return resposta
+
+    def estado(self):
+        """Resumo da cota para diagnóstico."""
+        with self._cond:
+            return {
+                "uso_15min": self.uso_15min,
+                "limite_15min": self.limite_15min,
+                "uso_diario": self.uso_diario,
+                "limite_diario": self.limite_diario,
+                "na_fila": len(self._fila),
+                "total_429": self.total_429,
+            }
+
+# Instância única compartilhada por todos os módulos do processo
+agendador = AgendadorStrava(
+    limite_15min=int(os.getenv("STRAVA_LIMITE_15MIN", 200)),
+    limite_diario=int(os.getenv("STRAVA_LIMITE_DIARIO", 2000)),
+)
+
+@metricas.registrar_coletor
+def _metricas_cota():
+    estado = agendador.estado()
+    return [
+        ("strava_cota_uso", estado["uso_15min"], {"janela": "15min"}),
+        ("strava_cota_uso", estado["uso_diario"], {"janela": "diaria"}),
+        ("strava_cota_limite", estado["limite_15min"], {"janela": "15min"}),
+        ("strava_cota_limite", estado["limite_diario"], {"janela": "diaria"}),
+        ("strava_fila_espera", estado["na_fila"], None),
+    ]
+
+def tem_cota_no_dia(prioridade=PRIORIDADE_NORMAL):
+    """Se ainda há cota diária para esta prioridade (para pular um ciclo antes de começar)."""
+    return agendador.tem_cota_no_dia(prioridade)
+
+def requisitar_strava(metodo, caminho_ou_url, prioridade=PRIORIDADE_NORMAL, **kwargs):
+    """
+    Ponto único de saída para o Strava. Aceita URL completa ou caminho
+    ('/api/v3/athlete/activities'), que é resolvido contra URL_BASE_STRAVA.
+    """
+    url = caminho_ou_url if caminho_ou_url.startswith("http") else f"{URL_BASE_STRAVA}{caminho_ou_url}"
+    return agendador.requisitar(metodo, url, prioridade=prioridade, **kwargs)
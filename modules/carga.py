@@ -0,0 +1,127 @@
+import math
+from collections import deque
+from datetime import date, datetime, timedelta
+
+from modules.logs import obter_logger
+
+log = obter_logger("carga")
+
+# Tamanho das janelas de carga acumulada (mesma regra usada nas mensagens e no painel)
+DIAS_SEMANA = 7
+DIAS_MES = 30
+
+# Semáforo da carga: até o 1º limite 🟢, até o 2º 🟡, acima 🔴 (treino, 7 dias e 30 dias)
+LIMITES_CARGA = {
+    'dia': (70, 150),
+    'sem': (400, 800),
+    'men': (1500, 3000),
+}
+
+def emoji_carga(valor, tipo):
+    """Cor do semáforo para a carga `valor` ('dia', 'sem' ou 'men')."""
+    amarelo, vermelho = LIMITES_CARGA[tipo]
+    return "🟢" if valor <= amarelo else "🟡" if valor <= vermelho else "🔴"
+
+def formatar_carga(valor, tipo):
+    """'123 🟡' para o painel; '-' sem carga."""
+    if valor is None or valor != valor or valor == 0:
+        return "-"
+    return f"{int(valor)} {emoji_carga(valor, tipo)}"
+
+def calcular_trimp_banister(duracao_min, fc_media, fc_max, fc_repouso=60):
+    """Calcula a carga de treino baseada na FC Máxima individual do aluno."""
+    if not fc_media or fc_media <= 0: 
+        return int(duracao_min * 1.5)
+    
+    max_heart = fc_max if fc_max and fc_max > 0 else 185
+    
+    try:
+        reserva = (fc_media - fc_repouso) / (max_heart - fc_repouso)
+        reserva = max(0, min(reserva, 1)) 
+        
+        trimp = duracao_min * reserva * 0.64 * math.exp(1.92 * reserva)
+        return int(trimp)
+    except Exception as e:
+        log.warning(f"⚠️ Erro no cálculo TRIMP: {e}")
+        return int(duracao_min * 1.5)
+
+def para_data(valor):
+    """Converte date, datetime ou texto 'YYYY-MM-DD...' em date."""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return datetime.strptime(str(valor)[:10], '%Y-%m-%d').date()
+
+class JanelaCarga:
+    """
+    Acumulador de carga (TRIMP) em janela móvel de 7 e 30 dias para UM atleta.
+
+    O histórico dos últimos 30 dias é carregado uma única vez; depois cada treino novo
+    é somado em ordem cronológica com custo O(1) amortizado, e o total devolvido já
+    enxerga os treinos somados antes dele no mesmo lote.
+    Uma janela inclui todos os treinos com data >= (dia do treino - N dias).
+    """
+
+    def __init__(self, historico=()):
+        # historico: iterável de (data_treino, trimp) já gravados no banco
+        itens = sorted(((para_data(d), t or 0) for d, t in historico if d), key=lambda item: item[0])
+        self._pendentes = deque(itens)
+        self._janela_7d = deque()
+        self._janela_30d = deque()
+        self._soma_7d = 0
+        self._soma_30d = 0
+        self._dia_atual = None
+
+    @classmethod
+    def carregar(cls, supabase, user_id, desde=None, ignorar_strava_ids=()):
+        """
+        Lê do banco (1 consulta) os treinos do atleta a partir de 30 dias antes de `desde`.
+        `ignorar_strava_ids` tira da janela os treinos que serão somados de novo no lote
+        (reprocessamento), para que não contem duas vezes.
+        """
+        inicio = para_data(desde or date.today()) - timedelta(days=DIAS_MES)
+        res = supabase.table("atividades_fisicas").select("strava_id, trimp_score, data_treino").eq("id_atleta", user_id).gte("data_treino", inicio.isoformat()).execute()
+
+        ignorar = {str(s) for s in ignorar_strava_ids}
+        historico = [
+            (r.get('data_treino'), r.get('trimp_score') or 0)
+            for r in (res.data or [])
+            if str(r.get('strava_id')) not in ignorar
+        ]
+        return cls(historico)
+
+    def _avancar(self, dia):
+        if self._dia_atual and dia < self._dia_atual:
+            raise ValueError("Os treinos devem ser somados na JanelaCarga em ordem cronológica.")
+        self._dia_atual = dia
+
+        # Traz para a janela o histórico que já aconteceu até este dia
+        while self._pendentes and self._pendentes[0][0] <= dia:
+            self._entrar(*self._pendentes.popleft())
+
+        # Descarta o que saiu de cada janela
+        limite_7d = dia - timedelta(days=DIAS_SEMANA)
+        while self._janela_7d and self._janela_7d[0][0] < limite_7d:
+            self._soma_7d -= self._janela_7d.popleft()[1]
+        limite_30d = dia - timedelta(days=DIAS_MES)
+        while self._janela_30d and self._janela_30d[0][0] < limite_30d:
+            self._soma_30d -= self._janela_30d.popleft()[1]
+
+    def _entrar(self, dia, trimp):
+        self._janela_7d.append((dia, trimp))
+        self._janela_30d.append((dia, trimp))
+        self._soma_7d += trimp
+        self._soma_30d += trimp
+
+    def adicionar(self, data_treino, trimp):
+        """Soma um treino novo e devolve (carga_7d, carga_30d) já incluindo ele."""
+        dia = para_data(data_treino)
+        self._avancar(dia)
+        self._entrar(dia, trimp or 0)
+        return int(self._soma_7d), int(self._soma_30d)
+
+    def totais(self, referencia=None):
+        """Carga (7d, 30d) no dia de referência (padrão: hoje), sem somar treino novo."""
+        self._avancar(para_data(referencia or date.today()))
+        return int(self._soma_7d), int(self._soma_30d)
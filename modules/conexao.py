@@ -0,0 +1,50 @@
+import os
+import threading
+
+from supabase import create_client
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+_cliente = None
+_trava_cliente = threading.Lock()
+
+def ler_config(chave, padrao=None):
+    """
+    Lê uma configuração do st.secrets (app Streamlit) e, se não houver, do ambiente/.env
+    (scripts, api_strava, workers rodando fora do Streamlit).
+    """
+    try:
+        import streamlit as st
+        if chave in st.secrets:
+            return st.secrets[chave]
+    except Exception:
+        # Fora do Streamlit (ou sem secrets.toml) o st.secrets não está disponível
+        pass
+    return os.getenv(chave, padrao)
+
+def definir_supabase(cliente):
+    """Troca o cliente do processo (ex.: banco local do bench/). Chamar antes de importar os workers."""
+    global _cliente
+    with _trava_cliente:
+        _cliente = cliente
+    return cliente
+
+def obter_supabase():
+    """
+    Cliente Supabase único do processo, compartilhado por todas as threads
+    (vigilante, worker de webhooks, importação de histórico) e pelos reruns do Streamlit:
+    o módulo fica importado entre reruns, então a sessão HTTP com o PostgREST é reaproveitada.
+    """
+    global _cliente
+    if _cliente is None:
+        with _trava_cliente:
+            if _cliente is None:
+                url, chave = ler_config("SUPABASE_URL"), ler_config("SUPABASE_KEY")
+                if not url or not chave:
+                    raise RuntimeError("SUPABASE_URL/SUPABASE_KEY não configurados (st.secrets ou .env).")
+                _cliente = create_client(url, chave)
+    return _cliente
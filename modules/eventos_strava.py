@@ -0,0 +1,131 @@
+import threading
+from collections import OrderedDict
+
+from modules import metricas
+
+# Quantas chaves de eventos recentes ficam na memória para barrar reentregas do Strava
+CAPACIDADE_INDICE_EVENTOS = 10000
+
+def chave_evento(dados_evento):
+    """
+    Identidade de um evento do Strava. Reentregas repetem exatamente estes campos;
+    é a mesma expressão da coluna gerada webhook_events.chave_evento.
+    """
+    return ":".join(str(dados_evento.get(campo, "")) for campo in
+                    ("owner_id", "object_type", "object_id", "aspect_type", "event_time"))
+
+class IndiceEventosRecentes:
+    """Conjunto LRU limitado das chaves de eventos já vistos neste processo."""
+
+    def __init__(self, capacidade=CAPACIDADE_INDICE_EVENTOS):
+        self.capacidade = capacidade
+        self._chaves = OrderedDict()
+        self._trava = threading.Lock()
+
+    def contem(self, chave):
+        with self._trava:
+            return chave in self._chaves
+
+    def registrar(self, chave):
+        """Marca a chave como vista. Retorna True se ela já tinha sido vista (reentrega)."""
+        with self._trava:
+            if chave in self._chaves:
+                self._chaves.move_to_end(chave)
+                return True
+            self._chaves[chave] = True
+            if len(self._chaves) > self.capacidade:
+                self._chaves.popitem(last=False)
+            return False
+
+class EstatisticasWebhook:
+    """Contadores do ingresso de webhooks (quantas buscas ao Strava a coalescência poupou)."""
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._valores = {"recebidos": 0, "duplicados": 0, "acoes": 0, "coalescidos": 0, "buscas_economizadas": 0}
+
+    def somar(self, **incrementos):
+        with self._trava:
+            for nome, valor in incrementos.items():
+                self._valores[nome] = self._valores.get(nome, 0) + valor
+
+    def resumo(self):
+        with self._trava:
+            return dict(self._valores)
+
+# Dois índices separados: no mesmo processo, um evento que a API já enfileirou ainda
+# precisa ser aplicado pelo worker.
+eventos_enfileirados = IndiceEventosRecentes()  # api_strava: já gravados em webhook_events
+eventos_aplicados = IndiceEventosRecentes()     # processar_webhooks: ação já aplicada
+estatisticas = EstatisticasWebhook()
+
+def estatisticas_webhooks():
+    return estatisticas.resumo()
+
+@metricas.registrar_coletor
+def _metricas_webhooks():
+    return [("webhooks_" + nome, valor, None) for nome, valor in estatisticas.resumo().items()]
+
+def coalescer_eventos(eventos):
+    """
+    Junta os eventos pendentes de uma mesma atividade (owner_id, object_id) numa ação só.
+
+    - delete ganha de tudo (não adianta buscar uma atividade que vai ser apagada);
+    - create seguido de updates vira um create (1 busca, e ainda notifica como novo);
+    - vários updates viram um update.
+    Eventos que não são de atividade passam um a um. Reentregas já vistas (pela chave
+    do evento) são separadas para só serem marcadas como processadas. As chaves só
+    entram no índice depois que a ação é aplicada (ver registrar_aplicados).
+
+    Retorna (acoes, ids_duplicados), onde cada ação é um dict com
+    'dados_evento' (o evento representativo) e 'ids' (todos os eventos que ela cobre).
+    """
+    grupos = OrderedDict()
+    avulsos = []
+    duplicados = []
+
+    for evento in eventos:
+        dados_evento = evento.get('event_data') or {}
+        if eventos_aplicados.contem(chave_evento(dados_evento)):
+            duplicados.append(evento['id'])
+            continue
+
+        if dados_evento.get('object_type') != "activity":
+            avulsos.append({"dados_evento": dados_evento, "ids": [evento['id']], "chaves": [chave_evento(dados_evento)]})
+            continue
+
+        chave = (dados_evento.get('owner_id'), dados_evento.get('object_id'))
+        grupos.setdefault(chave, []).append((evento['id'], dados_evento))
+
+    acoes = list(avulsos)
+    buscas_economizadas = 0
+    for itens in grupos.values():
+        tipos = {dados.get('aspect_type') for _, dados in itens}
+        if "delete" in tipos:
+            acao = "delete"
+            buscas_economizadas += sum(1 for _, dados in itens if dados.get('aspect_type') != "delete")
+        else:
+            acao = "create" if "create" in tipos else "update"
+            buscas_economizadas += len(itens) - 1
+
+        # O evento mais recente representa o grupo, com a ação resultante
+        representativo = dict(itens[-1][1], aspect_type=acao)
+        acoes.append({
+            "dados_evento": representativo,
+            "ids": [id_evento for id_evento, _ in itens],
+            "chaves": [chave_evento(dados) for _, dados in itens],
+        })
+
+    estatisticas.somar(
+        recebidos=len(eventos),
+        duplicados=len(duplicados),
+        acoes=len(acoes),
+        coalescidos=len(eventos) - len(duplicados) - len(acoes),
+        buscas_economizadas=buscas_economizadas,
+    )
+    return acoes, duplicados
+
+def registrar_aplicados(acao):
+    """Depois de aplicar uma ação, lembra das chaves dela para barrar reentregas futuras."""
+    for chave in acao.get("chaves", []):
+        eventos_aplicados.registrar(chave)
@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from modules import metricas
+from modules.logs import obter_logger
+
+log = obter_logger("http")
+
+# Timeouts padrão de toda chamada externa (segundos): nenhuma requisição fica pendurada
+TIMEOUT_CONEXAO = float(os.getenv("HTTP_TIMEOUT_CONEXAO", 5))
+TIMEOUT_LEITURA = float(os.getenv("HTTP_TIMEOUT_LEITURA", 20))
+
+# Conexões mantidas abertas (keep-alive) por processo
+MAX_CONEXOES = int(os.getenv("HTTP_MAX_CONEXOES", 50))
+MAX_CONEXOES_OCIOSAS = int(os.getenv("HTTP_MAX_CONEXOES_OCIOSAS", 20))
+
+# HTTP/2 é opcional: só liga se pedido e se o pacote h2 estiver instalado
+HTTP2_ATIVO = os.getenv("HTTP2_ATIVO", "0").lower() in ("1", "true", "sim")
+
+_cliente = None
+_trava_cliente = threading.Lock()
+
+_latencias = {}
+_trava_latencias = threading.Lock()
+
+def _http2_disponivel():
+    if not HTTP2_ATIVO:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        log.warning("⚠️ [HTTP] HTTP2_ATIVO ligado, mas o pacote 'h2' não está instalado. Usando HTTP/1.1.")
+        return False
+
+def obter_cliente():
+    """
+    Cliente HTTP único do processo (Strava, Mercado Pago, OAuth...).
+    Reaproveita conexões TCP+TLS por host, aplica timeouts padrão e descompacta
+    respostas gzip/deflate (e brotli, se o pacote estiver instalado).
+    """
+    global _cliente
+    if _cliente is None:
+        with _trava_cliente:
+            if _cliente is None:
+                _cliente = httpx.Client(
+                    http2=_http2_disponivel(),
+                    timeout=httpx.Timeout(TIMEOUT_LEITURA, connect=TIMEOUT_CONEXAO),
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONEXOES,
+                        max_keepalive_connections=MAX_CONEXOES_OCIOSAS,
+                    ),
+                    follow_redirects=True,
+                )
+    return _cliente
+
+def _registrar_latencia(host, segundos, erro=False):
+    with _trava_latencias:
+        est = _latencias.setdefault(host, {"chamadas": 0, "erros": 0, "total_ms": 0.0, "max_ms": 0.0})
+        ms = segundos * 1000
+        est["chamadas"] += 1
+        est["total_ms"] += ms
+        est["max_ms"] = max(est["max_ms"], ms)
+        if erro:
+            est["erros"] += 1
+
+def requisitar(metodo, url, **kwargs):
+    """
+    Faz uma requisição pelo cliente compartilhado, medindo a latência por host.
+    Aceita os mesmos argumentos usados com `requests` (headers, params, data, json, timeout).
+    """
+    host = urlsplit(url).netloc
+    inicio = time.perf_counter()
+    try:
+        resposta = obter_cliente().request(metodo, url, **kwargs)
+    except Exception:
+        _registrar_latencia(host, time.perf_counter() - inicio, erro=True)
+        raise
+    _registrar_latencia(host, time.perf_counter() - inicio, erro=resposta.status_code >= 500)
+    return resposta
+
+def get(url, **kwargs):
+    return requisitar("GET", url, **kwargs)
+
+def post(url, **kwargs):
+    return requisitar("POST", url, **kwargs)
+
+def estatisticas_hosts():
+    """Contadores de latência por host: chamadas, erros, média e máximo em ms."""
+    with _trava_latencias:
+        return {
+            host: {
+                "chamadas": est["chamadas"],
+                "erros": est["erros"],
+                "media_ms": round(est["total_ms"] / est["chamadas"], 1) if est["chamadas"] else 0.0,
+                "max_ms": round(est["max_ms"], 1),
+            }
+            for host, est in _latencias.items()
+        }
+
+@metricas.registrar_coletor
+def _metricas_hosts():
+    medidores = []
+    for host, est in estatisticas_hosts().items():
+        medidores.append(("http_chamadas", est["chamadas"], {"host": host}))
+        medidores.append(("http_erros", est["erros"], {"host": host}))
+        medidores.append(("http_latencia_media_ms", est["media_ms"], {"host": host}))
+    return medidores
@@ -0,0 +1,73 @@
+import os
+import socket
+import threading
+import uuid
+
+from modules.logs import obter_logger
+
+log = obter_logger("lideranca")
+
+# Validade do lease (segundos) e quantas renovações cabem dentro dela
+TTL_LEASE_SEG = int(os.getenv("LEASE_TTL_SEG", 90))
+RENOVACOES_POR_TTL = 3
+
+class LeaseServico:
+    """
+    Lease no banco (tabela lease_servicos) para que só UM processo da implantação rode
+    um serviço de fundo. Um heartbeat em thread própria adquire/renova o lease a cada
+    ttl/3; `lider` diz se este processo é o dono agora. Se o líder morrer, o lease
+    expira em até `ttl_seg` e o próximo heartbeat de outro processo assume.
+    `outro_dono` distingue as duas formas de não ser líder: True quando o banco recusou
+    porque outro processo segura o lease; False numa falha passageira de banco.
+    """
+
+    def __init__(self, supabase, nome, ttl_seg=None):
+        self.supabase = supabase
+        self.nome = nome
+        self.ttl_seg = ttl_seg or TTL_LEASE_SEG
+        self.dono = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.lider = False
+        self.outro_dono = False
+        self._parar = threading.Event()
+        self._thread = None
+
+    def adquirir(self):
+        """Adquire ou renova o lease. Em erro de banco assume que NÃO é líder."""
+        try:
+            res = self.supabase.rpc("adquirir_lease", {
+                "p_nome": self.nome,
+                "p_dono": self.dono,
+                "p_ttl_seg": self.ttl_seg,
+            }).execute()
+            lider = bool(res.data)
+            self.outro_dono = not lider
+        except Exception as e:
+            log.warning(f"⚠️ [LEASE] Falha ao renovar lease '{self.nome}': {e}")
+            lider = False
+
+        if lider != self.lider:
+            log.info(f"👑 [LEASE] {self.dono} {'assumiu' if lider else 'perdeu'} o serviço '{self.nome}'.")
+        self.lider = lider
+        return lider
+
+    def liberar(self):
+        self._parar.set()
+        if self.lider:
+            try:
+                self.supabase.rpc("liberar_lease", {"p_nome": self.nome, "p_dono": self.dono}).execute()
+            except Exception as e:
+                log.warning(f"⚠️ [LEASE] Falha ao liberar lease '{self.nome}': {e}")
+        self.lider = False
+
+    def _heartbeat(self):
+        intervalo = self.ttl_seg / RENOVACOES_POR_TTL
+        while not self._parar.is_set():
+            self.adquirir()
+            self._parar.wait(intervalo)
+
+    def iniciar_heartbeat(self):
+        """Liga o heartbeat (thread daemon). Pode ser chamado mais de uma vez."""
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._heartbeat, daemon=True, name=f"lease-{self.nome}")
+            self._thread.start()
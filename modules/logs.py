@@ -0,0 +1,50 @@
+"""
+Logging com nível e amostragem para os workers (sync, tokens, notificações, vigilante).
+
+LOG_NIVEL escolhe o nível mínimo (DEBUG, INFO, WARNING...; padrão INFO).
+LOG_AMOSTRA_DEBUG (0 a 1) é a fração das mensagens DEBUG que sai de fato: o detalhe
+por atividade/chamada fica em DEBUG e pode ser ligado em produção só numa amostra.
+INFO para cima nunca é amostrado.
+"""
+import logging
+import os
+import random
+import threading
+
+NIVEL_PADRAO = os.getenv("LOG_NIVEL", "INFO").upper()
+AMOSTRA_DEBUG = float(os.getenv("LOG_AMOSTRA_DEBUG", 1.0))
+FORMATO = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+_configurado = False
+_trava = threading.Lock()
+
+class FiltroAmostragem(logging.Filter):
+    """Deixa passar só uma fração das mensagens abaixo de INFO."""
+
+    def __init__(self, amostra):
+        super().__init__()
+        self.amostra = amostra
+
+    def filter(self, record):
+        return record.levelno >= logging.INFO or self.amostra >= 1 or random.random() < self.amostra
+
+def _configurar():
+    global _configurado
+    with _trava:
+        if _configurado:
+            return
+        raiz = logging.getLogger("zaptreino")
+        raiz.setLevel(getattr(logging, NIVEL_PADRAO, logging.INFO))
+        if not raiz.handlers:
+            saida = logging.StreamHandler()
+            saida.setFormatter(logging.Formatter(FORMATO))
+            saida.addFilter(FiltroAmostragem(AMOSTRA_DEBUG))
+            raiz.addHandler(saida)
+        # O Streamlit configura o logger raiz; aqui a saída é só a nossa
+        raiz.propagate = False
+        _configurado = True
+
+def obter_logger(nome):
+    """Logger 'zaptreino.<nome>' já configurado."""
+    _configurar()
+    return logging.getLogger(f"zaptreino.{nome}")
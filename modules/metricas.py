@@ -0,0 +1,285 @@
+"""
+Métricas do processo (contadores, tempos por etapa e coletores) e rastreamento opcional.
+
+- `medir("etapa", **rotulos)`: cronometra um trecho (with ou decorator) e soma no
+  histograma zaptreino_etapa_segundos; exceções contam em zaptreino_etapa_erros_total.
+- `medir_banco(operacao, tabela)`: idem para uma ida ao Supabase, contando também
+  zaptreino_idas_e_voltas_total{destino="banco"}.
+- `contar("nome", **rotulos)`: contador simples.
+- `registrar_coletor(funcao)`: valores lidos na hora da exportação (cota do Strava etc.).
+
+Rótulos precisam ter poucos valores (etapa, tabela, status): nada de user_id.
+Com METRICAS_TRACE=<arquivo>, cada trecho medido vira uma linha JSON (span, pai,
+etapa, início, duração) nesse arquivo; METRICAS_TRACE_AMOSTRA (0 a 1) escolhe a fração
+dos trechos raiz gravados (os filhos seguem a decisão do pai).
+Com METRICAS_PORTA, `iniciar_servidor_metricas()` publica /metrics (Prometheus) e
+/metrics.json neste processo.
+"""
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from modules.logs import obter_logger
+
+log = obter_logger("metricas")
+
+PREFIXO = "zaptreino"
+
+# Limites (segundos) dos baldes dos histogramas de tempo
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+ARQUIVO_TRACE = os.getenv("METRICAS_TRACE")
+AMOSTRA_TRACE = float(os.getenv("METRICAS_TRACE_AMOSTRA", 1.0))
+PORTA_METRICAS = int(os.getenv("METRICAS_PORTA", 0))
+
+def _chave(nome, rotulos):
+    return nome, tuple(sorted((k, str(v)) for k, v in rotulos.items() if v is not None))
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _formatar_rotulos(rotulos):
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in rotulos) + "}"
+
+class RegistroMetricas:
+    """Contadores e histogramas do processo, seguros entre threads."""
+
+    def __init__(self, limites=LIMITES_SEGUNDOS):
+        self.limites = limites
+        self._contadores = {}
+        self._histogramas = {}
+        self._coletores = []
+        self._trava = threading.Lock()
+
+    def contar(self, nome, valor=1, **rotulos):
+        chave = _chave(nome, rotulos)
+        with self._trava:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome, segundos, **rotulos):
+        chave = _chave(nome, rotulos)
+        with self._trava:
+            hist = self._histogramas.get(chave)
+            if hist is None:
+                hist = self._histogramas[chave] = {"baldes": [0] * len(self.limites), "soma": 0.0, "contagem": 0, "max": 0.0}
+            for i, limite in enumerate(self.limites):
+                if segundos <= limite:
+                    hist["baldes"][i] += 1
+            hist["soma"] += segundos
+            hist["contagem"] += 1
+            hist["max"] = max(hist["max"], segundos)
+
+    def registrar_coletor(self, funcao):
+        """`funcao()` devolve uma lista de (nome, valor, rotulos) lida na hora da exportação."""
+        with self._trava:
+            self._coletores.append(funcao)
+        return funcao
+
+    def _coletar(self):
+        valores = []
+        for funcao in list(self._coletores):
+            try:
+                valores.extend(funcao())
+            except Exception:
+                # Um coletor quebrado não pode derrubar a exportação inteira
+                continue
+        return valores
+
+    def zerar(self):
+        with self._trava:
+            self._contadores.clear()
+            self._histogramas.clear()
+
+    def instantaneo(self):
+        """Tudo num dict serializável em JSON."""
+        with self._trava:
+            contadores = [{"nome": n, "rotulos": dict(r), "valor": v} for (n, r), v in sorted(self._contadores.items())]
+            etapas = [
+                {
+                    "nome": n, "rotulos": dict(r), "contagem": h["contagem"],
+                    "soma_s": round(h["soma"], 6),
+                    "media_ms": round(h["soma"] / h["contagem"] * 1000, 2) if h["contagem"] else 0.0,
+                    "max_ms": round(h["max"] * 1000, 2),
+                }
+                for (n, r), h in sorted(self._histogramas.items())
+            ]
+        medidores = [{"nome": n, "rotulos": r or {}, "valor": v} for n, v, r in self._coletar()]
+        return {"contadores": contadores, "tempos": etapas, "medidores": medidores}
+
+    def prometheus(self):
+        """Formato texto de exposição do Prometheus."""
+        linhas = []
+        with self._trava:
+            contadores = sorted(self._contadores.items())
+            histogramas = sorted((k, dict(v, baldes=list(v["baldes"]))) for k, v in self._histogramas.items())
+
+        vistos = set()
+        for (nome, rotulos), valor in contadores:
+            metrica = f"{PREFIXO}_{nome}_total"
+            if metrica not in vistos:
+                linhas.append(f"# TYPE {metrica} counter")
+                vistos.add(metrica)
+            linhas.append(f"{metrica}{_formatar_rotulos(rotulos)} {valor}")
+
+        for (nome, rotulos), hist in histogramas:
+            metrica = f"{PREFIXO}_{nome}_segundos"
+            if metrica not in vistos:
+                linhas.append(f"# TYPE {metrica} histogram")
+                vistos.add(metrica)
+            for limite, acumulado in zip(self.limites, hist["baldes"]):
+                linhas.append(f"{metrica}_bucket{_formatar_rotulos(rotulos + (('le', str(limite)),))} {acumulado}")
+            linhas.append(f"{metrica}_bucket{_formatar_rotulos(rotulos + (('le', '+Inf'),))} {hist['contagem']}")
+            linhas.append(f"{metrica}_sum{_formatar_rotulos(rotulos)} {round(hist['soma'], 6)}")
+            linhas.append(f"{metrica}_count{_formatar_rotulos(rotulos)} {hist['contagem']}")
+
+        for nome, valor, rotulos in self._coletar():
+            metrica = f"{PREFIXO}_{nome}"
+            if metrica not in vistos:
+                linhas.append(f"# TYPE {metrica} gauge")
+                vistos.add(metrica)
+            linhas.append(f"{metrica}{_formatar_rotulos(tuple(sorted((rotulos or {}).items())))} {valor}")
+        return "\n".join(linhas) + "\n"
+
+class _Trace:
+    """Grava os spans em JSON Lines (um arquivo por processo, aberto na primeira escrita)."""
+
+    def __init__(self, caminho, amostra):
+        self.caminho = caminho
+        self.amostra = amostra
+        self._arquivo = None
+        self._trava = threading.Lock()
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+
+    @property
+    def ativo(self):
+        return bool(self.caminho)
+
+    def pilha(self):
+        if not hasattr(self._local, "pilha"):
+            self._local.pilha = []
+        return self._local.pilha
+
+    def novo_id(self):
+        return f"{os.getpid()}-{next(self._ids)}"
+
+    def gravar(self, registro):
+        with self._trava:
+            if self._arquivo is None:
+                self._arquivo = open(self.caminho, "a", encoding="utf-8", buffering=1)
+            self._arquivo.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+
+class Span:
+    """Trecho medido em andamento; `anotar` acrescenta atributos que só vão para o trace."""
+
+    __slots__ = ("etapa", "rotulos", "atributos", "id", "pai", "amostrado", "inicio")
+
+    def __init__(self, etapa, rotulos, pai):
+        self.etapa = etapa
+        self.rotulos = rotulos
+        self.atributos = {}
+        self.pai = pai.id if pai else None
+        self.amostrado = pai.amostrado if pai else (trace.ativo and random.random() < trace.amostra)
+        self.id = trace.novo_id() if self.amostrado else None
+        self.inicio = time.time()
+
+    def anotar(self, **atributos):
+        self.atributos.update(atributos)
+
+registro = RegistroMetricas()
+trace = _Trace(ARQUIVO_TRACE, AMOSTRA_TRACE)
+
+def contar(nome, valor=1, **rotulos):
+    registro.contar(nome, valor, **rotulos)
+
+def registrar_coletor(funcao):
+    return registro.registrar_coletor(funcao)
+
+@contextmanager
+def medir(etapa, **rotulos):
+    """Cronometra o trecho (também serve de decorator: @medir("etapa"))."""
+    pilha = trace.pilha()
+    span = Span(etapa, rotulos, pilha[-1] if pilha else None)
+    pilha.append(span)
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        yield span
+    except BaseException as e:
+        erro = e
+        raise
+    finally:
+        duracao = time.perf_counter() - inicio
+        pilha.pop()
+        registro.observar("etapa", duracao, etapa=etapa, **rotulos)
+        if erro is not None:
+            registro.contar("etapa_erros", etapa=etapa, **rotulos)
+        if span.amostrado:
+            trace.gravar({
+                "span": span.id, "pai": span.pai, "etapa": etapa, "inicio": round(span.inicio, 6),
+                "duracao_ms": round(duracao * 1000, 3), "thread": threading.current_thread().name,
+                "erro": repr(erro) if erro is not None else None, **rotulos, **span.atributos,
+            })
+
+@contextmanager
+def medir_banco(operacao, tabela):
+    """Uma ida e volta ao Supabase (operacao: leitura, escrita ou rpc)."""
+    registro.contar("idas_e_voltas", destino="banco", operacao=operacao)
+    with medir("banco", operacao=operacao, tabela=tabela) as span:
+        yield span
+
+def exportar_json():
+    return registro.instantaneo()
+
+def exportar_prometheus():
+    return registro.prometheus()
+
+class _TratadorMetricas(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            corpo, tipo = json.dumps(exportar_json(), ensure_ascii=False).encode(), "application/json"
+        elif self.path.startswith("/metrics"):
+            corpo, tipo = exportar_prometheus().encode(), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+_servidor = None
+_trava_servidor = threading.Lock()
+
+def iniciar_servidor_metricas(porta=None):
+    """
+    Publica /metrics e /metrics.json numa thread deste processo (uma vez só).
+    Sem porta (nem METRICAS_PORTA) não faz nada. Retorna a porta em uso ou None;
+    se a porta estiver ocupada, só registra no log (as métricas não derrubam o app).
+    """
+    global _servidor
+    porta = PORTA_METRICAS if porta is None else porta
+    if not porta:
+        return None
+    with _trava_servidor:
+        if _servidor is None:
+            try:
+                _servidor = ThreadingHTTPServer(("0.0.0.0", porta), _TratadorMetricas)
+            except OSError as e:
+                log.error(f"❌ Não consegui abrir o servidor de métricas na porta {porta}: {e}")
+                return None
+            _servidor.daemon_threads = True
+            threading.Thread(target=_servidor.serve_forever, daemon=True, name="metricas").start()
+    return _servidor.server_address[1]
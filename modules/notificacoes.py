@@ -0,0 +1,104 @@
+from datetime import datetime
+
+DIAS_PT = ["Segunda-feira", "Terça-feira", "Quarta-feira", "Quinta-feira", "Sexta-feira", "Sábado", "Domingo"]
+
+def chave_treino(strava_id):
+    """Chave de idempotência da notificação de um treino (1 WhatsApp por atividade)."""
+    return f"treino:{strava_id}"
+
+def notificacao_treino(dados_notificacao, u_data):
+    """Linha da outbox notificacoes_whatsapp para um treino novo."""
+    return {
+        "chave_idempotencia": chave_treino(dados_notificacao['strava_id']),
+        "user_id": u_data.get('user_id') or dados_notificacao.get('id_atleta'),
+        "telefone": u_data.get('telefone'),
+        "nome": u_data.get('nome'),
+        "dados": dados_notificacao,
+        # > 0: espera a janela na outbox e sai junto com os outros treinos dela (resumo)
+        "janela_resumo_min": u_data.get('janela_resumo_min') or 0,
+    }
+
+def formatar_data_treino(data_raw):
+    """'2026-10-18' -> 'Domingo, 18/10/26'."""
+    data_raw = data_raw or datetime.now().strftime('%Y-%m-%d')
+    try:
+        data_obj = datetime.strptime(data_raw, '%Y-%m-%d')
+        return f"{DIAS_PT[data_obj.weekday()]}, {data_obj.strftime('%d/%m/%y')}"
+    except (TypeError, ValueError):
+        return data_raw
+
+def montar_mensagem_treino(dados_treino, nome_atleta):
+    """Texto do WhatsApp de um treino sincronizado (ou da mensagem de manutenção)."""
+    if dados_treino and dados_treino.get("manutencao"):
+        return (
+            f"🤖 *Zaptreino Online*\n\n"
+            f"Fala {nome_atleta}, o sistema está monitorando seu Strava! ✅"
+        )
+
+    dist = dados_treino.get('distancia', '-')
+    tempo = dados_treino.get('duracao_formatada', '00:00')
+    t_atual = dados_treino.get('trimp_score', 0)
+    e_atual = dados_treino.get('emoji_dia', '🟢')
+    t_sem = dados_treino.get('trimp_semanal', '-')
+    e_sem = dados_treino.get('emoji_semana', '')
+    t_men = dados_treino.get('trimp_mensal', '-')
+    e_men = dados_treino.get('emoji_mensal', '')
+    nome_atividade = dados_treino.get('name', 'Treino')
+    data_formatada = formatar_data_treino(dados_treino.get('data_treino'))
+    aviso_especifico = dados_treino.get('aviso_seguranca', '')
+
+    return (
+        f"🏃‍♂️ *Zaptreino Alerta*\n\n"
+        f"Fala {nome_atleta}, *novo* treino sincronizado! 🔵\n"
+        f"🏋️‍♂️ *Atividade:* {nome_atividade}\n"
+        f"📅 *Data:* {data_formatada}\n"
+        f"📏 Distância: {dist} km\n"
+        f"⏱️ Tempo: {tempo}\n"
+        f"🔥 *Carga Treino Atual:* {t_atual} {e_atual}\n\n"
+        f"📊 *Carga 7d:* {t_sem} {e_sem}\n"
+        f"📈 *Carga 30d:* {t_men} {e_men}"
+        f"{aviso_especifico}\n\n"
+        f"Bora pra cima! 👊"
+    )
+
+def montar_resumo_treinos(lista_dados, nome_atleta, status_carga=None):
+    """
+    Um WhatsApp só para vários treinos novos (modo resumo): lista cada treino com a
+    carga dele e mostra a carga 7d/30d uma vez, já com o último treino somado.
+    `lista_dados` vem em ordem cronológica. `status_carga` (retrato do painel do atleta),
+    se vier, é a carga 7d/30d mais atual e substitui a do último treino da lista.
+    """
+    if len(lista_dados) == 1:
+        return montar_mensagem_treino(lista_dados[0], nome_atleta)
+
+    linhas = []
+    for dados in lista_dados:
+        linhas.append(
+            f"🏋️‍♂️ *{dados.get('name', 'Treino')}* ({formatar_data_treino(dados.get('data_treino'))})\n"
+            f"   📏 {dados.get('distancia', '-')} km | ⏱️ {dados.get('duracao_formatada', '00:00')} | "
+            f"🔥 {dados.get('trimp_score', 0)} {dados.get('emoji_dia', '🟢')}"
+        )
+
+    final = dict(lista_dados[-1])
+    if status_carga:
+        final.update({chave: status_carga[chave] for chave in ("trimp_semanal", "emoji_semana", "trimp_mensal", "emoji_mensal")})
+    alertas = [f"Treino {dados.get('name', 'Treino')} ({dados.get('trimp_score', 0)})"
+               for dados in lista_dados if dados.get('emoji_dia') == "🔴"]
+    if final.get('emoji_semana') == "🔴": alertas.append(f"Carga 7 dias ({final.get('trimp_semanal')})")
+    if final.get('emoji_mensal') == "🔴": alertas.append(f"Carga 30 dias ({final.get('trimp_mensal')})")
+
+    aviso = ""
+    if alertas:
+        aviso = f"\n\n⚠️ *Atenção:* Sua carga de {' e '.join(alertas)} está alta! Fale com o Prof. Fabio Hanada. 👊"
+    if any(dados.get('sem_fc') for dados in lista_dados):
+        aviso += "\n\n⚠️ *Nota:* Treino(s) sem dados de FC. Carga estimada pelo tempo."
+
+    return (
+        f"🏃‍♂️ *Zaptreino Resumo*\n\n"
+        f"Fala {nome_atleta}, {len(lista_dados)} treinos novos sincronizados! 🔵\n\n"
+        + "\n\n".join(linhas) +
+        f"\n\n📊 *Carga 7d:* {final.get('trimp_semanal', '-')} {final.get('emoji_semana', '')}\n"
+        f"📈 *Carga 30d:* {final.get('trimp_mensal', '-')} {final.get('emoji_mensal', '')}"
+        f"{aviso}\n\n"
+        f"Bora pra cima! 👊"
+    )
@@ -0,0 +1,318 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+
+from modules.carga import DIAS_MES, JanelaCarga, emoji_carga, formatar_carga
+from modules.metricas import contar, medir_banco
+
+COLUNAS_PAINEL = "data_treino, name, distancia, duracao, trimp_score, trimp_semanal, trimp_mensal"
+
+# Histórico paginado: o keyset (data_treino, id) precisa do id de cada linha
+COLUNAS_HISTORICO = f"id, {COLUNAS_PAINEL}"
+TAMANHO_PAGINA_HISTORICO = 15
+
+# Retrato do painel de cada atleta (tabela painel_atleta), gravado logo depois de cada escrita em atividades_fisicas
+COLUNAS_SNAPSHOT = "id_atleta, atualizado_em, total_treinos, km_total, trimp_medio, status_carga, ultimos, cursor_ultimos, serie_30d"
+
+# Quanto tempo o painel mostra o retrato que já tem antes de conferir o banco de novo
+TTL_CACHE_PAINEL_SEG = int(os.getenv("PAINEL_CACHE_TTL_SEG", 300))
+MAX_ATLETAS_CACHE = int(os.getenv("PAINEL_CACHE_MAX_ATLETAS", 500))
+
+# Páginas, totais e gráficos já calculados por atleta (descartados quando o retrato muda)
+MAX_CONSULTAS_POR_ATLETA = 32
+
+# ============================================================================
+# RETRATO DO PAINEL (escrito por quem grava treinos, lido pela tela e pelas notificações)
+# ============================================================================
+def rotular_treino(linha):
+    """Linha do histórico já pronta para a tabela do painel (tempo e semáforos formatados)."""
+    duracao = linha.get('duracao')
+    return {
+        "data_treino": linha.get('data_treino'),
+        "name": linha.get('name'),
+        "distancia": linha.get('distancia'),
+        "duracao_formatada": f"{int(duracao)//60:02d}:{int(duracao)%60:02d}" if duracao is not None else "00:00",
+        "carga_diaria": formatar_carga(linha.get('trimp_score'), 'dia'),
+        "carga_7d": formatar_carga(linha.get('trimp_semanal'), 'sem'),
+        "carga_30d": formatar_carga(linha.get('trimp_mensal'), 'men'),
+    }
+
+def status_carga(semanal, mensal, referencia):
+    """Carga 7d/30d do atleta no dia de referência, com o semáforo de cada uma."""
+    return {
+        "data_referencia": referencia.isoformat(),
+        "trimp_semanal": semanal,
+        "emoji_semana": emoji_carga(semanal, 'sem'),
+        "trimp_mensal": mensal,
+        "emoji_mensal": emoji_carga(mensal, 'men'),
+    }
+
+def montar_snapshot(user_id, resumo, recentes, proximo, serie, hoje=None):
+    """
+    Linha de painel_atleta a partir dos totais, da primeira página do histórico e da série
+    de 30 dias. O status de carga é a JanelaCarga sobre a série no dia `hoje` (a mesma
+    regra do sync), não a carga gravada no último treino, que pode ser de semanas atrás.
+    """
+    hoje = hoje or date.today()
+    status = None
+    if recentes:
+        janela = JanelaCarga((linha.get('data_treino'), linha.get('trimp_score')) for linha in serie)
+        status = status_carga(*janela.totais(hoje), hoje)
+    return {
+        "id_atleta": user_id,
+        "atualizado_em": datetime.now(timezone.utc).isoformat(),
+        "total_treinos": resumo['total_treinos'],
+        "km_total": round(resumo['km_total'], 2),
+        "trimp_medio": round(resumo['trimp_medio'], 1),
+        "status_carga": status,
+        "ultimos": [rotular_treino(linha) for linha in recentes],
+        "cursor_ultimos": list(proximo) if proximo else None,
+        "serie_30d": serie,
+    }
+
+def _calcular_snapshot(supabase, user_id):
+    hoje = date.today()
+    corte = (hoje - timedelta(days=DIAS_MES)).isoformat()
+    resumo = _consultar_resumo(supabase, user_id, None, None, None)
+    recentes, proximo = _consultar_pagina(supabase, user_id, None, None, None, None, TAMANHO_PAGINA_HISTORICO)
+    with medir_banco("leitura", "atividades_fisicas"):
+        serie = (supabase.table("atividades_fisicas").select("data_treino, distancia, trimp_score")
+                 .eq("id_atleta", user_id).gte("data_treino", corte).order("data_treino").execute().data or [])
+    snapshot = montar_snapshot(user_id, resumo, recentes, proximo, serie, hoje)
+    with medir_banco("escrita", "painel_atleta"):
+        supabase.table("painel_atleta").upsert(snapshot, on_conflict="id_atleta").execute()
+    contar("snapshots_painel")
+    return snapshot
+
+def atualizar_snapshot_painel(supabase, user_id):
+    """
+    Recalcula e grava o retrato do painel do atleta (totais, últimos treinos rotulados,
+    série de 30 dias e status de carga). Chamado por quem grava em atividades_fisicas
+    (sync, webhooks, importação), logo depois da escrita.
+    """
+    snapshot = _calcular_snapshot(supabase, user_id)
+    invalidar_atleta(user_id)
+    return snapshot
+
+def status_carga_atletas(supabase, user_ids):
+    """Status de carga de vários atletas numa consulta só ({user_id: status})."""
+    if not user_ids:
+        return {}
+    with medir_banco("leitura", "painel_atleta"):
+        res = supabase.table("painel_atleta").select("id_atleta, status_carga").in_("id_atleta", list(user_ids)).execute()
+    return {linha['id_atleta']: linha['status_carga'] for linha in (res.data or []) if linha.get('status_carga')}
+
+# ============================================================================
+# CACHE DO PROCESSO
+# ============================================================================
+class _EntradaPainel:
+    __slots__ = ("snapshot", "conferido_em", "invalidado", "consultas", "trava")
+
+    def __init__(self):
+        self.snapshot = None
+        self.conferido_em = 0.0
+        self.invalidado = True
+        self.consultas = {}
+        # Reentrante: um cálculo memorizado pode ler outro do mesmo atleta (gráficos -> quadro -> retrato)
+        self.trava = threading.RLock()
+
+class CachePainel:
+    """
+    Retrato do painel por atleta, compartilhado entre reruns e sessões do processo.
+
+    - Dentro do TTL e sem invalidação, o painel não toca no banco (cliques em widgets).
+    - Vencido o TTL ou invalidado por uma escrita, relê só a linha do atleta em
+      painel_atleta; se o retrato mudou (atualizado_em), descarta as páginas, totais e
+      gráficos memorizados.
+    - Atleta ainda sem retrato (nada gravado desde a criação da tabela) tem o retrato
+      calculado na hora.
+    - Guarda no máximo `max_atletas` atletas (LRU).
+    """
+
+    def __init__(self, ttl_seg=TTL_CACHE_PAINEL_SEG, max_atletas=MAX_ATLETAS_CACHE):
+        self.ttl_seg = ttl_seg
+        self.max_atletas = max_atletas
+        self._entradas = OrderedDict()
+        self._trava = threading.Lock()
+
+    def _entrada(self, user_id):
+        with self._trava:
+            entrada = self._entradas.get(user_id)
+            if entrada is None:
+                entrada = self._entradas[user_id] = _EntradaPainel()
+                while len(self._entradas) > self.max_atletas:
+                    self._entradas.popitem(last=False)
+            else:
+                self._entradas.move_to_end(user_id)
+            return entrada
+
+    def invalidar(self, user_id, completo=False):
+        with self._trava:
+            if completo:
+                self._entradas.pop(user_id, None)
+                return
+            entrada = self._entradas.get(user_id)
+        if entrada is not None:
+            entrada.invalidado = True
+
+    def limpar(self):
+        with self._trava:
+            self._entradas.clear()
+
+    def _atualizar(self, supabase, user_id, entrada):
+        with medir_banco("leitura", "painel_atleta"):
+            res = supabase.table("painel_atleta").select(COLUNAS_SNAPSHOT).eq("id_atleta", user_id).limit(1).execute()
+        snapshot = res.data[0] if res.data else None
+        if snapshot is None:
+            contar("cache_painel", resultado="sem_snapshot")
+            snapshot = _calcular_snapshot(supabase, user_id)
+        else:
+            contar("cache_painel", resultado="snapshot")
+
+        if entrada.snapshot is None or entrada.snapshot.get('atualizado_em') != snapshot.get('atualizado_em'):
+            entrada.consultas.clear()
+        entrada.snapshot = snapshot
+        entrada.conferido_em = time.monotonic()
+        entrada.invalidado = False
+
+    def memorizar(self, supabase, user_id, chave, consultar):
+        """Resultado de `consultar()` guardado na entrada do atleta até o retrato dele mudar."""
+        entrada = self.obter(supabase, user_id)
+        with entrada.trava:
+            if chave not in entrada.consultas:
+                if len(entrada.consultas) >= MAX_CONSULTAS_POR_ATLETA:
+                    entrada.consultas.clear()
+                entrada.consultas[chave] = consultar()
+            return entrada.consultas[chave]
+
+    def obter(self, supabase, user_id):
+        """Entrada do atleta em dia (só consulta o banco se o TTL venceu ou houve invalidação)."""
+        entrada = self._entrada(user_id)
+        with entrada.trava:
+            if entrada.invalidado or time.monotonic() - entrada.conferido_em > self.ttl_seg:
+                self._atualizar(supabase, user_id, entrada)
+            else:
+                contar("cache_painel", resultado="acerto")
+        return entrada
+
+# Instância única do processo
+cache_painel = CachePainel()
+
+def snapshot_painel(supabase, user_id):
+    """Retrato do painel do atleta pelo cache (uma linha de painel_atleta quando precisa ir ao banco)."""
+    return cache_painel.obter(supabase, user_id).snapshot
+
+def memorizar(supabase, user_id, chave, calcular):
+    """Guarda `calcular()` (ex.: gráficos da tela) até o retrato do atleta mudar."""
+    return cache_painel.memorizar(supabase, user_id, chave, calcular)
+
+def quadro_treinos_atleta(supabase, user_id):
+    """DataFrame da série de 30 dias do retrato; cópia, para a tela poder acrescentar colunas."""
+    def montar():
+        import pandas as pd
+        serie = snapshot_painel(supabase, user_id)['serie_30d'] or []
+        return pd.DataFrame(serie, columns=["data_treino", "distancia", "trimp_score"])
+    return memorizar(supabase, user_id, ("quadro",), montar).copy()
+
+def invalidar_atleta(user_id, completo=False):
+    """Força a releitura do retrato do atleta na próxima vez que o painel dele for aberto."""
+    cache_painel.invalidar(user_id, completo=completo)
+
+# ============================================================================
+# HISTÓRICO FILTRADO (consultas no servidor)
+# ============================================================================
+def _termo_busca(busca):
+    # % e * são curingas no ilike do PostgREST: viram "_" (um caractere qualquer)
+    return re.sub(r"[%*\\]", "_", (busca or "").strip())
+
+def _filtrar_historico(query, desde=None, ate=None, busca=None):
+    if desde:
+        query = query.gte("data_treino", str(desde))
+    if ate:
+        query = query.lte("data_treino", str(ate))
+    termo = _termo_busca(busca)
+    if termo:
+        # Índice trigram em name (pg_trgm) atende o ilike com curinga dos dois lados
+        query = query.ilike("name", f"%{termo}%")
+    return query
+
+def _consultar_pagina(supabase, user_id, cursor, desde, ate, busca, tamanho):
+    query = _filtrar_historico(
+        supabase.table("atividades_fisicas").select(COLUNAS_HISTORICO).eq("id_atleta", user_id), desde, ate, busca
+    )
+    if cursor:
+        # Keyset: só o que vem depois da última linha da página anterior, na ordem
+        # (data_treino, id) decrescente. Treinos sem data ficam no fim (nulls last).
+        data, ultimo_id = cursor
+        if data is None:
+            # Já nas linhas sem data: só o id decide
+            query = query.is_("data_treino", "null").lt("id", ultimo_id)
+        else:
+            query = query.or_(f"data_treino.lt.{data},and(data_treino.eq.{data},id.lt.{ultimo_id}),data_treino.is.null")
+    # Uma linha a mais só para saber se existe a próxima página
+    with medir_banco("leitura", "atividades_fisicas"):
+        linhas = (query.order("data_treino", desc=True, nullsfirst=False).order("id", desc=True)
+                  .limit(tamanho + 1).execute().data or [])
+    proximo = None
+    if len(linhas) > tamanho:
+        linhas = linhas[:tamanho]
+        proximo = (linhas[-1]['data_treino'], linhas[-1]['id'])
+    return linhas, proximo
+
+def pagina_treinos(supabase, user_id, cursor=None, desde=None, ate=None, busca=None):
+    """
+    Uma página do histórico do atleta, do mais recente para o mais antigo, filtrada por
+    período (data_treino entre `desde` e `ate`) e por trecho do nome, já rotulada
+    (rotular_treino). `cursor` é o (data_treino, id) devolvido pela página anterior;
+    retorna (linhas, próximo cursor ou None na última página).
+    A primeira página sem filtro é a `ultimos` do retrato; as demais são uma consulta
+    indexada cada, não importa o tamanho do histórico.
+    """
+    if not (cursor or desde or ate or _termo_busca(busca)):
+        snapshot = snapshot_painel(supabase, user_id)
+        proximo = snapshot.get('cursor_ultimos')
+        return snapshot['ultimos'] or [], tuple(proximo) if proximo else None
+
+    def consultar():
+        linhas, proximo = _consultar_pagina(supabase, user_id, cursor, desde, ate, busca, TAMANHO_PAGINA_HISTORICO)
+        return [rotular_treino(linha) for linha in linhas], proximo
+
+    chave = ("pagina", tuple(cursor) if cursor else None, str(desde or ""), str(ate or ""), _termo_busca(busca))
+    return cache_painel.memorizar(supabase, user_id, chave, consultar)
+
+def _consultar_resumo(supabase, user_id, desde, ate, busca):
+    with medir_banco("rpc", "resumo_treinos_atleta"):
+        res = supabase.rpc("resumo_treinos_atleta", {
+            "p_id_atleta": user_id,
+            "p_desde": str(desde) if desde else None,
+            "p_ate": str(ate) if ate else None,
+            "p_busca": _termo_busca(busca) or None,
+        }).execute()
+    dados = (res.data or [{}])[0] if isinstance(res.data, list) else (res.data or {})
+    return {
+        "total_treinos": int(dados.get('total_treinos') or 0),
+        "km_total": float(dados.get('km_total') or 0),
+        "trimp_medio": float(dados.get('trimp_medio') or 0),
+    }
+
+def resumo_treinos(supabase, user_id, desde=None, ate=None, busca=None):
+    """
+    Totais exatos do atleta (treinos, km e carga média) com os mesmos filtros do histórico:
+    sem filtro saem do retrato, com filtro do agregado calculado no banco.
+    """
+    if not (desde or ate or _termo_busca(busca)):
+        snapshot = snapshot_painel(supabase, user_id)
+        return {
+            "total_treinos": int(snapshot['total_treinos'] or 0),
+            "km_total": float(snapshot['km_total'] or 0),
+            "trimp_medio": float(snapshot['trimp_medio'] or 0),
+        }
+
+    chave = ("resumo", str(desde or ""), str(ate or ""), _termo_busca(busca))
+    return cache_painel.memorizar(
+        supabase, user_id, chave,
+        lambda: _consultar_resumo(supabase, user_id, desde, ate, busca),
+    )
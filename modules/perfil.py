@@ -0,0 +1,307 @@
+"""
+Captura de perfil sob demanda: um ciclo do vigilante ou uma execução do script do Streamlit.
+
+Ligado por ambiente ou pelo painel admin; desligado, cada ponto de captura custa só
+um teste de dicionário vazio.
+
+- PERFIL_CAPTURAR=vigilante,rerun captura TODO ciclo/execução dos alvos listados.
+- `solicitar_captura(alvo)` (botão escondido no painel admin) captura só a próxima.
+- PERFIL_MODO: "amostragem" (padrão) lê a pilha de todas as threads a cada
+  PERFIL_INTERVALO_MS e grava um .speedscope.json (abre em https://www.speedscope.app);
+  "deterministico" usa cProfile na thread do alvo e grava um .pstats
+  (`python -m pstats`, snakeviz). O ciclo do vigilante espalha o trabalho pelo pool
+  do sync, por isso a amostragem, que enxerga as threads de trabalho, é o padrão.
+- Em toda captura o tracemalloc compara a memória do começo e do fim (.memoria.txt),
+  e um .txt traz o resumo das funções mais caras.
+
+Os arquivos vão para PERFIL_PASTA (padrão "perfis"), nomeados <alvo>-<AAAAMMDD-HHMMSS>-<pid>;
+só as PERFIL_MAX_CAPTURAS mais recentes são mantidas.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+PASTA_PERFIS = os.getenv("PERFIL_PASTA", "perfis")
+ALVOS_SEMPRE = {a.strip() for a in os.getenv("PERFIL_CAPTURAR", "").split(",") if a.strip()}
+MODO_PADRAO = os.getenv("PERFIL_MODO", "amostragem").lower()
+INTERVALO_AMOSTRA_SEG = float(os.getenv("PERFIL_INTERVALO_MS", 5)) / 1000
+MAX_CAPTURAS = int(os.getenv("PERFIL_MAX_CAPTURAS", 50))
+
+# Quadros guardados por pilha de cada amostra e linhas do resumo de memória
+PROFUNDIDADE_MAXIMA = 128
+TOP_MEMORIA = 25
+TOP_FUNCOES = 30
+
+ALVOS = ("vigilante", "rerun")
+
+_pendentes = {}
+_trava = threading.Lock()
+
+def solicitar_captura(alvo, vezes=1):
+    """Pede a captura das próximas `vezes` execuções do alvo neste processo."""
+    with _trava:
+        _pendentes[alvo] = _pendentes.get(alvo, 0) + vezes
+
+def capturas_pendentes():
+    with _trava:
+        return dict(_pendentes)
+
+def _deve_capturar(alvo):
+    # Caminho de sempre (perfil desligado): nenhuma trava, nenhuma alocação
+    if not _pendentes and not ALVOS_SEMPRE:
+        return False
+    if alvo in ALVOS_SEMPRE:
+        return True
+    with _trava:
+        if _pendentes.get(alvo, 0) > 0:
+            _pendentes[alvo] -= 1
+            if not _pendentes[alvo]:
+                del _pendentes[alvo]
+            return True
+    return False
+
+class AmostradorPilhas:
+    """
+    Profiler por amostragem: uma thread lê sys._current_frames() a cada `intervalo`
+    e conta as pilhas de cada thread. `parar_quando(frames)` (opcional) encerra a
+    captura sozinho, ex.: quando a execução do script saiu da pilha.
+    """
+
+    def __init__(self, intervalo=INTERVALO_AMOSTRA_SEG, parar_quando=None, ao_parar=None):
+        self.intervalo = intervalo
+        self.parar_quando = parar_quando
+        self.ao_parar = ao_parar
+        self.quadros = []
+        self._indice_quadros = {}
+        self.amostras = {}
+        self.inicio = self.fim = None
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _quadro(self, frame):
+        codigo = frame.f_code
+        chave = (codigo.co_filename, codigo.co_firstlineno, codigo.co_name)
+        indice = self._indice_quadros.get(chave)
+        if indice is None:
+            indice = self._indice_quadros[chave] = len(self.quadros)
+            self.quadros.append({"name": codigo.co_name, "file": codigo.co_filename, "line": codigo.co_firstlineno})
+        return indice
+
+    def _amostrar(self, frames):
+        nomes = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in frames.items():
+            if ident == threading.get_ident():
+                continue
+            pilha = []
+            while frame is not None and len(pilha) < PROFUNDIDADE_MAXIMA:
+                pilha.append(self._quadro(frame))
+                frame = frame.f_back
+            nome = nomes.get(ident, str(ident))
+            self.amostras.setdefault(nome, Counter())[tuple(reversed(pilha))] += 1
+
+    def _rodar(self):
+        while not self._parar.is_set():
+            frames = sys._current_frames()
+            if self.parar_quando and self.parar_quando(frames):
+                break
+            self._amostrar(frames)
+            del frames
+            self._parar.wait(self.intervalo)
+        self.fim = time.time()
+        if self.ao_parar:
+            self.ao_parar(self)
+
+    def iniciar(self):
+        self.inicio = time.time()
+        self._thread = threading.Thread(target=self._rodar, daemon=True, name="perfil-amostrador")
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def speedscope(self, nome):
+        """Perfil no formato de arquivo do speedscope (um perfil 'sampled' por thread)."""
+        passo_ms = self.intervalo * 1000
+        perfis = []
+        for thread, pilhas in sorted(self.amostras.items()):
+            amostras = list(pilhas.items())
+            perfis.append({
+                "type": "sampled", "name": thread, "unit": "milliseconds",
+                "startValue": 0, "endValue": round(sum(n for _, n in amostras) * passo_ms, 3),
+                "samples": [list(pilha) for pilha, _ in amostras],
+                "weights": [round(n * passo_ms, 3) for _, n in amostras],
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": nome, "exporter": "zaptreino/modules/perfil",
+            "shared": {"frames": self.quadros}, "profiles": perfis,
+        }
+
+    def resumo(self, top=TOP_FUNCOES):
+        """Funções com mais amostras: próprias (topo da pilha) e acumuladas (em qualquer ponto)."""
+        proprias, acumuladas, total = Counter(), Counter(), 0
+        for pilhas in self.amostras.values():
+            for pilha, n in pilhas.items():
+                total += n
+                if pilha:
+                    proprias[pilha[-1]] += n
+                for indice in set(pilha):
+                    acumuladas[indice] += n
+
+        def _nome(indice):
+            q = self.quadros[indice]
+            return f"{q['name']} ({os.path.basename(q['file'])}:{q['line']})"
+
+        linhas = [f"{total} amostras a cada {self.intervalo * 1000:.1f} ms em {len(self.amostras)} thread(s)", "",
+                  "Próprias (onde o tempo foi gasto):"]
+        linhas += [f"  {n:7d}  {n / max(total, 1):6.1%}  {_nome(i)}" for i, n in proprias.most_common(top)]
+        linhas += ["", "Acumuladas (inclui chamadas):"]
+        linhas += [f"  {n:7d}  {n / max(total, 1):6.1%}  {_nome(i)}" for i, n in acumuladas.most_common(top)]
+        return "\n".join(linhas) + "\n"
+
+def _base_arquivo(alvo):
+    os.makedirs(PASTA_PERFIS, exist_ok=True)
+    return os.path.join(PASTA_PERFIS, f"{alvo}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+
+def _iniciar_memoria():
+    ja_ativo = tracemalloc.is_tracing()
+    if not ja_ativo:
+        tracemalloc.start()
+    return ja_ativo, tracemalloc.take_snapshot()
+
+def _gravar_memoria(base, inicio_memoria):
+    ja_ativo, antes = inicio_memoria
+    depois = tracemalloc.take_snapshot()
+    atual, pico = tracemalloc.get_traced_memory()
+    if not ja_ativo:
+        tracemalloc.stop()
+    filtros = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    diferencas = depois.filter_traces(filtros).compare_to(antes.filter_traces(filtros), "lineno")
+    with open(f"{base}.memoria.txt", "w", encoding="utf-8") as arquivo:
+        arquivo.write(f"Memória rastreada no fim: {atual / 1024:.1f} KiB (pico {pico / 1024:.1f} KiB)\n\n")
+        arquivo.write(f"Maiores variações entre o começo e o fim (top {TOP_MEMORIA}):\n")
+        for dif in diferencas[:TOP_MEMORIA]:
+            arquivo.write(f"  {dif}\n")
+
+def _aplicar_retencao():
+    """Apaga as capturas mais antigas além de MAX_CAPTURAS."""
+    capturas = listar_capturas(limite=None)
+    for captura in capturas[MAX_CAPTURAS:]:
+        for caminho in captura["arquivos"]:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+def _finalizar_amostragem(alvo, base, amostrador, inicio_memoria):
+    _gravar_memoria(base, inicio_memoria)
+    with open(f"{base}.speedscope.json", "w", encoding="utf-8") as arquivo:
+        json.dump(amostrador.speedscope(f"{alvo} {os.path.basename(base)}"), arquivo)
+    with open(f"{base}.txt", "w", encoding="utf-8") as arquivo:
+        arquivo.write(f"{alvo}: {amostrador.fim - amostrador.inicio:.3f}s\n")
+        arquivo.write(amostrador.resumo())
+    _aplicar_retencao()
+
+@contextmanager
+def capturar(alvo, modo=None):
+    """
+    Perfila o bloco se houver captura pedida para `alvo` (ambiente ou painel admin).
+    Sem pedido, não faz nada.
+    """
+    if not _deve_capturar(alvo):
+        yield None
+        return
+
+    modo = (modo or MODO_PADRAO).lower()
+    base = _base_arquivo(alvo)
+    inicio_memoria = _iniciar_memoria()
+    inicio = time.perf_counter()
+
+    if modo == "deterministico":
+        perfilador = cProfile.Profile()
+        perfilador.enable()
+        try:
+            yield base
+        finally:
+            perfilador.disable()
+            _gravar_memoria(base, inicio_memoria)
+            perfilador.dump_stats(f"{base}.pstats")
+            texto = io.StringIO()
+            pstats.Stats(perfilador, stream=texto).sort_stats("cumulative").print_stats(TOP_FUNCOES)
+            with open(f"{base}.txt", "w", encoding="utf-8") as arquivo:
+                arquivo.write(f"{alvo}: {time.perf_counter() - inicio:.3f}s\n{texto.getvalue()}")
+            _aplicar_retencao()
+    else:
+        amostrador = AmostradorPilhas().iniciar()
+        try:
+            yield base
+        finally:
+            amostrador.parar()
+            _finalizar_amostragem(alvo, base, amostrador, inicio_memoria)
+
+def capturar_execucao_script(alvo="rerun"):
+    """
+    Para o script do Streamlit, que não tem um "fim" onde pôr um `with`: chamado no
+    topo do main.py, amostra a thread do script até o quadro do chamador sair da pilha
+    (fim normal, st.stop() ou st.rerun()) e então grava a captura em segundo plano.
+    Sem pedido, não faz nada.
+    """
+    if not _deve_capturar(alvo):
+        return None
+
+    ident = threading.get_ident()
+    codigo_script = sys._getframe(1).f_code
+
+    def _script_terminou(frames):
+        frame = frames.get(ident)
+        while frame is not None:
+            if frame.f_code is codigo_script:
+                return False
+            frame = frame.f_back
+        return True
+
+    base = _base_arquivo(alvo)
+    inicio_memoria = _iniciar_memoria()
+    return AmostradorPilhas(
+        parar_quando=_script_terminou,
+        ao_parar=lambda amostrador: _finalizar_amostragem(alvo, base, amostrador, inicio_memoria),
+    ).iniciar()
+
+def listar_capturas(limite=20):
+    """Capturas mais recentes primeiro: [{nome, alvo, quando, arquivos, tamanho_kb}]."""
+    if not os.path.isdir(PASTA_PERFIS):
+        return []
+    grupos = {}
+    for nome_arquivo in os.listdir(PASTA_PERFIS):
+        nome = nome_arquivo.split(".", 1)[0]
+        caminho = os.path.join(PASTA_PERFIS, nome_arquivo)
+        grupos.setdefault(nome, []).append(caminho)
+
+    capturas = []
+    for nome, arquivos in grupos.items():
+        partes = nome.split("-")
+        try:
+            quando = datetime.strptime(f"{partes[1]}-{partes[2]}", "%Y%m%d-%H%M%S")
+        except (IndexError, ValueError):
+            continue
+        capturas.append({
+            "nome": nome,
+            "alvo": partes[0],
+            "quando": quando,
+            "arquivos": sorted(arquivos),
+            "tamanho_kb": round(sum(os.path.getsize(a) for a in arquivos if os.path.exists(a)) / 1024, 1),
+        })
+    capturas.sort(key=lambda c: (c["quando"], c["nome"]), reverse=True)
+    return capturas if limite is None else capturas[:limite]
@@ -1,12 +1,16 @@
-import requests
 import numpy as np
 from datetime import datetime, timedelta
+from modules.agendador_strava import requisitar_strava
+from modules import whatsapp
+from modules.logs import obter_logger
+
+log = obter_logger("services")
 
 def buscar_e_salvar_treinos(supabase, access_token, user_id):
-    url = "https://www.strava.com/api/v3/athlete/activities?per_page=30"
+    url = "/api/v3/athlete/activities?per_page=30"
     headers = {"Authorization": f"Bearer {access_token}"}
     try:
-        response = requests.get(url, headers=headers)
+        response = requisitar_strava("GET", url, headers=headers)
         if response.status_code == 200:
             atividades = response.json()
             dados = []
@@ -38,9 +42,6 @@ def verificar_necessidade_update(supabase, user):
     return False
 
 def enviar_notificacao_treino(dados_treino, nome_atleta, telefone_atleta):
-    from twilio.rest import Client
-    import streamlit as st
-
     # 1. Monta o texto EXATAMENTE como você pediu
     # Lógica simples para definir status (você pode refinar as faixas depois)
     status_semanal = "⚠️ Sobrecarga" if dados_treino['trimp_semanal'] > 150 else "✅ Ideal"
@@ -56,21 +57,9 @@ def enviar_notificacao_treino(dados_treino, nome_atleta, telefone_atleta):
         f"📅 Trimp Mensal: {status_mensal}"
     )
 
-    # 2. Conecta no Twilio (usando seus secrets já configurados)
+    # 2. Envia pelo gateway único de WhatsApp
     try:
-        sid = st.secrets["twilio"]["TWILIO_SID"].strip()
-        token = st.secrets["twilio"]["TWILIO_TOKEN"].strip()
-        from_number = f"whatsapp:+{st.secrets['twilio']['TWILIO_PHONE_NUMBER']}"
-        
-        # Garante formatação do número do aluno
-        to_number = f"whatsapp:{telefone_atleta}" if "whatsapp" not in telefone_atleta else telefone_atleta
-
-        client = Client(sid, token)
-        msg = client.messages.create(
-            body=mensagem,
-            from_=from_number,
-            to=to_number
-        )
-        return True, msg.sid
+        return True, whatsapp.enviar(telefone_atleta, mensagem)
     except Exception as e:
-        return False, str(e)
\ No newline at end of file
+        log.error(f"❌ Erro ao enviar notificação de treino para {nome_atleta}: {e}")
+        return False, str(e)
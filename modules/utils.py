@@ -1,7 +1,7 @@
 import hashlib
 from datetime import datetime
 import streamlit as st
-from twilio.rest import Client
+from modules import whatsapp
 
 # URL de retorno do seu site (ajuste se mudar o nome do app no Streamlit Cloud)
 REDIRECT_URI = "https://seu-treino-app.streamlit.app/" 
@@ -18,24 +18,8 @@ def formatar_data_br(data_str):
         return str(data_str)
 
 def enviar_whatsapp(numero_destino, mensagem):
-    """Envia alerta via Twilio para o seu WhatsApp."""
+    """Envia alerta via WhatsApp (gateway modules/whatsapp)."""
     try:
-        # Pega as chaves das Secrets
-        sid = st.secrets["TWILIO_ACCOUNT_SID"]
-        token = st.secrets["TWILIO_AUTH_TOKEN"]
-        origem = st.secrets["TWILIO_PHONE_NUMBER"] # O número do Twilio
-        
-        client = Client(sid, token)
-        
-        # Garante o formato 'whatsapp:+55...'
-        if not numero_destino.startswith("whatsapp:"):
-            numero_destino = f"whatsapp:{numero_destino}"
-            
-        message = client.messages.create(
-            body=mensagem,
-            from_=origem,
-            to=numero_destino
-        )
-        return True, message.sid
+        return True, whatsapp.enviar(numero_destino, mensagem)
     except Exception as e:
-        return False, str(e)
\ No newline at end of file
+        return False, str(e)
@@ -1,80 +1,28 @@
 import streamlit as st
+import os
 import time
-import requests
+from modules import http_cliente, perfil, whatsapp
 import uuid
 from datetime import date, datetime, timedelta
-from twilio.rest import Client
 import re
-from supabase import create_client
+from modules.conexao import obter_supabase
+from modules.logs import obter_logger
+from modules.notificacoes import montar_mensagem_treino
 import base64
 
+log = obter_logger("views")
+
 # ============================================================================
 # 1. FUNÇÕES DE NOTIFICAÇÃO (WHATSAPP)
 # ============================================================================
 
 def enviar_notificacao_treino(dados_treino, nome_atleta, telefone_atleta=None):
+    """Envia na hora (pelo gateway de WhatsApp) a mensagem de um treino ou de manutenção."""
     try:
-        sid = st.secrets.get("TWILIO_SID")
-        token = st.secrets.get("TWILIO_TOKEN")
-        from_raw = str(st.secrets.get("TWILIO_PHONE_NUMBER")).strip()
-        
-        if telefone_atleta:
-            tel_limpo = ''.join(filter(str.isdigit, str(telefone_atleta)))
-            if len(tel_limpo) <= 11:
-                tel_limpo = f"55{tel_limpo}"
-            to_number = f"whatsapp:+{tel_limpo}"
-        else:
-            to_raw = str(st.secrets.get("MEU_CELULAR")).strip()
-            to_number = f"whatsapp:+{to_raw}"
-
-        from_number = f"whatsapp:+{from_raw}"
-        client = Client(sid, token)
-        
-        if dados_treino and dados_treino.get("manutencao"):
-            corpo_msg = (
-                f"🤖 *Zaptreino Online*\n\n"
-                f"Fala {nome_atleta}, o sistema está monitorando seu Strava! ✅"
-            )
-        else:
-            dist = dados_treino.get('distancia', '-')
-            tempo = dados_treino.get('duracao_formatada', '00:00')
-            t_atual = dados_treino.get('trimp_score', 0)
-            e_atual = dados_treino.get('emoji_dia', '🟢')
-            t_sem = dados_treino.get('trimp_semanal', '-')
-            e_sem = dados_treino.get('emoji_semana', '')
-            t_men = dados_treino.get('trimp_mensal', '-')
-            e_men = dados_treino.get('emoji_mensal', '')
-            nome_atividade = dados_treino.get('name', 'Treino')
-            
-            dias_pt = ["Segunda-feira", "Terça-feira", "Quarta-feira", "Quinta-feira", "Sexta-feira", "Sábado", "Domingo"]
-            data_raw = dados_treino.get('data_treino', datetime.now().strftime('%Y-%m-%d'))
-            try:
-                data_obj = datetime.strptime(data_raw, '%Y-%m-%d')
-                dia_semana = dias_pt[data_obj.weekday()]
-                data_formatada = f"{dia_semana}, {data_obj.strftime('%d/%m/%y')}"
-            except:
-                data_formatada = data_raw
-
-            aviso_especifico = dados_treino.get('aviso_seguranca', '')
-
-            corpo_msg = (
-                f"🏃‍♂️ *Zaptreino Alerta*\n\n"
-                f"Fala {nome_atleta}, *novo* treino sincronizado! 🔵\n"
-                f"🏋️‍♂️ *Atividade:* {nome_atividade}\n"
-                f"📅 *Data:* {data_formatada}\n"
-                f"📏 Distância: {dist} km\n"
-                f"⏱️ Tempo: {tempo}\n"
-                f"🔥 *Carga Treino Atual:* {t_atual} {e_atual}\n\n"
-                f"📊 *Carga 7d:* {t_sem} {e_sem}\n"
-                f"📈 *Carga 30d:* {t_men} {e_men}"
-                f"{aviso_especifico}\n\n"
-                f"Bora pra cima! 👊"
-            )
-        
-        client.messages.create(body=corpo_msg, from_=from_number, to=to_number)
+        whatsapp.enviar(telefone_atleta, montar_mensagem_treino(dados_treino, nome_atleta))
         return True
     except Exception as e:
-        print(f"❌ Erro Crítico no Twilio: {e}")
+        log.exception(f"❌ Erro Crítico no Twilio: {e}")
         return False
 
 # ============================================================================
@@ -336,6 +284,46 @@ def renderizar_tela_admin(supabase_client):
     except Exception as e:
         st.error(f"Erro ao carregar lista de alunos: {e}")
 
+    renderizar_diagnostico_desempenho()
+
+def renderizar_diagnostico_desempenho():
+    """Controle escondido do admin: pede capturas de perfil (modules/perfil) e lista as recentes."""
+    with st.expander("🩺 Diagnóstico de desempenho"):
+        st.caption("Perfila o próximo ciclo do vigilante ou o próximo carregamento de página neste servidor. "
+                   "Com várias réplicas, o ciclo só é capturado na que estiver com o lease do vigilante.")
+        c1, c2 = st.columns(2)
+        if c1.button("⏱️ Perfilar próximo ciclo do vigilante", width="stretch"):
+            perfil.solicitar_captura("vigilante")
+            st.toast("Captura agendada para o próximo ciclo.", icon="⏱️")
+        if c2.button("⏱️ Perfilar próximo carregamento", width="stretch"):
+            perfil.solicitar_captura("rerun")
+            st.toast("Captura agendada para o próximo carregamento.", icon="⏱️")
+
+        pendentes = perfil.capturas_pendentes()
+        if pendentes:
+            st.caption("Aguardando: " + ", ".join(f"{alvo} ({n})" for alvo, n in pendentes.items()))
+
+        capturas = perfil.listar_capturas()
+        if not capturas:
+            st.info("Nenhuma captura ainda.")
+            return
+        for captura in capturas:
+            with st.container(border=True):
+                st.write(f"**{captura['alvo']}** · {captura['quando'].strftime('%d/%m/%Y %H:%M:%S')} · {captura['tamanho_kb']} KiB")
+                colunas = st.columns(len(captura['arquivos']))
+                for coluna, caminho in zip(colunas, captura['arquivos']):
+                    try:
+                        with open(caminho, "rb") as arquivo:
+                            conteudo = arquivo.read()
+                    except OSError:
+                        continue
+                    # Rótulo = extensão, incluindo a dupla (.memoria.txt, .speedscope.json)
+                    nome_arquivo = os.path.basename(caminho)
+                    raiz, extensao = os.path.splitext(nome_arquivo)
+                    rotulo = (os.path.splitext(raiz)[1] + extensao).lstrip(".") or nome_arquivo
+                    coluna.download_button(rotulo, conteudo, file_name=nome_arquivo,
+                                           key=f"perfil_{caminho}", width="stretch")
+
 def renderizar_tela_bloqueio_financeiro():
     user = st.session_state.user_info
     token_mp = st.secrets.get("MP_ACCESS_TOKEN")
@@ -371,10 +359,10 @@ def renderizar_tela_bloqueio_financeiro():
                 }
                 
                 try:
-                    res = requests.post(url, json=payload, headers=headers).json()
+                    res = http_cliente.post(url, json=payload, headers=headers).json()
                     if "id" in res:
                         mp_id = str(res["id"])
-                        supabase = create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+                        supabase = obter_supabase()
                         supabase.table("usuarios_app").update({"id_pagamento_mp": mp_id}).eq("id", user['id']).execute()
                         st.session_state.user_info['id_pagamento_mp'] = mp_id
                         st.rerun()
@@ -390,12 +378,12 @@ def renderizar_tela_bloqueio_financeiro():
         headers = {"Authorization": f"Bearer {token_mp}"}
         
         try:
-            res = requests.get(url, headers=headers).json()
+            res = http_cliente.get(url, headers=headers).json()
             status = res.get("status")
 
             if status == "approved":
                 st.success("✅ Pagamento Aprovado! Liberando acesso...")
-                supabase = create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+                supabase = obter_supabase()
                 supabase.table("usuarios_app").update({
                     "bloqueado": False, 
                     "status_pagamento": True,
@@ -421,14 +409,14 @@ def renderizar_tela_bloqueio_financeiro():
                             st.rerun()
                         
                         if st.button("❌ Cancelar e gerar novo PIX", type="secondary"):
-                            supabase = create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+                            supabase = obter_supabase()
                             supabase.table("usuarios_app").update({"id_pagamento_mp": None}).eq("id", user['id']).execute()
                             st.rerun()
             
             else:
                 st.warning("A cobrança anterior expirou.")
                 if st.button("Gerar Nova Cobrança"):
-                    supabase = create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+                    supabase = obter_supabase()
                     supabase.table("usuarios_app").update({"id_pagamento_mp": None}).eq("id", user['id']).execute()
                     st.rerun()
 
@@ -528,4 +516,27 @@ def renderizar_edicao_perfil(supabase_client, user):
                     time.sleep(1)
                     st.rerun()
                 except Exception as e:
-                    st.error(f"Erro ao atualizar calibragem: {e}")
\ No newline at end of file
+                    st.error(f"Erro ao atualizar calibragem: {e}")
+
+        # ==========================================
+        # FORMULÁRIO 3: RESUMO NO WHATSAPP
+        # ==========================================
+        with st.form(key="form_resumo_whatsapp"):
+            st.subheader("📲 Avisos no WhatsApp")
+            st.caption("Treinos que chegam juntos (brick, relógio sincronizando atrasado) podem vir num resumo só.")
+            
+            opcoes_resumo = {0: "Uma mensagem por treino", 10: "Resumo a cada 10 min", 30: "Resumo a cada 30 min", 60: "Resumo a cada 1 hora"}
+            janela_atual = int(user.get('janela_resumo_min') or 0)
+            if janela_atual not in opcoes_resumo:
+                opcoes_resumo[janela_atual] = f"Resumo a cada {janela_atual} min"
+            nova_janela = st.selectbox("Modo de envio", options=list(opcoes_resumo), index=list(opcoes_resumo).index(janela_atual), format_func=opcoes_resumo.get)
+            
+            if st.form_submit_button("💾 Salvar Preferência", width="stretch"):
+                try:
+                    supabase_client.table("usuarios_app").update({"janela_resumo_min": nova_janela}).eq("id", user['id']).execute()
+                    st.session_state.user_info.update({"janela_resumo_min": nova_janela})
+                    st.toast("Preferência de avisos atualizada!", icon="✅")
+                    time.sleep(1)
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Erro ao atualizar preferência: {e}")
\ No newline at end of file
@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from modules import metricas
+from modules.conexao import ler_config
+
+# Qual transporte entrega as mensagens: "twilio" (produção) ou "local" (testes/benchmarks)
+TRANSPORTE_PADRAO = os.getenv("WHATSAPP_TRANSPORTE", "twilio").lower()
+
+# Intervalo mínimo entre duas mensagens para o mesmo número
+INTERVALO_POR_DESTINO_SEG = float(os.getenv("WHATSAPP_INTERVALO_DESTINO_SEG", 2))
+
+# Envios simultâneos num disparo em massa
+MAX_ENVIOS_PARALELOS = int(os.getenv("WHATSAPP_MAX_ENVIOS_PARALELOS", 4))
+
+# Número do sandbox do Twilio, usado se TWILIO_PHONE_NUMBER não estiver configurado
+REMETENTE_SANDBOX = "14155238886"
+
+class ErroPermanente(Exception):
+    """Erro que não adianta tentar de novo (número inválido, destino recusado...)."""
+
+def _config_twilio(*nomes):
+    """Procura a credencial pelos nomes usados ao longo do projeto (raiz do secrets/.env ou seção [twilio])."""
+    for nome in nomes:
+        valor = ler_config(nome)
+        if valor:
+            return str(valor).strip()
+    secao = ler_config("twilio")
+    if secao:
+        for nome in nomes:
+            if secao.get(nome):
+                return str(secao[nome]).strip()
+    return None
+
+@lru_cache(maxsize=4096)
+def normalizar_telefone(telefone):
+    """
+    Telefone em qualquer formato -> 'whatsapp:+<dígitos>'. Número nacional (até 11
+    dígitos, sem '+') ganha o 55 do Brasil. Devolve None se não sobrar nenhum dígito.
+    """
+    if not telefone:
+        return None
+    texto = str(telefone).strip().replace("whatsapp:", "")
+    digitos = ''.join(filter(str.isdigit, texto))
+    if not digitos:
+        return None
+    if not texto.startswith("+") and len(digitos) <= 11:
+        digitos = f"55{digitos}"
+    return f"whatsapp:+{digitos}"
+
+def destino_padrao():
+    """Para onde vão as mensagens sem telefone do atleta (celular do treinador)."""
+    return normalizar_telefone(f"+{str(ler_config('MEU_CELULAR') or '').strip().lstrip('+')}")
+
+class TransporteTwilio:
+    """Entrega pelo Twilio com um único Client por processo (a sessão HTTP é reaproveitada)."""
+
+    def __init__(self):
+        self._cliente = None
+        self._trava = threading.Lock()
+
+    def _obter_cliente(self):
+        if self._cliente is None:
+            with self._trava:
+                if self._cliente is None:
+                    from twilio.rest import Client
+                    self._cliente = Client(
+                        _config_twilio("TWILIO_SID", "TWILIO_ACCOUNT_SID"),
+                        _config_twilio("TWILIO_TOKEN", "TWILIO_AUTH_TOKEN"),
+                    )
+        return self._cliente
+
+    def enviar(self, remetente, destino, corpo):
+        from twilio.base.exceptions import TwilioRestException
+        try:
+            mensagem = self._obter_cliente().messages.create(body=corpo, from_=remetente, to=destino)
+        except TwilioRestException as e:
+            if e.status and 400 <= e.status < 500 and e.status != 429:
+                raise ErroPermanente(f"Twilio {e.status}/{e.code}: {e.msg}") from e
+            raise
+        return mensagem.sid
+
+class TransporteLocal:
+    """
+    Substituto do Twilio para testes e benchmarks: guarda as mensagens em memória.
+    `latencia_seg` simula o tempo de resposta da API e `falhar` (callable que recebe
+    o destino) permite simular erros.
+    """
+
+    def __init__(self, latencia_seg=0.0, falhar=None):
+        self.latencia_seg = latencia_seg
+        self.falhar = falhar
+        self.enviadas = []
+        self._trava = threading.Lock()
+
+    def enviar(self, remetente, destino, corpo):
+        if self.latencia_seg:
+            time.sleep(self.latencia_seg)
+        if self.falhar and self.falhar(destino):
+            raise RuntimeError(f"falha simulada para {destino}")
+        with self._trava:
+            self.enviadas.append({"de": remetente, "para": destino, "corpo": corpo})
+            return f"LOCAL{len(self.enviadas):06d}"
+
+class GatewayWhatsApp:
+    """Ponto único de envio de WhatsApp: normaliza o número, espaça envios ao mesmo destino e entrega pelo transporte."""
+
+    def __init__(self, transporte=None, intervalo_destino_seg=None):
+        self.transporte = transporte or self._transporte_padrao()
+        self.intervalo_destino_seg = INTERVALO_POR_DESTINO_SEG if intervalo_destino_seg is None else intervalo_destino_seg
+        self._ultimo_envio_destino = {}
+        self._trava_destinos = threading.Lock()
+
+    @staticmethod
+    def _transporte_padrao():
+        return TransporteLocal() if TRANSPORTE_PADRAO == "local" else TransporteTwilio()
+
+    def remetente(self):
+        numero = _config_twilio("TWILIO_PHONE_NUMBER") or REMETENTE_SANDBOX
+        return f"whatsapp:+{numero.replace('whatsapp:', '').lstrip('+')}"
+
+    def _aguardar_vez(self, destino):
+        """Segura o envio até ter passado o intervalo mínimo desde a última mensagem ao número."""
+        with self._trava_destinos:
+            agora = time.monotonic()
+            liberado_em = max(agora, self._ultimo_envio_destino.get(destino, 0) + self.intervalo_destino_seg)
+            self._ultimo_envio_destino[destino] = liberado_em
+        if liberado_em > agora:
+            time.sleep(liberado_em - agora)
+
+    def enviar(self, telefone, corpo):
+        """Envia uma mensagem e devolve o SID. Sem telefone, vai para o destino padrão."""
+        destino = normalizar_telefone(telefone) if telefone else destino_padrao()
+        if not destino:
+            raise ErroPermanente(f"telefone inválido: {telefone!r}")
+        self._aguardar_vez(destino)
+        metricas.contar("idas_e_voltas", destino="whatsapp")
+        with metricas.medir("whatsapp_envio", transporte=type(self.transporte).__name__):
+            return self.transporte.enviar(self.remetente(), destino, corpo)
+
+    def enviar_em_massa(self, mensagens, max_workers=None):
+        """
+        Disparo para vários números (ex.: aviso para a equipe toda).
+        `mensagens` é uma lista de (telefone, corpo); números repetidos (depois de
+        normalizados) recebem uma mensagem só. Retorna {destino: (ok, sid_ou_erro)}.
+        """
+        unicas = {}
+        invalidos = {}
+        for telefone, corpo in mensagens:
+            destino = normalizar_telefone(telefone)
+            if not destino:
+                invalidos[str(telefone)] = (False, "telefone inválido")
+            elif destino not in unicas:
+                unicas[destino] = corpo
+
+        def _enviar(item):
+            destino, corpo = item
+            try:
+                return destino, (True, self.enviar(destino, corpo))
+            except Exception as e:
+                return destino, (False, str(e))
+
+        with ThreadPoolExecutor(max_workers=max_workers or MAX_ENVIOS_PARALELOS, thread_name_prefix="zap-massa") as pool:
+            resultados = dict(pool.map(_enviar, unicas.items()))
+        resultados.update(invalidos)
+        return resultados
+
+# Instância única do processo
+gateway = GatewayWhatsApp()
+
+def definir_transporte(transporte):
+    """Troca o transporte do gateway (ex.: TransporteLocal nos testes e benchmarks)."""
+    gateway.transporte = transporte
+    return transporte
+
+def enviar(telefone, corpo):
+    return gateway.enviar(telefone, corpo)
+
+def enviar_em_massa(mensagens, max_workers=None):
+    return gateway.enviar_em_massa(mensagens, max_workers)
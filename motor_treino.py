@@ -1,12 +1,8 @@
-import os
 import math
-from dotenv import load_dotenv
-from supabase import create_client
-
-load_dotenv()
+from modules.conexao import obter_supabase
 
 # Conexão
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+supabase = obter_supabase()
 
 def calcular_trimp(duracao_min, fc_media, fc_repouso, fc_maxima, sexo):
     """Implementa a fórmula da Folha 2"""
@@ -1,205 +1,546 @@
+import threading
 import time
-import requests
-from datetime import datetime, timedelta
-import math
-from supabase import create_client
-import streamlit as st
-import pandas as pd
+from datetime import date, datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 
 # Importação da nossa nova lógica de tokens
-from auth_strava import obter_token_valido
+from auth_strava import descartar_token, obter_token_valido, pre_renovar_tokens
+from modules.carga import JanelaCarga, calcular_trimp_banister, emoji_carga
+from modules.agenda_polling import atualizar_histograma, calcular_proximo_poll
+from modules.agendador_strava import requisitar_strava, tem_cota_no_dia, CotaDiariaEsgotada, PRIORIDADE_ALTA, PRIORIDADE_NORMAL
+from modules.conexao import obter_supabase, ler_config
+from modules.logs import obter_logger
+from modules.metricas import contar, medir, medir_banco
+from modules.notificacoes import notificacao_treino
+from modules.painel import atualizar_snapshot_painel, invalidar_atleta
 
-# Configurações lidas do st.secrets
-SUPABASE_URL = st.secrets["SUPABASE_URL"]
-SUPABASE_KEY = st.secrets["SUPABASE_KEY"]
+log = obter_logger("sync")
+
+# Quantos atletas são sincronizados em paralelo por ciclo
+MAX_WORKERS_SYNC = int(ler_config("SYNC_MAX_WORKERS", 8))
+
+# Janela da ressincronização completa e sobreposição aplicada ao cursor de cada atleta
+JANELA_SYNC_DIAS = 7
+SOBREPOSICAO_CURSOR_HORAS = 3
+
+# Tamanho de página pedido ao Strava (máximo aceito pela API)
+POR_PAGINA_STRAVA = 200
+
+# Roster do sync: só as colunas que os workers usam, lidas em páginas
+COLUNAS_ROSTER = "user_id, athlete_id, access_token, refresh_token, expires_at, ultima_atividade_em, histograma_horas, ultimo_webhook_em, nome, telefone, fc_maxima, janela_resumo_min"
+TAMANHO_PAGINA_ROSTER = 500
+
+# De quantos em quantos atletas o ciclo do robô confere se ainda pode continuar (lease)
+ATLETAS_POR_CHECAGEM = 50
 
 try:
-    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    supabase = obter_supabase()
 except Exception as e:
-    print(f"⚠️ ERRO Supabase: {e}")
+    log.error(f"⚠️ ERRO Supabase: {e}")
 
-def calcular_trimp_banister(duracao_min, fc_media, fc_max, fc_repouso=60):
-    """Calcula a carga de treino baseada na FC Máxima individual do aluno."""
-    if not fc_media or fc_media <= 0: 
-        return int(duracao_min * 1.5)
-    
-    max_heart = fc_max if fc_max and fc_max > 0 else 185
-    
+def _ler_instante(valor):
+    """Converte o texto ISO do Strava/Supabase em datetime com fuso (UTC se não vier fuso)."""
+    if not valor:
+        return None
+    try:
+        instante = datetime.fromisoformat(str(valor).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return instante if instante.tzinfo else instante.replace(tzinfo=timezone.utc)
+
+def calcular_inicio_busca(u, origem_botao=False):
+    """
+    Define o `after=` da chamada ao Strava para este atleta.
+    - Botão (ressincronização completa) ou atleta sem cursor: janela fixa de 7 dias.
+    - Demais casos: a partir do treino mais recente já visto, com uma pequena
+      sobreposição para pegar edições feitas logo depois do upload.
+    """
+    janela_completa = datetime.now(timezone.utc) - timedelta(days=JANELA_SYNC_DIAS)
+    cursor = _ler_instante(u.get('ultima_atividade_em'))
+
+    if origem_botao or not cursor:
+        return int(janela_completa.timestamp())
+
+    inicio = cursor - timedelta(hours=SOBREPOSICAO_CURSOR_HORAS)
+    return int(inicio.timestamp())
+
+def avancar_cursor(u, atividades, via_webhook=False):
+    """
+    Grava o cursor do atleta (start_date mais recente visto e horário do último sync
+    bem-sucedido) e reagenda o próximo poll dele a partir do padrão de treinos.
+    Com `via_webhook=True` o cursor (ultima_atividade_em) e o histograma ficam como
+    estão: só o polling avança o cursor. Se o webhook de um treino anterior se perdeu,
+    o próximo poll ainda começa antes dele e o encontra.
+    """
+    cursor_anterior = _ler_instante(u.get('ultima_atividade_em'))
+    cursor = cursor_anterior
+    novas = []
+    for act in atividades:
+        inicio = _ler_instante(act.get('start_date'))
+        if inicio and (not cursor_anterior or inicio > cursor_anterior):
+            novas.append(act)
+        if inicio and (not cursor or inicio > cursor):
+            cursor = inicio
+
+    agora = datetime.now(timezone.utc)
+    if via_webhook:
+        # O polling soma estes treinos ao histograma quando passar por eles
+        histograma = u.get('histograma_horas')
+        ultimo_webhook = agora
+    else:
+        histograma = atualizar_histograma(u.get('histograma_horas'), novas)
+        ultimo_webhook = u.get('ultimo_webhook_em')
+
+    dados_cursor = {
+        "proximo_poll_em": calcular_proximo_poll(histograma, cursor, ultimo_webhook, agora).isoformat(),
+    }
+    if via_webhook:
+        dados_cursor["ultimo_webhook_em"] = agora.isoformat()
+    else:
+        dados_cursor["histograma_horas"] = histograma
+        dados_cursor["ultimo_sync_em"] = agora.isoformat()
+        if cursor:
+            dados_cursor["ultima_atividade_em"] = cursor.isoformat()
+
+    with medir_banco("escrita", "auth_strava"):
+        supabase.table("auth_strava").update(dados_cursor).eq("user_id", u['user_id']).execute()
+    u.update(dados_cursor)
+
+def processar_atleta(u, origem_botao=False, progresso=None):
+    """
+    Sincroniza um único atleta a partir da sua linha do roster.
+    Roda dentro de um worker do pool: qualquer erro fica restrito a este atleta.
+    `progresso(etapa, **dados)`, se passado, é avisado a cada etapa (tela do aluno).
+    """
+    with medir("atleta", origem="botao" if origem_botao else "robo") as span:
+        span.anotar(user_id=u['user_id'])
+        _sincronizar_atleta(u, origem_botao, progresso or (lambda etapa, **dados: None))
+
+def _sincronizar_atleta(u, origem_botao, progresso):
+    user_id = u['user_id']
+
+    # Nome, telefone e FC já vêm na linha do roster; bloqueados, vencidos e
+    # administradores foram filtrados no próprio banco (view roster_sincronizacao)
+    u_data = u
+
+    # --- OBTENÇÃO DO TOKEN ---
+    progresso("token")
+    with medir("token"):
+        token = obter_token_valido(user_id, dados_auth=u)
+    if not token:
+        log.warning(f"🔑 Sem token válido para {u_data['nome']}: atleta pulado neste ciclo.")
+        contar("atletas_sem_token")
+        progresso("erro", erro="Sem acesso válido ao Strava. Reconecte sua conta.")
+        return
+
+    # --- BUSCA NO STRAVA (a partir do cursor do atleta, página a página) ---
+    after_date = calcular_inicio_busca(u, origem_botao)
+    prioridade = PRIORIDADE_ALTA if origem_botao else PRIORIDADE_NORMAL
+
+    vistas = []
+    pagina = 1
+    while True:
+        progresso("strava", pagina=pagina)
+        atividades = buscar_pagina_strava(token, after_date, pagina, prioridade=prioridade, user_id=user_id)
+        if atividades is None:
+            progresso("erro", erro="O Strava recusou a busca. Tente de novo em alguns minutos.")
+            return
+
+        log.debug(f"🏃‍♂️ {len(atividades)} atividade(s) do Strava para {u_data['nome']} (página {pagina})")
+        progresso("gravando", atividades=len(atividades))
+        persistir_atividades(atividades, user_id, u_data, origem_botao=origem_botao)
+        vistas.extend(atividades)
+
+        if len(atividades) < POR_PAGINA_STRAVA:
+            break
+        pagina += 1
+
+    progresso("cursor")
+    avancar_cursor(u, vistas)
+
+def buscar_pagina_strava(token, after_date, pagina=1, por_pagina=None, prioridade=PRIORIDADE_NORMAL, user_id=None):
+    """
+    Busca uma página de /athlete/activities com `after=` (o Strava devolve em ordem
+    crescente de data). Retorna a lista de atividades ou None se o Strava respondeu erro.
+    A chamada passa pelo agendador global, que respeita a cota do app.
+    Em 401 o token de `user_id` sai do cache, para a próxima tentativa não repetir um
+    token revogado.
+    """
+    por_pagina = por_pagina or POR_PAGINA_STRAVA
+    headers = {'Authorization': f'Bearer {token}'}
+    url_strava = f"/api/v3/athlete/activities?after={after_date}&page={pagina}&per_page={por_pagina}"
+    with medir("strava_busca") as span:
+        resposta_strava = requisitar_strava("GET", url_strava, prioridade=prioridade, headers=headers)
+        atividades = resposta_strava.json()
+        span.anotar(status=resposta_strava.status_code, pagina=pagina)
+    log.debug(f"🌐 Strava {url_strava}: {resposta_strava.status_code}")
+
+    if resposta_strava.status_code == 401 and user_id:
+        descartar_token(user_id)
+    if isinstance(atividades, dict) and "message" in atividades:
+        log.warning(f"❌ Erro retornado pela API do Strava ({resposta_strava.status_code}): {atividades}")
+        return None
+
+    return atividades if isinstance(atividades, list) else []
+
+def persistir_atividades(atividades, user_id, u_data, origem_botao=False, janela=None, notificar=True):
+    """
+    Grava uma página de atividades do Strava de uma vez só:
+    1 consulta para descobrir quais strava_id já existem e 1 upsert (chave strava_id)
+    com tudo que é novo ou precisa ser reprocessado. Só as atividades novas notificam:
+    o aviso entra na outbox notificacoes_whatsapp na mesma transação do upsert.
+    A carga 7d/30d vem de uma JanelaCarga; se `janela` não for passada, ela é
+    carregada aqui uma única vez para a página inteira.
+    Com `notificar=False` (importação de histórico) nenhuma mensagem é enfileirada.
+    Retorna os strava_id da página que já estavam no banco e não foram regravados.
+    """
+    fc_aluno = u_data.get('fc_maxima', 185)
+
+    validas = []
+    for act in atividades:
+        nome_atividade = act.get('name', 'Treino')
+        dist = act.get('distance', 0) / 1000
+        dur_min = int(act.get('moving_time', 0) / 60)
+
+        # CORRIGIDO AQUI: Alinhamento preciso da trava de validação rápida
+        if dur_min < 1 and dist < 0.01:
+            log.debug(f"⚠️ Atividade {nome_atividade} ignorada por ser muito curta ({dur_min} min, {dist} km)")
+            continue
+        validas.append(act)
+
+    if not validas:
+        return set()
+
+    # --- CHECAGEM DE EXISTÊNCIA EM LOTE (1 round-trip por página) ---
+    ids_pagina = [str(act['id']) for act in validas]
+    with medir_banco("leitura", "atividades_fisicas"):
+        existentes_db = supabase.table("atividades_fisicas").select("id, strava_id, notificacao").in_("strava_id", ids_pagina).execute()
+    existentes = {str(r['strava_id']) for r in (existentes_db.data or [])}
+
+    a_processar = [act for act in validas if origem_botao or str(act['id']) not in existentes]
+    pulados = existentes - {str(act['id']) for act in a_processar}
+    if not a_processar:
+        return pulados
+
+    # A janela precisa receber os treinos em ordem cronológica
+    a_processar.sort(key=lambda act: act.get('start_date_local') or date.today().isoformat())
+    if janela is None:
+        with medir_banco("leitura", "atividades_fisicas"):
+            janela = JanelaCarga.carregar(
+                supabase, user_id,
+                desde=a_processar[0].get('start_date_local') or date.today(),
+                ignorar_strava_ids=[str(act['id']) for act in a_processar]
+            )
+
+    registros = []
+    notificacoes = []
+    for act in a_processar:
+        strava_id = str(act['id'])
+        nome_atividade = act.get('name', 'Treino')
+        log.debug(f"🔹 Processando atividade: {nome_atividade} (ID: {strava_id})")
+
+        nova = strava_id not in existentes
+        dist = act.get('distance', 0) / 1000
+        dur_min = int(act.get('moving_time', 0) / 60)
+        fc_media = act.get('average_heartrate', 0)
+
+        if fc_media and fc_media > 0:
+            trimp_atual = calcular_trimp_banister(dur_min, fc_media, fc_aluno)
+            nota_manual = ""
+        else:
+            trimp_atual = int(dur_min * 1.5)
+            nota_manual = "\n\n⚠️ *Nota:* Treino sem dados de FC. Carga estimada pelo tempo."
+
+        data_bruta = act.get('start_date_local', '')
+        data_limpa = data_bruta[:10] if data_bruta else None
+
+        t_semanal, t_mensal = janela.adicionar(data_limpa or date.today(), trimp_atual)
+
+        emoji_dia = emoji_carga(trimp_atual, 'dia')
+        emoji_sem = emoji_carga(t_semanal, 'sem')
+        emoji_men = emoji_carga(t_mensal, 'men')
+
+        alertas = []
+        if emoji_dia == "🔴": alertas.append(f"Treino Atual ({trimp_atual})")
+        if emoji_sem == "🔴": alertas.append(f"Carga 7 dias ({t_semanal})")
+        if emoji_men == "🔴": alertas.append(f"Carga 30 dias ({t_mensal})")
+
+        aviso_seg = ""
+        if alertas:
+            texto_alertas = " e ".join(alertas)
+            aviso_seg = f"\n\n⚠️ *Atenção:* Sua carga de {texto_alertas} está alta! Fale com o Prof. Fabio Hanada. 👊"
+
+        aviso_seg += nota_manual
+
+        dados_banco = {
+            "id_atleta": user_id, 
+            "strava_id": strava_id,
+            "data_treino": data_limpa,
+            "distancia": round(dist, 2), 
+            "duracao": dur_min,
+            "name": nome_atividade,
+            "trimp_score": trimp_atual,
+            "trimp_semanal": t_semanal,
+            "trimp_mensal": t_mensal,
+            "notificacao": True
+        }
+        registros.append(dados_banco)
+
+        if nova:
+            dados_notificacao = dados_banco.copy()
+            dados_notificacao.update({
+                "duracao_formatada": f"{dur_min//60:02d}:{dur_min%60:02d}",
+                "emoji_dia": emoji_dia,
+                "emoji_semana": emoji_sem,
+                "emoji_mensal": emoji_men,
+                "aviso_seguranca": aviso_seg,
+                "sem_fc": bool(nota_manual)
+            })
+            notificacoes.append(dados_notificacao)
+
+    if not registros:
+        return pulados
+
+    # --- GRAVAÇÃO EM LOTE (upsert idempotente pela chave strava_id) ---
+    qtd_novas = len(notificacoes)
+    log.debug(f"💾 Gravando {len(registros)} atividade(s) ({qtd_novas} nova(s), {len(registros) - qtd_novas} atualizada(s))")
+    if notificar and notificacoes:
+        # Atividades e avisos das novas vão juntos para o banco (outbox notificacoes_whatsapp);
+        # quem fala com o Twilio é o processar_notificacoes.py, o sync não espera envio.
+        with medir_banco("rpc", "gravar_atividades_com_notificacoes"):
+            supabase.rpc("gravar_atividades_com_notificacoes", {
+                "p_atividades": registros,
+                "p_notificacoes": [notificacao_treino(dados, u_data) for dados in notificacoes],
+            }).execute()
+    else:
+        with medir_banco("escrita", "atividades_fisicas"):
+            supabase.table("atividades_fisicas").upsert(registros, on_conflict="strava_id").execute()
+    atualizar_painel(user_id)
+    contar("atividades_gravadas", qtd_novas, tipo="nova")
+    contar("atividades_gravadas", len(registros) - qtd_novas, tipo="atualizada")
+    return pulados
+
+def atualizar_painel(user_id):
+    """
+    Regrava o retrato do painel do atleta (painel_atleta) depois de uma escrita nos treinos dele.
+    Se falhar, o treino já está gravado: o painel só é invalidado e o retrato sai na próxima leitura/escrita.
+    """
     try:
-        reserva = (fc_media - fc_repouso) / (max_heart - fc_repouso)
-        reserva = max(0, min(reserva, 1)) 
-        
-        trimp = duracao_min * reserva * 0.64 * math.exp(1.92 * reserva)
-        return int(trimp)
+        atualizar_snapshot_painel(supabase, user_id)
     except Exception as e:
-        print(f"Erro no cálculo TRIMP: {e}")
-        return int(duracao_min * 1.5)
+        log.warning(f"⚠️ Retrato do painel de {user_id} não atualizado: {e}")
+        invalidar_atleta(user_id)
 
-def buscar_acumulados_trimp(user_id, trimp_atual):
-    hoje = datetime.now()
-    uma_semana = (hoje - timedelta(days=7)).strftime('%Y-%m-%d')
-    um_mes = (hoje - timedelta(days=30)).strftime('%Y-%m-%d')
+def carregar_roster(user_id_especifico=None, tamanho_pagina=None, apenas_devidos=False):
+    """
+    Gerador com o roster do sync, lido da view roster_sincronizacao (auth_strava +
+    usuarios_app já sem bloqueados, vencidos e administradores).
+    Vem em páginas por keyset (user_id), então os workers começam antes do roster acabar.
+    Com `apenas_devidos`, traz só quem já chegou no proximo_poll_em agendado.
+    """
+    tamanho_pagina = tamanho_pagina or TAMANHO_PAGINA_ROSTER
+    agora = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    ultimo_id = None
+    total = 0
+    while True:
+        query = supabase.table("roster_sincronizacao").select(COLUNAS_ROSTER).order("user_id").limit(tamanho_pagina)
+        if user_id_especifico:
+            query = query.eq("user_id", user_id_especifico)
+        if apenas_devidos:
+            query = query.or_(f"proximo_poll_em.is.null,proximo_poll_em.lte.{agora}")
+        if ultimo_id:
+            query = query.gt("user_id", ultimo_id)
 
-    res = supabase.table("atividades_fisicas").select("trimp_score, data_treino").eq("id_atleta", user_id).gte("data_treino", um_mes).execute()
-    
-    total_7d = trimp_atual
-    total_30d = trimp_atual
-
-    if res.data:
-        for treino in res.data:
-            score = treino.get('trimp_score', 0)
-            data_t = treino.get('data_treino')
-            if data_t >= uma_semana:
-                total_7d += score
-            total_30d += score
-            
-    return int(total_7d), int(total_30d)
-
-def processar_novos_treinos(user_id_especifico=None, origem_botao=False):
+        with medir_banco("leitura", "roster_sincronizacao"):
+            pagina = query.execute().data or []
+        total += len(pagina)
+        yield from pagina
+
+        if len(pagina) < tamanho_pagina:
+            log.info(f"🔍 Atletas no roster de sincronização: {total}")
+            return
+        ultimo_id = pagina[-1]['user_id']
+
+def _com_pre_renovacao(roster, tamanho_lote=None):
+    """Repassa o roster em lotes, renovando antes os tokens do lote que estão para vencer."""
+    tamanho_lote = tamanho_lote or TAMANHO_PAGINA_ROSTER
+    lote = []
+    for u in roster:
+        lote.append(u)
+        if len(lote) >= tamanho_lote:
+            pre_renovar_tokens(lote)
+            yield from lote
+            lote = []
+    if lote:
+        pre_renovar_tokens(lote)
+        yield from lote
+
+def _registrar_resultado(futuro, u, tipo):
+    """Coleta o resultado de um worker sem deixar a falha de um atleta derrubar o ciclo."""
+    try:
+        futuro.result()
+        contar("atletas_sincronizados", resultado="ok")
+        return True
+    except CotaDiariaEsgotada as e:
+        # O cursor não andou: o atleta entra de novo no próximo ciclo com cota
+        log.warning(f"⏸️ [{tipo}] Atleta {u.get('user_id')} adiado: {e}")
+        contar("atletas_sincronizados", resultado="sem_cota")
+        return False
+    except Exception as erro_atleta:
+        log.error(f"❌ [{tipo}] Erro ao processar atleta {u.get('user_id')}: {erro_atleta}")
+        contar("atletas_sincronizados", resultado="erro")
+        return False
+
+def sincronizar_roster(roster, origem_botao=False, max_workers=None, continuar=None):
+    """
+    Motor de sincronização concorrente.
+    Consome o roster (qualquer iterável de linhas da auth_strava) como um fluxo e
+    mantém no máximo `max_workers` atletas em processamento ao mesmo tempo.
+    `continuar` (p.ex. a renovação do lease do vigilante) é chamado antes do primeiro
+    atleta e a cada ATLETAS_POR_CHECAGEM; se retornar False, nenhum atleta novo é
+    puxado e o ciclo termina com os que já estão em andamento. O mesmo vale quando a
+    cota diária do Strava para a prioridade do ciclo acaba.
+    Retorna a tupla (sucessos, falhas).
+    """
     tipo = "BOTÃO" if origem_botao else "ROBÔ"
-    print(f"🤖 [{tipo}] Iniciando verificação... {datetime.now().strftime('%H:%M:%S')}")
+    prioridade = PRIORIDADE_ALTA if origem_botao else PRIORIDADE_NORMAL
+    limite = max(1, int(max_workers or MAX_WORKERS_SYNC))
+    sucessos = falhas = 0
+
+    with ThreadPoolExecutor(max_workers=limite, thread_name_prefix="sync-atleta") as pool:
+        em_andamento = {}
+        for indice, u in enumerate(roster):
+            if continuar and indice % ATLETAS_POR_CHECAGEM == 0 and not continuar():
+                log.warning(f"⏹️ [{tipo}] Ciclo interrompido depois de {indice} atleta(s): não pode mais continuar.")
+                break
+            if not tem_cota_no_dia(prioridade):
+                log.warning(f"⏸️ [{tipo}] Ciclo interrompido depois de {indice} atleta(s): sem cota diária do Strava.")
+                break
+            # Pool cheio: espera alguém terminar antes de puxar o próximo atleta do fluxo
+            if len(em_andamento) >= limite:
+                concluidos, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+                for futuro in concluidos:
+                    if _registrar_resultado(futuro, em_andamento.pop(futuro), tipo):
+                        sucessos += 1
+                    else:
+                        falhas += 1
+            em_andamento[pool.submit(processar_atleta, u, origem_botao)] = u
+
+        for futuro in as_completed(list(em_andamento)):
+            if _registrar_resultado(futuro, em_andamento.pop(futuro), tipo):
+                sucessos += 1
+            else:
+                falhas += 1
+
+    return sucessos, falhas
+
+def processar_novos_treinos(user_id_especifico=None, origem_botao=False, max_workers=None, pre_renovar=False, continuar=None):
+    tipo = "BOTÃO" if origem_botao else "ROBÔ"
+    log.info(f"🤖 [{tipo}] Iniciando verificação...")
     
     try:
-        query = supabase.table("auth_strava").select("*")
-        if user_id_especifico:
-            query = query.eq("user_id", user_id_especifico)
-        
-        usuarios = query.execute().data
-        print(f"🔍 [DIAGNÓSTICO] Usuários encontrados na auth_strava: {len(usuarios) if usuarios else 0}")
-        if not usuarios: return
-
-        for u in usuarios:
-            user_id = u['user_id']
-            
-            # --- BUSCA DADOS DO ALUNO ---
-            u_info_db = supabase.table("usuarios_app").select("nome, telefone, bloqueado, data_vencimento, fc_maxima").eq("id", user_id).execute()
-            
-            if not u_info_db.data:
-                print(f"⚠️ [DIAGNÓSTICO] Aluno {user_id} não encontrado na tabela usuarios_app.")
-                continue
-                
-            u_data = u_info_db.data[0]
-            hoje_date = datetime.now().date()
-            fc_aluno = u_data.get('fc_maxima', 185)
-
-            # --- CHECAGEM DE BLOQUEIO/VENCIMENTO ---
-            try:
-                venc_date = pd.to_datetime(u_data['data_vencimento']).date() if u_data['data_vencimento'] else hoje_date
-            except:
-                venc_date = hoje_date
-
-            if u_data.get('bloqueado') or hoje_date > venc_date:
-                print(f"🚫 [{tipo}] {u_data['nome']} ignorado (Bloqueado/Vencido).")
-                continue 
-
-            # --- OBTENÇÃO DO TOKEN ---
-            token = obter_token_valido(user_id)
-            print(f"🔑 [DIAGNÓSTICO] Token obtido para {u_data['nome']}: {'Sucesso (Começa com ' + token[:10] + '...)' if token else 'FALHOU!'}")
-            if not token:
-                continue
-
-            # --- BUSCA NO STRAVA ---
-            headers = {'Authorization': f'Bearer {token}'}
-            after_date = int((datetime.now() - timedelta(days=7)).timestamp())
-            
-            url_strava = f"https://www.strava.com/api/v3/athlete/activities?after={after_date}"
-            print(f"🌐 [DIAGNÓSTICO] Fazendo chamada para o Strava: {url_strava}")
-            
-            resposta_strava = requests.get(url_strava, headers=headers)
-            print(f"📊 [DIAGNÓSTICO] Status Code do Strava: {resposta_strava.status_code}")
-            
-            atividades = resposta_strava.json()
-            
-            if isinstance(atividades, dict) and "message" in atividades:
-                print(f"❌ [DIAGNÓSTICO] Erro retornado pela API do Strava: {atividades}")
-                continue
-
-            print(f"🏃‍♂️ [DIAGNÓSTICO] Quantidade de atividades devolvidas pelo Strava: {len(atividades) if isinstance(atividades, list) else 0}")
-
-            if isinstance(atividades, list):
-                for act in atividades:
-                    strava_id = str(act['id'])
-                    nome_atividade = act.get('name', 'Treino')
-                    print(f"   🔹 Processando atividade encontrada: {nome_atividade} (ID: {strava_id})")
-                    
-                    dist = act.get('distance', 0) / 1000
-                    dur_min = int(act.get('moving_time', 0) / 60)
-                    
-                    # CORRIGIDO AQUI: Alinhamento preciso da trava de validação rápida
-                    if dur_min < 1 and dist < 0.01:
-                        print(f"   ⚠️ Atividade {nome_atividade} ignorada por ser muito curta ({dur_min} min, {dist} km)")
-                        continue 
-
-                    fc_media = act.get('average_heartrate', 0) 
-                    
-                    existe = supabase.table("atividades_fisicas").select("id, notificacao").eq("strava_id", strava_id).execute()
-                    
-                    if not existe.data or origem_botao:
-                        if fc_media and fc_media > 0:
-                            trimp_atual = calcular_trimp_banister(dur_min, fc_media, fc_aluno)
-                            nota_manual = ""
-                        else:
-                            trimp_atual = int(dur_min * 1.5)
-                            nota_manual = "\n\n⚠️ *Nota:* Treino sem dados de FC. Carga estimada pelo tempo."
-
-                        t_semanal, t_mensal = buscar_acumulados_trimp(user_id, trimp_atual)
-
-                        emoji_dia = "🟢" if trimp_atual <= 70 else "🟡" if trimp_atual <= 150 else "🔴"
-                        emoji_sem = "🟢" if t_semanal <= 400 else "🟡" if t_semanal <= 800 else "🔴"
-                        emoji_men = "🟢" if t_mensal <= 1500 else "🟡" if t_mensal <= 3000 else "🔴"
-
-                        alertas = []
-                        if emoji_dia == "🔴": alertas.append(f"Treino Atual ({trimp_atual})")
-                        if emoji_sem == "🔴": alertas.append(f"Carga 7 dias ({t_semanal})")
-                        if emoji_men == "🔴": alertas.append(f"Carga 30 dias ({t_mensal})")
-
-                        aviso_seg = ""
-                        if alertas:
-                            texto_alertas = " e ".join(alertas)
-                            aviso_seg = f"\n\n⚠️ *Atenção:* Sua carga de {texto_alertas} está alta! Fale com o Prof. Fabio Hanada. 👊"
-
-                        aviso_seg += nota_manual
-                        data_bruta = act.get('start_date_local', '')
-                        data_limpa = data_bruta[:10] if data_bruta else None
-
-                        dados_banco = {
-                            "id_atleta": user_id, 
-                            "strava_id": strava_id,
-                            "data_treino": data_limpa,
-                            "distancia": round(dist, 2), 
-                            "duracao": dur_min,
-                            "name": nome_atividade,
-                            "trimp_score": trimp_atual,
-                            "trimp_semanal": t_semanal,
-                            "trimp_mensal": t_mensal,
-                            "notificacao": True
-                        }
-
-                        if not existe.data:
-                            print(f"   💾 Tentando inserir nova atividade {nome_atividade} no Supabase...")
-                            ins_res = supabase.table("atividades_fisicas").insert(dados_banco).execute()
-                            print(f"   ✅ Resultado da inserção: {ins_res.data}")
-                            
-                            dados_notificacao = dados_banco.copy()
-                            dados_notificacao.update({
-                                "duracao_formatada": f"{dur_min//60:02d}:{dur_min%60:02d}",
-                                "emoji_dia": emoji_dia,
-                                "emoji_semana": emoji_sem,
-                                "emoji_mensal": emoji_men,
-                                "aviso_seguranca": aviso_seg
-                            })
-                            
-                            try:
-                                from modules.views import enviar_notificacao_treino
-                                enviar_notificacao_treino(dados_notificacao, u_data['nome'], u_data.get('telefone'))
-                            except Exception as err_notif:
-                                print(f"   ❌ Erro ao enviar Zap: {err_notif}")
-                        else:
-                            print(f"   🔄 Atualizando atividade existente {nome_atividade}...")
-                            supabase.table("atividades_fisicas").update(dados_banco).eq("strava_id", strava_id).execute()
+        with medir("ciclo_sync", origem="botao" if origem_botao else "robo") as span:
+            # O robô só consulta quem está com o poll vencido; botão e atleta específico vão sempre
+            roster = carregar_roster(user_id_especifico, apenas_devidos=not (user_id_especifico or origem_botao))
+            if pre_renovar:
+                roster = _com_pre_renovacao(roster)
+            sucessos, falhas = sincronizar_roster(roster, origem_botao=origem_botao, max_workers=max_workers, continuar=continuar)
+            span.anotar(sucessos=sucessos, falhas=falhas)
+        log.info(f"🏁 [{tipo}] Verificação concluída: {sucessos} atleta(s) ok, {falhas} com erro.")
 
     except Exception as e:
-        print(f"❌ Erro Fila: {e}")
+        log.exception(f"❌ Erro Fila: {e}")
+
+class TarefaSync:
+    """
+    Sync de um atleta rodando em segundo plano, acompanhado pela tela do aluno.
+    Os campos são escritos só pela thread da tarefa e lidos pelas sessões.
+    """
+
+    # Fração da barra e texto de cada etapa avisada por _sincronizar_atleta
+    ETAPAS = {
+        "fila": (0.02, "Preparando a sincronização..."),
+        "token": (0.1, "Validando o acesso ao Strava..."),
+        "strava": (0.3, "Buscando treinos no Strava..."),
+        "gravando": (0.6, "Calculando a carga dos treinos..."),
+        "cursor": (0.9, "Finalizando..."),
+        "concluida": (1.0, "Treinos sincronizados!"),
+        "erro": (1.0, "A sincronização falhou."),
+    }
+
+    def __init__(self, user_id, origem_botao=True):
+        self.user_id = user_id
+        self.origem_botao = origem_botao
+        self.etapa = "fila"
+        self.pagina = 0
+        self.atividades = 0
+        self.erro = None
+        self.iniciada_em = time.time()
+        self.concluida_em = None
+
+    @property
+    def em_andamento(self):
+        return self.concluida_em is None
+
+    @property
+    def progresso(self):
+        return self.ETAPAS[self.etapa][0]
+
+    @property
+    def mensagem(self):
+        if self.erro:
+            return self.erro
+        texto = self.ETAPAS[self.etapa][1]
+        if self.atividades:
+            texto += f" ({self.atividades} atividade(s) lidas)"
+        return texto
+
+    def avancar(self, etapa, pagina=None, atividades=0, erro=None):
+        if pagina is not None:
+            self.pagina = pagina
+        self.atividades += atividades
+        if erro:
+            self.erro = erro
+        self.etapa = etapa
+
+# Tarefas em andamento neste processo, uma por atleta
+_tarefas_sync = {}
+_trava_tarefas_sync = threading.Lock()
+
+def _executar_sync_atleta(tarefa):
+    try:
+        roster = list(carregar_roster(tarefa.user_id))
+        if not roster:
+            tarefa.avancar("erro", erro="Nenhuma conta do Strava conectada.")
+        else:
+            processar_atleta(roster[0], tarefa.origem_botao, progresso=tarefa.avancar)
+            if tarefa.erro is None:
+                tarefa.avancar("concluida")
+    except Exception as e:
+        log.exception(f"❌ Erro ao sincronizar atleta {tarefa.user_id}: {e}")
+        tarefa.avancar("erro", erro="Erro inesperado na sincronização. Tente de novo em instantes.")
+    finally:
+        tarefa.concluida_em = time.time()
+        with _trava_tarefas_sync:
+            if _tarefas_sync.get(tarefa.user_id) is tarefa:
+                del _tarefas_sync[tarefa.user_id]
+
+def iniciar_sync_atleta(user_id, origem_botao=True):
+    """
+    Dispara o sync de um atleta em segundo plano (thread daemon) e retorna a TarefaSync na hora.
+    Pedidos simultâneos para o mesmo atleta (outra aba, outra sessão) recebem a tarefa que já
+    está rodando em vez de abrir outra.
+    """
+    with _trava_tarefas_sync:
+        tarefa = _tarefas_sync.get(user_id)
+        if tarefa is not None:
+            contar("sync_atleta_pedidos", resultado="mesclado")
+            return tarefa
+        tarefa = _tarefas_sync[user_id] = TarefaSync(user_id, origem_botao)
+
+    contar("sync_atleta_pedidos", resultado="iniciado")
+    threading.Thread(target=_executar_sync_atleta, args=(tarefa,), daemon=True, name=f"sync-{user_id}").start()
+    return tarefa
 
 if __name__ == "__main__":
     while True:
@@ -0,0 +1,174 @@
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from datetime import datetime, timedelta, timezone
+
+from modules import whatsapp
+from modules.conexao import obter_supabase
+from modules.logs import obter_logger
+from modules.metricas import contar, medir, medir_banco
+from modules.notificacoes import montar_resumo_treinos
+from modules.painel import status_carga_atletas
+
+log = obter_logger("notificacoes")
+
+supabase = obter_supabase()
+
+# Quantas notificações cada worker reivindica por vez e de quanto em quanto tempo olha a fila
+LOTE_NOTIFICACOES = 50
+INTERVALO_NOTIFICACOES_SEG = 5
+
+# Reivindicação expira (worker caiu) e a notificação volta para a fila depois disso
+EXPIRACAO_REIVINDICACAO_SEG = 300
+
+# Novas tentativas com espera exponencial: 30s, 1min, 2min, 4min... até o teto
+MAX_TENTATIVAS_NOTIFICACAO = 6
+ESPERA_BASE_SEG = 30
+ESPERA_MAXIMA_SEG = 3600
+
+# Notificações enviadas/desistidas são apagadas depois de alguns dias
+RETENCAO_NOTIFICACOES_DIAS = 14
+
+ID_TRABALHADOR = f"{socket.gethostname()}-{os.getpid()}"
+
+def reivindicar_notificacoes(lote=None):
+    """Pega um lote de notificações prontas só para este worker (FOR UPDATE SKIP LOCKED no banco)."""
+    with medir_banco("rpc", "reivindicar_notificacoes"):
+        res = supabase.rpc("reivindicar_notificacoes", {
+            "p_lote": lote or LOTE_NOTIFICACOES,
+            "p_trabalhador": ID_TRABALHADOR,
+            "p_expiracao_seg": EXPIRACAO_REIVINDICACAO_SEG,
+        }).execute()
+    return res.data or []
+
+def marcar_enviadas(notificacoes, sid):
+    with medir_banco("escrita", "notificacoes_whatsapp"):
+        supabase.table("notificacoes_whatsapp").update({
+            "status": "enviada",
+            "enviado_em": datetime.now(timezone.utc).isoformat(),
+            "sid_mensagem": sid,
+            "erro": None,
+        }).in_("id", [n['id'] for n in notificacoes]).execute()
+
+def registrar_falha(notificacao, erro, permanente=False):
+    """Reagenda com espera exponencial; desiste depois de MAX_TENTATIVAS_NOTIFICACAO ou em erro permanente."""
+    tentativas = notificacao.get('tentativas') or 1
+    if permanente or tentativas >= MAX_TENTATIVAS_NOTIFICACAO:
+        dados = {"status": "falhou", "enviado_em": datetime.now(timezone.utc).isoformat(), "erro": str(erro)}
+        contar("notificacoes", resultado="desistida")
+    else:
+        contar("retentativas", destino="whatsapp")
+        espera = min(ESPERA_BASE_SEG * 2 ** (tentativas - 1), ESPERA_MAXIMA_SEG)
+        dados = {
+            "proxima_tentativa_em": (datetime.now(timezone.utc) + timedelta(seconds=espera)).isoformat(),
+            "reivindicado_em": None,
+            "reivindicado_por": None,
+            "erro": str(erro),
+        }
+    with medir_banco("escrita", "notificacoes_whatsapp"):
+        supabase.table("notificacoes_whatsapp").update(dados).eq("id", notificacao['id']).execute()
+
+def agrupar_mensagens(notificacoes):
+    """
+    Junta as notificações de um mesmo número em mensagens: as de atletas em modo
+    resumo (janela_resumo_min > 0) viram uma mensagem só por atleta, em ordem
+    cronológica; as demais saem uma a uma.
+    """
+    mensagens = []
+    resumos = {}
+    for notificacao in sorted(notificacoes, key=lambda n: ((n.get('dados') or {}).get('data_treino') or "", n['id'])):
+        if (notificacao.get('janela_resumo_min') or 0) > 0:
+            if notificacao.get('user_id') not in resumos:
+                resumos[notificacao.get('user_id')] = []
+                mensagens.append(resumos[notificacao.get('user_id')])
+            resumos[notificacao.get('user_id')].append(notificacao)
+        else:
+            mensagens.append([notificacao])
+    return mensagens
+
+def entregar_destino(notificacoes, cargas=None):
+    """
+    Entrega, em ordem, as mensagens de um mesmo número. Retorna quantas notificações foram enviadas.
+    `cargas` ({user_id: status_carga}) dá a carga 7d/30d atual dos resumos.
+    """
+    enviadas = 0
+    for grupo in agrupar_mensagens(notificacoes):
+        ids = [n['id'] for n in grupo]
+        try:
+            status = (cargas or {}).get(grupo[0].get('user_id')) if len(grupo) > 1 else None
+            corpo = montar_resumo_treinos([n.get('dados') or {} for n in grupo], grupo[0].get('nome'), status)
+            sid = whatsapp.enviar(grupo[0].get('telefone'), corpo)
+        except whatsapp.ErroPermanente as e:
+            log.warning(f"🚫 Notificação(ões) {ids} descartada(s): {e}")
+            for notificacao in grupo:
+                registrar_falha(notificacao, e, permanente=True)
+        except Exception as e:
+            log.warning(f"❌ Falha na(s) notificação(ões) {ids} (tentativa {grupo[0].get('tentativas')}): {e}")
+            for notificacao in grupo:
+                registrar_falha(notificacao, e)
+        else:
+            enviadas += len(grupo)
+            contar("notificacoes", len(grupo), resultado="enviada")
+            try:
+                marcar_enviadas(grupo, sid)
+            except Exception as e:
+                # Já saiu no Twilio: não reagenda; se o banco continuar fora, a reivindicação expira e pode reenviar
+                log.error(f"⚠️ Notificação(ões) {ids} enviada(s), mas não marcada(s): {e}")
+    return enviadas
+
+def processar_lote_notificacoes(lote=None, max_workers=None):
+    """
+    Reivindica um lote e entrega em paralelo pelo gateway de WhatsApp, um número por
+    thread (o mesmo atleta recebe as mensagens em ordem e respeitando o intervalo por destino).
+    Treinos de quem usa modo resumo chegam juntos (a reivindicação traz o grupo) e saem
+    numa mensagem só. Retorna quantas notificações foram reivindicadas.
+    """
+    notificacoes = reivindicar_notificacoes(lote)
+    if not notificacoes:
+        return 0
+
+    por_destino = {}
+    for notificacao in notificacoes:
+        por_destino.setdefault(whatsapp.normalizar_telefone(notificacao.get('telefone')) or "", []).append(notificacao)
+
+    # Carga 7d/30d atual de quem recebe resumo: uma consulta ao retrato do painel para o lote todo
+    em_resumo = {n.get('user_id') for n in notificacoes if (n.get('janela_resumo_min') or 0) > 0 and n.get('user_id')}
+    try:
+        cargas = status_carga_atletas(supabase, em_resumo)
+    except Exception as e:
+        log.warning(f"⚠️ Retrato do painel indisponível, resumos saem com a carga do último treino: {e}")
+        cargas = {}
+
+    with medir("lote_notificacoes"), ThreadPoolExecutor(max_workers=max_workers or whatsapp.MAX_ENVIOS_PARALELOS, thread_name_prefix="zap") as pool:
+        enviadas = sum(pool.map(partial(entregar_destino, cargas=cargas), por_destino.values()))
+
+    log.info(f"📨 Lote concluído: {enviadas}/{len(notificacoes)} notificação(ões) enviada(s).")
+    return len(notificacoes)
+
+def limpar_notificacoes_antigas(dias=None):
+    """Apaga notificações já encerradas (enviadas ou desistidas) há mais de `dias` dias."""
+    limite = datetime.now(timezone.utc) - timedelta(days=dias or RETENCAO_NOTIFICACOES_DIAS)
+    with medir_banco("escrita", "notificacoes_whatsapp"):
+        supabase.table("notificacoes_whatsapp").delete().neq("status", "pendente").lt("enviado_em", limite.isoformat()).execute()
+
+def servico_notificacoes():
+    """Loop do worker: esvazia a outbox e, de hora em hora, limpa as notificações antigas."""
+    ultima_limpeza = 0
+    while True:
+        try:
+            # Enquanto vierem lotes cheios, continua sem dormir
+            while processar_lote_notificacoes() >= LOTE_NOTIFICACOES:
+                pass
+
+            if time.time() - ultima_limpeza > 3600:
+                limpar_notificacoes_antigas()
+                ultima_limpeza = time.time()
+        except Exception as e:
+            log.exception(f"❌ Erro no worker de notificações: {e}")
+
+        time.sleep(INTERVALO_NOTIFICACOES_SEG)
+
+if __name__ == "__main__":
+    servico_notificacoes()
@@ -0,0 +1,176 @@
+import os
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+
+from auth_strava import descartar_token, obter_token_valido
+from modules.agendador_strava import requisitar_strava, tem_cota_no_dia, CotaDiariaEsgotada, PRIORIDADE_NORMAL
+from modules.eventos_strava import coalescer_eventos, registrar_aplicados
+from modules.logs import obter_logger
+from processar_fila import supabase, persistir_atividades, avancar_cursor, atualizar_painel, COLUNAS_ROSTER
+
+log = obter_logger("webhooks")
+
+# Quantos eventos cada worker reivindica por vez e de quanto em quanto tempo olha a fila
+LOTE_WEBHOOK = 50
+INTERVALO_WEBHOOK_SEG = 5
+
+# Reivindicação expira (worker caiu) e o evento volta para a fila depois disso
+EXPIRACAO_REIVINDICACAO_SEG = 300
+
+# Depois de tantas tentativas com erro o evento é encerrado (fica registrado em `erro`)
+MAX_TENTATIVAS_WEBHOOK = 5
+
+# Eventos já processados são apagados depois de alguns dias
+RETENCAO_WEBHOOK_DIAS = 7
+
+ID_TRABALHADOR = f"{socket.gethostname()}-{os.getpid()}"
+
+def reivindicar_eventos(lote=None):
+    """Pega um lote de eventos pendentes só para este worker (FOR UPDATE SKIP LOCKED no banco)."""
+    res = supabase.rpc("reivindicar_webhook_events", {
+        "p_lote": lote or LOTE_WEBHOOK,
+        "p_trabalhador": ID_TRABALHADOR,
+        "p_expiracao_seg": EXPIRACAO_REIVINDICACAO_SEG,
+    }).execute()
+    return res.data or []
+
+def marcar_processados(ids, erro=None):
+    if not ids:
+        return
+    supabase.table("webhook_events").update({
+        "processado": True,
+        "processado_em": datetime.now(timezone.utc).isoformat(),
+        "erro": erro,
+    }).in_("id", list(ids)).execute()
+
+def registrar_falha(evento, erro):
+    """Guarda o erro; se estourou as tentativas, encerra o evento para não travar a fila."""
+    if (evento.get('tentativas') or 0) >= MAX_TENTATIVAS_WEBHOOK:
+        marcar_processados([evento['id']], erro=str(erro))
+    else:
+        supabase.table("webhook_events").update({"erro": str(erro)}).eq("id", evento['id']).execute()
+
+def limpar_eventos_antigos(dias=None):
+    """Apaga eventos processados há mais de `dias` dias."""
+    limite = datetime.now(timezone.utc) - timedelta(days=dias or RETENCAO_WEBHOOK_DIAS)
+    supabase.table("webhook_events").delete().eq("processado", True).lt("processado_em", limite.isoformat()).execute()
+
+def carregar_atletas(owner_ids):
+    """Resolve os owner_id do Strava para linhas do roster (1 consulta para o lote todo)."""
+    if not owner_ids:
+        return {}
+    res = supabase.table("roster_sincronizacao").select(COLUNAS_ROSTER).in_("athlete_id", list(owner_ids)).execute()
+    return {int(u['athlete_id']): u for u in (res.data or []) if u.get('athlete_id')}
+
+def aplicar_evento(dados_evento, u):
+    """
+    Aplica um evento de atividade em atividades_fisicas:
+    - create/update: busca só a atividade afetada no Strava e grava (create novo notifica).
+    - delete: remove a linha pelo strava_id.
+    """
+    strava_id = str(dados_evento.get('object_id'))
+    acao = dados_evento.get('aspect_type')
+
+    if acao == "delete":
+        supabase.table("atividades_fisicas").delete().eq("strava_id", strava_id).execute()
+        atualizar_painel(u['user_id'])
+        log.info(f"🗑️ [WEBHOOK] Atividade {strava_id} removida.")
+        return
+
+    token = obter_token_valido(u['user_id'])
+    if not token:
+        raise RuntimeError(f"sem token válido para {u['user_id']}")
+
+    resposta = requisitar_strava("GET", f"/api/v3/activities/{strava_id}", prioridade=PRIORIDADE_NORMAL,
+                                 headers={'Authorization': f'Bearer {token}'})
+    if resposta.status_code == 404:
+        # Atividade privada/apagada antes de chegarmos nela: nada a fazer
+        log.warning(f"⚠️ [WEBHOOK] Atividade {strava_id} não está mais disponível no Strava.")
+        return
+    if resposta.status_code == 401:
+        # Token revogado (p.ex. reconexão): a próxima tentativa do evento relê o banco
+        descartar_token(u['user_id'])
+    if resposta.status_code != 200:
+        raise RuntimeError(f"Strava respondeu {resposta.status_code} para a atividade {strava_id}")
+
+    atividade = resposta.json()
+    # Sempre reprocessa: um create pode ter sido coalescido com updates, ou o vigilante
+    # pode ter gravado a atividade antes da edição. Só as novas notificam.
+    persistir_atividades([atividade], u['user_id'], u, origem_botao=True)
+    avancar_cursor(u, [atividade], via_webhook=True)
+
+def processar_lote_webhooks(lote=None):
+    """
+    Reivindica um lote, descarta reentregas, junta os eventos da mesma atividade
+    (coalescer_eventos) e aplica uma ação por atividade. Retorna quantos eventos
+    foram reivindicados. Sem cota diária do Strava nada é reivindicado: os eventos
+    esperam na fila, sem gastar tentativas.
+    """
+    if not tem_cota_no_dia(PRIORIDADE_NORMAL):
+        log.debug("⏸️ [WEBHOOK] Sem cota diária do Strava; fila mantida.")
+        return 0
+
+    eventos = reivindicar_eventos(lote)
+    if not eventos:
+        return 0
+
+    acoes, duplicados = coalescer_eventos(eventos)
+    marcar_processados(duplicados)
+
+    owners = {
+        int(acao['dados_evento']['owner_id'])
+        for acao in acoes
+        if acao['dados_evento'].get('object_type') == "activity" and acao['dados_evento'].get('owner_id')
+    }
+    atletas = carregar_atletas(owners)
+    eventos_por_id = {e['id']: e for e in eventos}
+
+    concluidos = []
+    for acao in acoes:
+        dados_evento = acao['dados_evento']
+        try:
+            if dados_evento.get('object_type') != "activity":
+                # Eventos de atleta (ex.: desautorização) só ficam registrados
+                log.debug(f"ℹ️ [WEBHOOK] Evento de {dados_evento.get('object_type')} ignorado: {dados_evento.get('updates')}")
+            else:
+                u = atletas.get(int(dados_evento.get('owner_id') or 0))
+                if not u:
+                    # Atleta sem vínculo, bloqueado ou vencido: o evento é descartado
+                    log.info(f"🚫 [WEBHOOK] Dono {dados_evento.get('owner_id')} fora do roster. Evento descartado.")
+                else:
+                    aplicar_evento(dados_evento, u)
+            concluidos.extend(acao['ids'])
+            registrar_aplicados(acao)
+        except CotaDiariaEsgotada as e:
+            # Não é falha do evento: o resto do lote volta para a fila quando a reivindicação expirar
+            log.warning(f"⏸️ [WEBHOOK] Lote interrompido: {e}")
+            break
+        except Exception as e:
+            log.error(f"❌ [WEBHOOK] Erro nos eventos {acao['ids']}: {e}")
+            for id_evento in acao['ids']:
+                registrar_falha(eventos_por_id[id_evento], e)
+
+    marcar_processados(concluidos)
+    log.info(f"📬 [WEBHOOK] Lote concluído: {len(eventos)} evento(s) -> {len(acoes)} ação(ões), {len(duplicados)} reentrega(s).")
+    return len(eventos)
+
+def servico_webhooks():
+    """Loop do worker: esvazia a fila de eventos e, de hora em hora, limpa os antigos."""
+    ultima_limpeza = 0
+    while True:
+        try:
+            # Enquanto vierem lotes cheios, continua sem dormir
+            while processar_lote_webhooks() >= LOTE_WEBHOOK:
+                pass
+
+            if time.time() - ultima_limpeza > 3600:
+                limpar_eventos_antigos()
+                ultima_limpeza = time.time()
+        except Exception as e:
+            log.exception(f"❌ Erro no worker de webhooks: {e}")
+
+        time.sleep(INTERVALO_WEBHOOK_SEG)
+
+if __name__ == "__main__":
+    servico_webhooks()
@@ -1,12 +1,8 @@
-import os
-from dotenv import load_dotenv
-from supabase import create_client
+from modules.conexao import obter_supabase
 import math
 
-load_dotenv()
-
 # Conexão
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+supabase = obter_supabase()
 
 def processar_e_salvar_treino(id_atleta, duracao, fc_media):
     # 1. Busca os dados fisiológicos do atleta no banco (Folha 1)
@@ -1,12 +1,12 @@
-import requests
 import os
+from modules.agendador_strava import requisitar_strava
 
 def buscar_detalhes_treino(id_atividade, access_token):
     """Vai até o Strava e busca os batimentos cardíacos"""
-    url = f"https://www.strava.com/api/v3/activities/{id_atividade}"
+    url = f"/api/v3/activities/{id_atividade}"
     headers = {'Authorization': f'Bearer {access_token}'}
     
-    response = requests.get(url, headers=headers)
+    response = requisitar_strava("GET", url, headers=headers)
     
     if response.status_code == 200:
         dados = response.json()
@@ -26,10 +26,11 @@ serve(async (req) => {
         Deno.env.get('SUPABASE_SERVICE_ROLE_KEY') ?? ''
       )
 
-      // Salvar na tabela 'webhook_events'
+      // Salvar na tabela 'webhook_events' (reentregas do Strava caem na chave única
+      // chave_evento e são ignoradas)
       const { error } = await supabase
         .from('webhook_events')
-        .insert({ event_data: body })
+        .upsert({ event_data: body }, { onConflict: 'chave_evento', ignoreDuplicates: true })
 
       if (error) console.error("Erro ao salvar:", error)
       else console.log("✅ Evento salvo no banco!")
@@ -0,0 +1,12 @@
+-- Chave única em atividades_fisicas.strava_id para permitir o upsert em lote
+-- (on_conflict=strava_id) usado pelo processar_fila.
+
+-- Remove duplicatas antigas, mantendo a primeira linha gravada de cada strava_id
+delete from public.atividades_fisicas a
+using public.atividades_fisicas b
+where a.strava_id is not null
+  and a.strava_id = b.strava_id
+  and a.ctid > b.ctid;
+
+create unique index if not exists atividades_fisicas_strava_id_key
+    on public.atividades_fisicas (strava_id);
@@ -0,0 +1,5 @@
+-- Cursor de sincronização por atleta: o robô só pede ao Strava o que veio
+-- depois do treino mais recente já visto (menos uma pequena sobreposição).
+alter table public.auth_strava
+    add column if not exists ultima_atividade_em timestamptz,
+    add column if not exists ultimo_sync_em timestamptz;
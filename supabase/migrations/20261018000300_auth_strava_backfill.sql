@@ -0,0 +1,10 @@
+-- Importação do histórico completo em segundo plano, com checkpoint para retomar.
+-- backfill_cursor: start_date (epoch UTC) da última atividade importada.
+-- backfill_status: 'pendente' enquanto houver histórico a importar, 'concluido' no fim.
+alter table public.auth_strava
+    add column if not exists backfill_cursor bigint not null default 0,
+    add column if not exists backfill_status text;
+
+create index if not exists auth_strava_backfill_pendente_idx
+    on public.auth_strava (backfill_status)
+    where backfill_status = 'pendente';
@@ -0,0 +1,20 @@
+-- Roster do sync numa consulta só: junta auth_strava e usuarios_app e já tira
+-- bloqueados, vencidos e administradores no banco. Traz apenas as colunas que
+-- os workers do processar_fila usam.
+create or replace view public.roster_sincronizacao
+with (security_invoker = true) as
+select
+    a.user_id,
+    a.athlete_id,
+    a.access_token,
+    a.refresh_token,
+    a.expires_at,
+    a.ultima_atividade_em,
+    u.nome,
+    u.telefone,
+    u.fc_maxima
+from public.auth_strava a
+join public.usuarios_app u on u.id = a.user_id
+where coalesce(u.bloqueado, false) = false
+  and coalesce(u.is_admin, false) = false
+  and (u.data_vencimento is null or u.data_vencimento >= current_date);
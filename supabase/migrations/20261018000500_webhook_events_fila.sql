@@ -0,0 +1,44 @@
+-- Transforma webhook_events numa fila consumida pelo processar_webhooks.py.
+alter table public.webhook_events
+    add column if not exists processado boolean not null default false,
+    add column if not exists processado_em timestamptz,
+    add column if not exists reivindicado_em timestamptz,
+    add column if not exists reivindicado_por text,
+    add column if not exists tentativas integer not null default 0,
+    add column if not exists erro text;
+
+create index if not exists webhook_events_pendentes_idx
+    on public.webhook_events (id)
+    where not processado;
+
+create index if not exists webhook_events_processados_idx
+    on public.webhook_events (processado_em)
+    where processado;
+
+-- Reivindica um lote de eventos pendentes. FOR UPDATE SKIP LOCKED deixa vários
+-- workers rodarem juntos sem pegar o mesmo evento; uma reivindicação que não foi
+-- concluída em p_expiracao_seg (worker caiu) volta a ficar disponível.
+create or replace function public.reivindicar_webhook_events(
+    p_lote integer,
+    p_trabalhador text,
+    p_expiracao_seg integer default 300
+)
+returns setof public.webhook_events
+language sql
+as $$
+    update public.webhook_events w
+       set reivindicado_em = now(),
+           reivindicado_por = p_trabalhador,
+           tentativas = w.tentativas + 1
+     where w.id in (
+         select e.id
+           from public.webhook_events e
+          where not e.processado
+            and (e.reivindicado_em is null
+                 or e.reivindicado_em < now() - make_interval(secs => p_expiracao_seg))
+          order by e.id
+          limit p_lote
+          for update skip locked
+     )
+    returning w.*;
+$$;
@@ -0,0 +1,21 @@
+-- Identidade de cada evento do Strava: reentregas repetem owner_id, objeto,
+-- ação e event_time. A chave única faz o insert da edge function / FastAPI
+-- ignorar eventos repetidos (on conflict do nothing).
+-- Mesma expressão de modules/eventos_strava.chave_evento.
+alter table public.webhook_events
+    add column if not exists chave_evento text generated always as (
+        coalesce(event_data->>'owner_id', '') || ':' ||
+        coalesce(event_data->>'object_type', '') || ':' ||
+        coalesce(event_data->>'object_id', '') || ':' ||
+        coalesce(event_data->>'aspect_type', '') || ':' ||
+        coalesce(event_data->>'event_time', '')
+    ) stored;
+
+-- Remove reentregas já gravadas antes da chave existir
+delete from public.webhook_events a
+using public.webhook_events b
+where a.chave_evento = b.chave_evento
+  and a.id > b.id;
+
+create unique index if not exists webhook_events_chave_evento_key
+    on public.webhook_events (chave_evento);
@@ -0,0 +1,34 @@
+-- Eleição de líder entre processos (réplicas do Streamlit, restarts): só quem
+-- segura o lease de um serviço roda o ciclo dele. O líder renova o lease com
+-- heartbeat; se morrer, o lease expira e outro processo assume.
+create table if not exists public.lease_servicos (
+    nome text primary key,
+    dono text not null,
+    expira_em timestamptz not null,
+    renovado_em timestamptz not null default now()
+);
+
+-- Adquire ou renova o lease. Retorna true se p_dono é (ou continua) o líder.
+create or replace function public.adquirir_lease(p_nome text, p_dono text, p_ttl_seg integer)
+returns boolean
+language plpgsql
+as $$
+begin
+    insert into public.lease_servicos as l (nome, dono, expira_em, renovado_em)
+    values (p_nome, p_dono, now() + make_interval(secs => p_ttl_seg), now())
+    on conflict (nome) do update
+        set dono = excluded.dono,
+            expira_em = excluded.expira_em,
+            renovado_em = excluded.renovado_em
+        where l.dono = p_dono or l.expira_em < now();
+    return found;
+end;
+$$;
+
+-- Solta o lease (saída limpa), para outro processo assumir sem esperar expirar.
+create or replace function public.liberar_lease(p_nome text, p_dono text)
+returns void
+language sql
+as $$
+    delete from public.lease_servicos where nome = p_nome and dono = p_dono;
+$$;
@@ -0,0 +1,31 @@
+-- Polling adaptativo: cada atleta tem o seu próximo horário de consulta ao Strava,
+-- calculado do histograma de horários de upload, dos dias sem treino e de quando
+-- um webhook cobriu o atleta pela última vez (modules/agenda_polling.py).
+alter table public.auth_strava
+    add column if not exists histograma_horas jsonb,
+    add column if not exists ultimo_webhook_em timestamptz,
+    add column if not exists proximo_poll_em timestamptz;
+
+create index if not exists auth_strava_proximo_poll_idx
+    on public.auth_strava (proximo_poll_em);
+
+create or replace view public.roster_sincronizacao
+with (security_invoker = true) as
+select
+    a.user_id,
+    a.athlete_id,
+    a.access_token,
+    a.refresh_token,
+    a.expires_at,
+    a.ultima_atividade_em,
+    u.nome,
+    u.telefone,
+    u.fc_maxima,
+    a.histograma_horas,
+    a.ultimo_webhook_em,
+    a.proximo_poll_em
+from public.auth_strava a
+join public.usuarios_app u on u.id = a.user_id
+where coalesce(u.bloqueado, false) = false
+  and coalesce(u.is_admin, false) = false
+  and (u.data_vencimento is null or u.data_vencimento >= current_date);
@@ -0,0 +1,96 @@
+-- Outbox das notificações de WhatsApp: o sync só grava a mensagem a enviar e os
+-- workers do processar_notificacoes.py entregam no Twilio.
+create table if not exists public.notificacoes_whatsapp (
+    id bigserial primary key,
+    chave_idempotencia text not null,
+    user_id uuid,
+    telefone text,
+    nome text,
+    dados jsonb not null default '{}'::jsonb,
+    status text not null default 'pendente'
+        check (status in ('pendente', 'enviada', 'falhou')),
+    tentativas integer not null default 0,
+    proxima_tentativa_em timestamptz not null default now(),
+    reivindicado_em timestamptz,
+    reivindicado_por text,
+    enviado_em timestamptz,
+    sid_mensagem text,
+    erro text,
+    criado_em timestamptz not null default now()
+);
+
+-- Uma notificação por chave (ex.: "treino:<strava_id>"): reprocessar a mesma
+-- atividade nunca gera um segundo WhatsApp.
+create unique index if not exists notificacoes_whatsapp_chave_key
+    on public.notificacoes_whatsapp (chave_idempotencia);
+
+create index if not exists notificacoes_whatsapp_pendentes_idx
+    on public.notificacoes_whatsapp (proxima_tentativa_em)
+    where status = 'pendente';
+
+create index if not exists notificacoes_whatsapp_enviadas_idx
+    on public.notificacoes_whatsapp (enviado_em)
+    where status <> 'pendente';
+
+-- Grava as atividades (upsert por strava_id) e as notificações delas na mesma
+-- transação: ou o treino entra com o aviso na fila, ou nenhum dos dois.
+create or replace function public.gravar_atividades_com_notificacoes(
+    p_atividades jsonb,
+    p_notificacoes jsonb default '[]'::jsonb
+)
+returns void
+language plpgsql
+as $$
+begin
+    insert into public.atividades_fisicas (
+        id_atleta, strava_id, data_treino, distancia, duracao, name,
+        trimp_score, trimp_semanal, trimp_mensal, notificacao
+    )
+    select id_atleta, strava_id, data_treino, distancia, duracao, name,
+           trimp_score, trimp_semanal, trimp_mensal, notificacao
+      from jsonb_populate_recordset(null::public.atividades_fisicas, p_atividades)
+    on conflict (strava_id) do update
+       set id_atleta = excluded.id_atleta,
+           data_treino = excluded.data_treino,
+           distancia = excluded.distancia,
+           duracao = excluded.duracao,
+           name = excluded.name,
+           trimp_score = excluded.trimp_score,
+           trimp_semanal = excluded.trimp_semanal,
+           trimp_mensal = excluded.trimp_mensal,
+           notificacao = excluded.notificacao;
+
+    insert into public.notificacoes_whatsapp (chave_idempotencia, user_id, telefone, nome, dados)
+    select chave_idempotencia, user_id, telefone, nome, dados
+      from jsonb_populate_recordset(null::public.notificacoes_whatsapp, p_notificacoes)
+    on conflict (chave_idempotencia) do nothing;
+end;
+$$;
+
+-- Reivindica um lote de notificações prontas para envio (mesmo esquema da fila
+-- de webhooks: FOR UPDATE SKIP LOCKED e reivindicação que expira se o worker cair).
+create or replace function public.reivindicar_notificacoes(
+    p_lote integer,
+    p_trabalhador text,
+    p_expiracao_seg integer default 300
+)
+returns setof public.notificacoes_whatsapp
+language sql
+as $$
+    update public.notificacoes_whatsapp n
+       set reivindicado_em = now(),
+           reivindicado_por = p_trabalhador,
+           tentativas = n.tentativas + 1
+     where n.id in (
+         select o.id
+           from public.notificacoes_whatsapp o
+          where o.status = 'pendente'
+            and o.proxima_tentativa_em <= now()
+            and (o.reivindicado_em is null
+                 or o.reivindicado_em < now() - make_interval(secs => p_expiracao_seg))
+          order by o.proxima_tentativa_em, o.id
+          limit p_lote
+          for update skip locked
+     )
+    returning n.*;
+$$;
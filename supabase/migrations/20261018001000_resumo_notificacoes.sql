@@ -0,0 +1,112 @@
+-- Modo resumo: com janela_resumo_min > 0 os treinos novos do atleta esperam a
+-- janela na outbox e saem juntos num WhatsApp só (processar_notificacoes.py).
+alter table public.usuarios_app
+    add column if not exists janela_resumo_min integer not null default 0
+        check (janela_resumo_min >= 0);
+
+alter table public.notificacoes_whatsapp
+    add column if not exists janela_resumo_min integer not null default 0;
+
+create index if not exists notificacoes_whatsapp_resumo_idx
+    on public.notificacoes_whatsapp (user_id)
+    where status = 'pendente' and janela_resumo_min > 0;
+
+create or replace view public.roster_sincronizacao
+with (security_invoker = true) as
+select
+    a.user_id,
+    a.athlete_id,
+    a.access_token,
+    a.refresh_token,
+    a.expires_at,
+    a.ultima_atividade_em,
+    u.nome,
+    u.telefone,
+    u.fc_maxima,
+    a.histograma_horas,
+    a.ultimo_webhook_em,
+    a.proximo_poll_em,
+    u.janela_resumo_min
+from public.auth_strava a
+join public.usuarios_app u on u.id = a.user_id
+where coalesce(u.bloqueado, false) = false
+  and coalesce(u.is_admin, false) = false
+  and (u.data_vencimento is null or u.data_vencimento >= current_date);
+
+-- A notificação de quem usa resumo só fica pronta no fim da janela.
+create or replace function public.gravar_atividades_com_notificacoes(
+    p_atividades jsonb,
+    p_notificacoes jsonb default '[]'::jsonb
+)
+returns void
+language plpgsql
+as $$
+begin
+    insert into public.atividades_fisicas (
+        id_atleta, strava_id, data_treino, distancia, duracao, name,
+        trimp_score, trimp_semanal, trimp_mensal, notificacao
+    )
+    select id_atleta, strava_id, data_treino, distancia, duracao, name,
+           trimp_score, trimp_semanal, trimp_mensal, notificacao
+      from jsonb_populate_recordset(null::public.atividades_fisicas, p_atividades)
+    on conflict (strava_id) do update
+       set id_atleta = excluded.id_atleta,
+           data_treino = excluded.data_treino,
+           distancia = excluded.distancia,
+           duracao = excluded.duracao,
+           name = excluded.name,
+           trimp_score = excluded.trimp_score,
+           trimp_semanal = excluded.trimp_semanal,
+           trimp_mensal = excluded.trimp_mensal,
+           notificacao = excluded.notificacao;
+
+    insert into public.notificacoes_whatsapp (
+        chave_idempotencia, user_id, telefone, nome, dados, janela_resumo_min, proxima_tentativa_em
+    )
+    select chave_idempotencia, user_id, telefone, nome, dados,
+           coalesce(janela_resumo_min, 0),
+           now() + make_interval(mins => coalesce(janela_resumo_min, 0))
+      from jsonb_populate_recordset(null::public.notificacoes_whatsapp, p_notificacoes)
+    on conflict (chave_idempotencia) do nothing;
+end;
+$$;
+
+-- Ao reivindicar uma notificação de resumo, leva junto as outras pendentes do
+-- mesmo atleta (mesmo que a janela delas ainda não tenha fechado): todas viram
+-- uma mensagem só.
+create or replace function public.reivindicar_notificacoes(
+    p_lote integer,
+    p_trabalhador text,
+    p_expiracao_seg integer default 300
+)
+returns setof public.notificacoes_whatsapp
+language sql
+as $$
+    with prontas as (
+        select o.id, o.user_id, o.janela_resumo_min
+          from public.notificacoes_whatsapp o
+         where o.status = 'pendente'
+           and o.proxima_tentativa_em <= now()
+           and (o.reivindicado_em is null
+                or o.reivindicado_em < now() - make_interval(secs => p_expiracao_seg))
+         order by o.proxima_tentativa_em, o.id
+         limit p_lote
+         for update skip locked
+    ),
+    mesmo_resumo as (
+        select o.id
+          from public.notificacoes_whatsapp o
+         where o.status = 'pendente'
+           and o.janela_resumo_min > 0
+           and o.user_id in (select p.user_id from prontas p where p.janela_resumo_min > 0)
+           and (o.reivindicado_em is null
+                or o.reivindicado_em < now() - make_interval(secs => p_expiracao_seg))
+         for update skip locked
+    )
+    update public.notificacoes_whatsapp n
+       set reivindicado_em = now(),
+           reivindicado_por = p_trabalhador,
+           tentativas = n.tentativas + 1
+     where n.id in (select id from prontas union select id from mesmo_resumo)
+    returning n.*;
+$$;
@@ -0,0 +1,32 @@
+-- Histórico do painel paginado no servidor (modules/painel.pagina_treinos):
+-- keyset em (data_treino, id) por atleta, filtro de período e busca no nome.
+create index if not exists atividades_fisicas_atleta_data_id_idx
+    on public.atividades_fisicas (id_atleta, data_treino desc, id desc);
+
+-- ilike '%termo%' não usa btree; o índice trigram atende a busca por trecho do nome
+create extension if not exists pg_trgm with schema extensions;
+
+create index if not exists atividades_fisicas_nome_trgm_idx
+    on public.atividades_fisicas using gin (name extensions.gin_trgm_ops);
+
+-- Totais do painel calculados no banco: exatos mesmo com o histórico maior que o
+-- max_rows do PostgREST. Os filtros são os mesmos do histórico paginado.
+create or replace function public.resumo_treinos_atleta(
+    p_id_atleta uuid,
+    p_desde date default null,
+    p_ate date default null,
+    p_busca text default null
+)
+returns table (total_treinos bigint, km_total numeric, trimp_medio numeric)
+language sql
+stable
+as $$
+    select count(*),
+           coalesce(sum(a.distancia), 0)::numeric,
+           coalesce(avg(a.trimp_score), 0)::numeric
+      from public.atividades_fisicas a
+     where a.id_atleta = p_id_atleta
+       and (p_desde is null or a.data_treino >= p_desde)
+       and (p_ate is null or a.data_treino <= p_ate)
+       and (p_busca is null or a.name ilike '%' || p_busca || '%');
+$$;
@@ -0,0 +1,19 @@
+-- Retrato do painel de cada atleta, regravado por quem escreve em atividades_fisicas
+-- (sync, webhooks, importação de histórico) logo depois da escrita
+-- (modules/painel.atualizar_snapshot_painel). A tela do aluno e as notificações leem
+-- uma linha daqui em vez de recalcular a partir dos treinos.
+create table if not exists public.painel_atleta (
+    id_atleta uuid primary key,
+    atualizado_em timestamptz not null default now(),
+    total_treinos integer not null default 0,
+    km_total numeric not null default 0,
+    trimp_medio numeric not null default 0,
+    -- Carga 7d/30d atual (JanelaCarga sobre os últimos 30 dias, no dia em que o retrato
+    -- foi gravado: data_referencia), com o semáforo de cada uma
+    status_carga jsonb,
+    -- Primeira página do histórico já rotulada e o cursor (data_treino, id) da próxima
+    ultimos jsonb not null default '[]'::jsonb,
+    cursor_ultimos jsonb,
+    -- Treinos dos últimos 30 dias (data_treino, distancia, trimp_score) para os gráficos
+    serie_30d jsonb not null default '[]'::jsonb
+);
@@ -0,0 +1,42 @@
+-- Importação de histórico reivindicada no banco: só um processo importa cada atleta.
+-- Quem reivindica renova backfill_reivindicado_em depois de cada página (heartbeat);
+-- se o processo cair, a reivindicação expira e outro retoma do backfill_cursor.
+alter table public.auth_strava
+    add column if not exists backfill_reivindicado_em timestamptz,
+    add column if not exists backfill_reivindicado_por text;
+
+-- Reivindica (ou renova, se já é o dono) a importação do atleta. Retorna true se
+-- p_trabalhador pode importar; false se outro processo tem uma reivindicação viva
+-- ou se o histórico já foi concluído.
+create or replace function public.reivindicar_backfill(
+    p_user_id uuid,
+    p_trabalhador text,
+    p_expiracao_seg integer default 300
+)
+returns boolean
+language plpgsql
+as $$
+begin
+    update public.auth_strava a
+       set backfill_reivindicado_em = now(),
+           backfill_reivindicado_por = p_trabalhador
+     where a.user_id = p_user_id
+       and a.backfill_status is distinct from 'concluido'
+       and (a.backfill_reivindicado_por = p_trabalhador
+            or a.backfill_reivindicado_em is null
+            or a.backfill_reivindicado_em < now() - make_interval(secs => p_expiracao_seg));
+    return found;
+end;
+$$;
+
+-- Solta a reivindicação (fim ou erro da importação), para outro processo não esperar expirar.
+create or replace function public.liberar_backfill(p_user_id uuid, p_trabalhador text)
+returns void
+language sql
+as $$
+    update public.auth_strava
+       set backfill_reivindicado_em = null,
+           backfill_reivindicado_por = null
+     where user_id = p_user_id
+       and backfill_reivindicado_por = p_trabalhador;
+$$;
@@ -0,0 +1,7 @@
+-- O histórico paginado ordena por data_treino desc nulls last (treinos sem data no
+-- fim, com keyset só por id). O índice precisa da mesma ordem de nulos para atender
+-- o order by sem sort.
+drop index if exists public.atividades_fisicas_atleta_data_id_idx;
+
+create index if not exists atividades_fisicas_atleta_data_id_idx
+    on public.atividades_fisicas (id_atleta, data_treino desc nulls last, id desc);